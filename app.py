@@ -3,14 +3,17 @@ Flask Migration of NexNote - Personal AI Study Assistant
 Main application file with routes and configuration
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from flask_session import Session
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, session, redirect, url_for, g, send_file
 from werkzeug.utils import secure_filename
 import os
 import json
 from datetime import datetime, timedelta
 from pathlib import Path
 import hashlib
+import hmac
+import threading
+import time
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # Import custom modules
@@ -19,14 +22,25 @@ from utils.pinecone_handler import (
     search_knowledge_base, get_uploaded_files, clear_knowledge_base
 )
 from utils.ollama_handler import get_nexnote_response
+from utils.llm_scheduler import get_scheduler
+from utils.request_coalescer import coalescer
+from utils.ollama_client import start_warm_up, get_timing_stats
+from utils.prompt_builder import get_prompt_stats
+from utils.conversation_memory import prepare_history, maybe_compact
 from utils.chat_history import (
-    save_chat_history, load_chat_history, get_all_chats,
-    delete_chat, generate_chat_title
+    append_chat_messages, load_chat_history, get_all_chats, get_conversation,
+    get_chats_page, get_chat_list_version, get_chat_changes, search_chats,
+    delete_chat, generate_chat_title, new_chat_id, get_chat_archive, run_archive_job, start_archive_job
 )
+from utils.session_store import init_session
+from utils.intent_router import classify_intent, SCHEDULING_INTENTS
+from utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUESTS, HTTP_SECONDS, render_metrics, stage_timer
+from utils.tracing import get_tracer, clean_request_id, new_request_id, set_attributes
+from utils.profiling import get_profiler
 
 # Import optional modules
 try:
-    from utils.calendar_manager import CalendarManager, parse_schedule_request, format_event_display, CALENDAR_AVAILABLE
+    from utils.calendar_manager import get_calendar_manager, parse_schedule_request, format_event_display, CALENDAR_AVAILABLE
     calendar_enabled_import = True
 except ImportError:
     calendar_enabled_import = False
@@ -35,7 +49,8 @@ except ImportError:
 try:
     from utils.study_assistant import (
         generate_summary, generate_quiz, extract_key_concepts,
-        generate_flashcards, mark_notes_studied, get_study_progress
+        generate_flashcards, mark_notes_studied, get_study_progress, get_study_sessions,
+        save_flashcards, get_due_flashcards, review_flashcard, get_flashcard_decks
     )
     study_features_available = True
 except ImportError:
@@ -48,20 +63,8 @@ voice_assistant_available = False
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
-# Flask app configuration
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here-change-in-production')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_FILE_DIR'] = './.flask_session/'
-Session(app)
-
-# Create necessary directories
-Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
-Path('./.flask_session/').mkdir(exist_ok=True)
-Path('chat_history').mkdir(exist_ok=True)
-Path('study_progress').mkdir(exist_ok=True)
+# Routes, request hooks and error handlers; create_app() registers them on each app
+main = Blueprint('main', __name__)
 
 # Configuration from environment
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "")
@@ -70,13 +73,69 @@ CHAT_MODEL = os.getenv("CHAT_MODEL", "deepseek-r1:1.5b")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
 calendar_enabled = os.getenv("ENABLE_CALENDAR", "false").lower() == "true" and calendar_enabled_import and CALENDAR_AVAILABLE
 
-# Debug: Print configuration status
-print(f"🔍 Configuration loaded:")
-print(f"   Pinecone API Key: {'✅ Found' if PINECONE_API_KEY else '❌ Not found'}")
-print(f"   Pinecone Index: {PINECONE_INDEX_NAME}")
-print(f"   Chat Model: {CHAT_MODEL}")
-print(f"   .env file path: {os.path.join(basedir, '.env')}")
-print(f"   .env file exists: {os.path.exists(os.path.join(basedir, '.env'))}")
+# Per-request span traces (TRACE_FILE exports them) and the admin-armed profiler
+tracer = get_tracer()
+profiler = get_profiler()
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Process that has run worker start-up (under gunicorn, one per worker)
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def start_worker(app: Flask, session_backend: str):
+    """Create directories, print the configuration and start background work, once per process"""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+
+        # Create necessary directories
+        Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
+        Path('chat_history').mkdir(exist_ok=True)
+        Path('study_progress').mkdir(exist_ok=True)
+
+        # Debug: Print configuration status
+        print(f"🔍 Configuration loaded (pid {os.getpid()}):")
+        print(f"   Pinecone API Key: {'✅ Found' if PINECONE_API_KEY else '❌ Not found'}")
+        print(f"   Pinecone Index: {PINECONE_INDEX_NAME}")
+        print(f"   Chat Model: {CHAT_MODEL}")
+        print(f"   Session backend: {session_backend}")
+        print(f"   .env file path: {os.path.join(basedir, '.env')}")
+        print(f"   .env file exists: {os.path.exists(os.path.join(basedir, '.env'))}")
+
+        # Preload the chat and embedding models so the first request doesn't pay the load time
+        start_warm_up([CHAT_MODEL], [EMBEDDING_MODEL])
+
+        # Move chats untouched for CHAT_ARCHIVE_DAYS into compressed archive segments
+        start_archive_job()
+
+        _worker_pid = os.getpid()
+
+def create_app(config: Optional[Dict] = None) -> Flask:
+    """Build a configured app with its session backend and routes
+
+    Used by `flask run`, `python app.py` and WSGI servers (`gunicorn -c gunicorn.conf.py`,
+    `waitress-serve --call app:create_app`). Background work starts with the first app
+    built in each process.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here-change-in-production')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['SESSION_FILE_DIR'] = './.flask_session/'
+    if config:
+        app.config.update(config)
+    Path(app.config['SESSION_FILE_DIR']).mkdir(exist_ok=True)
+
+    # The session only holds small values (current chat ID, calendar flag);
+    # conversations live in the chat store
+    session_backend = init_session(app)
+
+    app.register_blueprint(main)
+    start_worker(app, session_backend)
+    return app
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx', 'md'}
@@ -85,7 +144,7 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Make variables available to all templates
-@app.context_processor
+@main.app_context_processor
 def inject_globals():
     """Inject global variables into all templates"""
     return {
@@ -98,18 +157,43 @@ def inject_globals():
         'index_name': PINECONE_INDEX_NAME
     }
 
+@main.before_app_request
+def begin_request():
+    """Assign the request ID, open its root span and profile it if a capture is armed"""
+    g.request_started = time.perf_counter()
+    g.request_id = clean_request_id(request.headers.get('X-Request-ID')) or new_request_id()
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.trace_root = tracer.start_trace(f"{request.method} {route}", g.request_id,
+                                      **{'http.method': request.method, 'http.route': route})
+    if not request.path.startswith(('/api/admin/', '/metrics', '/static/')):
+        g.profile_handle = profiler.start_request(g.request_id)
+
+@main.after_app_request
+def record_request_metrics(response):
+    """Count every request and time it by route (the URL rule, so IDs don't create new series)"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_SECONDS.labels(route).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    set_attributes(**{'http.status_code': response.status_code})
+    if g.get('request_id'):
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@main.teardown_app_request
+def end_request(error=None):
+    profiler.finish_request(g.pop('profile_handle', None))
+    tracer.finish_trace(g.pop('trace_root', None), error)
+
 # ==================== ROUTES ====================
 
-@app.route('/')
+@main.route('/')
 def index():
     """Main landing page"""
     # Initialize session variables
-    if 'messages' not in session:
-        session['messages'] = []
     if 'current_chat_id' not in session:
         session['current_chat_id'] = None
-    if 'chat_title' not in session:
-        session['chat_title'] = "New Chat"
     if 'calendar_authenticated' not in session:
         session['calendar_authenticated'] = False
     
@@ -121,39 +205,40 @@ def index():
                          embedding_model=EMBEDDING_MODEL,
                          index_name=PINECONE_INDEX_NAME)
 
-@app.route('/chat')
+@main.route('/chat')
 def chat():
     """Chat interface"""
+    conversation = get_conversation(session.get('current_chat_id'))
     return render_template('chat.html',
-                         chat_title=session.get('chat_title', 'New Chat'),
-                         messages=session.get('messages', []))
+                         chat_title=conversation['title'] if conversation else 'New Chat',
+                         messages=conversation['messages'] if conversation else [])
 
-@app.route('/study-tools')
+@main.route('/study-tools')
 def study_tools():
     """Study tools interface"""
     if not study_features_available:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     uploaded_files = get_uploaded_files(PINECONE_API_KEY, PINECONE_INDEX_NAME) if PINECONE_API_KEY else {}
     
     return render_template('study_tools.html', 
                          uploaded_files=uploaded_files)
 
-@app.route('/calendar')
+@main.route('/calendar')
 def calendar_view():
     """Calendar interface"""
     if not calendar_enabled:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     return render_template('calendar.html',
                          authenticated=session.get('calendar_authenticated', False))
 
 # Voice chat feature disabled
-# @app.route('/voice-chat')
+# @main.route('/voice-chat')
 # def voice_chat():
 #     """Voice chat interface"""
 #     if not voice_assistant_available:
-#         return redirect(url_for('index'))
+#         return redirect(url_for('main.index'))
 #     
 #     return render_template('voice_chat.html',
 #                          chat_title=session.get('chat_title', 'Voice Assistant'),
@@ -161,7 +246,7 @@ def calendar_view():
 
 # ==================== API ROUTES ====================
 
-@app.route('/api/send_message', methods=['POST'])
+@main.route('/api/send_message', methods=['POST'])
 def send_message():
     """Process chat messages"""
     data = request.get_json()
@@ -172,21 +257,27 @@ def send_message():
     
     # Initialize chat ID if needed
     if not session.get('current_chat_id'):
-        session['current_chat_id'] = datetime.now().strftime("%Y%m%d_%H%M%S")
+        session['current_chat_id'] = new_chat_id()
+    chat_id = session['current_chat_id']
+    set_attributes(**{'chat.id': chat_id})
+    
+    # Conversation comes from the chat store (hot chats are cached in memory)
+    with stage_timer('chat', 'load_history'):
+        conversation = get_conversation(chat_id)
+    messages = conversation['messages'] if conversation else []
     
     # Generate title from first message
-    if not session.get('messages'):
-        session['chat_title'] = generate_chat_title(user_message)
+    chat_title = conversation['title'] if conversation and messages else generate_chat_title(user_message)
     
-    # Check for calendar request
-    schedule_keywords = ['schedule', 'remind', 'add event', 'create event', 'set reminder', 'add to calendar']
-    is_schedule_request = any(keyword in user_message.lower() for keyword in schedule_keywords)
+    # Check for calendar request (one precompiled regex pass; dates are only parsed for scheduling intents)
+    with stage_timer('chat', 'intent'):
+        is_schedule_request = classify_intent(user_message) in SCHEDULING_INTENTS
     
     if is_schedule_request and calendar_enabled and session.get('calendar_authenticated'):
         # Handle calendar request
         parsed = parse_schedule_request(user_message)
         if parsed and parsed['datetime']:
-            cal_mgr = CalendarManager()
+            cal_mgr = get_calendar_manager()
             event = cal_mgr.create_event(
                 title=parsed['title'],
                 start_time=parsed['datetime'],
@@ -210,17 +301,19 @@ def send_message():
         if PINECONE_API_KEY:
             context = search_knowledge_base(user_message, PINECONE_API_KEY, PINECONE_INDEX_NAME, top_k=3)
         
-        # Get conversation history for context (exclude system messages, only user/assistant)
-        conversation_history = []
-        if 'messages' in session:
-            # Convert stored messages to proper format for LLM
-            conversation_history = [
-                {'role': msg['role'], 'content': msg['content']} 
-                for msg in session['messages']
-            ]
+        # Older turns are folded into a running memo; only the turns it doesn't cover are sent
+        with stage_timer('chat', 'memo'):
+            memo_text, recent_messages = prepare_history(chat_id, messages)
+        
+        # Convert stored messages to proper format for LLM
+        conversation_history = [
+            {'role': msg['role'], 'content': msg['content']} 
+            for msg in recent_messages
+        ]
         
         # Get response from Ollama with conversation history
-        response = get_nexnote_response(user_message, context, CHAT_MODEL, conversation_history)
+        response = get_nexnote_response(user_message, context, CHAT_MODEL, conversation_history,
+                                        memo=memo_text, chat_id=chat_id)
         
         # Format sources
         sources = []
@@ -232,29 +325,24 @@ def send_message():
                     'text': match.get('metadata', {}).get('text', '')[:200]
                 })
     
-    # Add to chat history
-    if 'messages' not in session:
-        session['messages'] = []
+    # Add to chat history (only the new exchange is written)
+    new_messages = [
+        {'role': 'user', 'content': user_message},
+        {'role': 'assistant', 'content': response}
+    ]
+    with stage_timer('chat', 'store'):
+        append_chat_messages(chat_id, new_messages, chat_title)
     
-    session['messages'].append({'role': 'user', 'content': user_message})
-    session['messages'].append({'role': 'assistant', 'content': response})
-    session.modified = True
-    
-    # Auto-save chat
-    if session.get('current_chat_id'):
-        save_chat_history(
-            session['current_chat_id'],
-            session['messages'],
-            session.get('chat_title', 'New Chat')
-        )
+    # Summarize older turns in the background once history goes over budget
+    maybe_compact(chat_id, messages + new_messages, CHAT_MODEL)
     
     return jsonify({
         'response': response,
         'sources': sources if not is_schedule_request else [],
-        'chat_title': session.get('chat_title')
+        'chat_title': chat_title
     })
 
-@app.route('/api/upload_files', methods=['POST'])
+@main.route('/api/upload_files', methods=['POST'])
 def upload_files():
     """Handle file uploads"""
     if 'files[]' not in request.files:
@@ -267,7 +355,7 @@ def upload_files():
     for file in files:
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
             uploaded_count += 1
             uploaded_filenames.append(filename)
@@ -276,7 +364,7 @@ def upload_files():
     if PINECONE_API_KEY and uploaded_count > 0:
         file_objects = []
         for filename in uploaded_filenames:
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
             if not os.path.exists(filepath):
                 continue
                 
@@ -306,7 +394,7 @@ def upload_files():
         'uploaded_count': uploaded_count
     })
 
-@app.route('/api/get_uploaded_files', methods=['GET'])
+@main.route('/api/get_uploaded_files', methods=['GET'])
 def api_get_uploaded_files():
     """Get list of uploaded files"""
     if not PINECONE_API_KEY:
@@ -315,34 +403,22 @@ def api_get_uploaded_files():
     files = get_uploaded_files(PINECONE_API_KEY, PINECONE_INDEX_NAME)
     return jsonify({'files': files})
 
-@app.route('/api/new_chat', methods=['POST'])
+@main.route('/api/new_chat', methods=['POST'])
 def new_chat():
     """Start a new chat"""
-    # Save current chat if exists
-    if session.get('current_chat_id') and session.get('messages'):
-        save_chat_history(
-            session['current_chat_id'],
-            session['messages'],
-            session.get('chat_title', 'New Chat')
-        )
-    
-    # Reset session
-    session['current_chat_id'] = datetime.now().strftime("%Y%m%d_%H%M%S")
-    session['messages'] = []
-    session['chat_title'] = "New Chat"
+    # The current chat is already saved turn by turn; just switch to a new ID
+    session['current_chat_id'] = new_chat_id()
     session.modified = True
     
     return jsonify({'success': True})
 
-@app.route('/api/load_chat/<chat_id>', methods=['GET'])
+@main.route('/api/load_chat/<chat_id>', methods=['GET'])
 def load_chat(chat_id):
-    """Load a specific chat"""
-    chat_data = load_chat_history(chat_id)
+    """Load a specific chat (?last=N loads only the most recent N messages)"""
+    chat_data = load_chat_history(chat_id, request.args.get('last', type=int))
     
     if chat_data:
         session['current_chat_id'] = chat_id
-        session['messages'] = chat_data['messages']
-        session['chat_title'] = chat_data['title']
         session.modified = True
         
         return jsonify({
@@ -353,19 +429,67 @@ def load_chat(chat_id):
     
     return jsonify({'error': 'Chat not found'}), 404
 
-@app.route('/api/get_chats', methods=['GET'])
+@main.route('/api/get_chats', methods=['GET'])
 def get_chats():
-    """Get all chat histories"""
-    chats = get_all_chats()
-    return jsonify({'chats': chats})
+    """Get chat histories: one page (?limit&cursor), changes (?since) or all of them"""
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    since = request.args.get('since', type=int)
+    
+    # Listings are tagged with the store's version counter, so a refresh with
+    # nothing changed is answered 304 before the store is queried
+    version = get_chat_list_version()
+    etag = None
+    if version is not None:
+        etag = f"chats-{version}-{hashlib.md5(request.query_string).hexdigest()[:8]}"
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+    
+    changes = get_chat_changes(since) if since is not None else None
+    if changes is not None:
+        data = {'version': version, 'changed': changes['changed'], 'deleted': changes['deleted']}
+    elif limit:
+        try:
+            data = get_chats_page(min(max(limit, 1), 200), cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        data['version'] = version
+    else:
+        # Unsupported delta (or no paging requested): full list
+        data = {'chats': get_all_chats(), 'version': version, 'full': since is not None}
+    
+    response = jsonify(data)
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-@app.route('/api/delete_chat/<chat_id>', methods=['DELETE'])
+@main.route('/api/search_chats', methods=['GET'])
+def api_search_chats():
+    """Search chat histories by message content"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No search query provided'}), 400
+    
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    start = time.perf_counter()
+    results = search_chats(query, limit)
+    
+    return jsonify({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
+
+@main.route('/api/delete_chat/<chat_id>', methods=['DELETE'])
 def api_delete_chat(chat_id):
     """Delete a chat"""
     success = delete_chat(chat_id)
     return jsonify({'success': success})
 
-@app.route('/api/clear_knowledge_base', methods=['POST'])
+@main.route('/api/clear_knowledge_base', methods=['POST'])
 def api_clear_knowledge_base():
     """Clear all knowledge base and uploaded files"""
     if not PINECONE_API_KEY:
@@ -376,7 +500,7 @@ def api_clear_knowledge_base():
     
     # Delete all uploaded files from uploads folder
     if success:
-        upload_folder = app.config['UPLOAD_FOLDER']
+        upload_folder = current_app.config['UPLOAD_FOLDER']
         for filename in os.listdir(upload_folder):
             if filename != '.gitkeep':  # Keep the .gitkeep file
                 filepath = os.path.join(upload_folder, filename)
@@ -388,9 +512,115 @@ def api_clear_knowledge_base():
     
     return jsonify({'success': success})
 
+@main.route('/api/llm/stats', methods=['GET'])
+def api_llm_stats():
+    """Get LLM queue wait times, coalescing counters, model timings and prompt sizes"""
+    return jsonify({
+        'scheduler': get_scheduler().get_stats(),
+        'coalescing': coalescer.get_stats(),
+        'ollama': get_timing_stats(),
+        'prompts': get_prompt_stats()
+    })
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: stage latencies, LLM tokens and timing, cache hits and queue depths"""
+    # Open for local scraping; once ADMIN_TOKEN is set, scrapers send it like the admin endpoints
+    if ADMIN_TOKEN:
+        admin_error = _admin_error()
+        if admin_error:
+            return admin_error
+    
+    return current_app.response_class(render_metrics(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+@main.route('/api/chat_archive', methods=['GET'])
+def api_chat_archive():
+    """Get archive size and compression"""
+    return jsonify(get_chat_archive().get_stats())
+
+# ==================== ADMIN API ====================
+
+def _admin_error():
+    """Check the admin token; returns an error response or None"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.'}), 403
+    
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not supplied and request.headers.get('Authorization', '').startswith('Bearer '):
+        supplied = request.headers['Authorization'][len('Bearer '):]
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Invalid admin token'}), 401
+    return None
+
+@main.route('/api/admin/chat_archive', methods=['POST'])
+def api_admin_chat_archive():
+    """Run the chat archival job now"""
+    admin_error = _admin_error()
+    if admin_error:
+        return admin_error
+    
+    result = run_archive_job()
+    return jsonify({'success': True, **result, 'archive': get_chat_archive().get_stats()})
+
+@main.route('/api/admin/traces', methods=['GET'])
+def api_admin_traces():
+    """Get recent request traces, slowest first (?min_ms=&limit=)"""
+    admin_error = _admin_error()
+    if admin_error:
+        return admin_error
+    
+    min_ms = request.args.get('min_ms', 0.0, type=float)
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    return jsonify({'traces': tracer.recent(min_ms, limit)})
+
+@main.route('/api/admin/traces/<request_id>', methods=['GET'])
+def api_admin_trace(request_id):
+    """Get one recent trace by its request ID (the X-Request-ID response header)"""
+    admin_error = _admin_error()
+    if admin_error:
+        return admin_error
+    
+    trace = tracer.find(request_id)
+    if trace is None:
+        return jsonify({'error': 'Trace not found (only recent requests are kept)'}), 404
+    return jsonify(trace)
+
+@main.route('/api/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def api_admin_profile():
+    """Arm a cProfile/tracemalloc capture of the next N requests (POST), check it (GET) or cancel it (DELETE)"""
+    admin_error = _admin_error()
+    if admin_error:
+        return admin_error
+    
+    if request.method == 'DELETE':
+        return jsonify(profiler.cancel())
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            status = profiler.arm(data.get('mode', 'cprofile'), int(data.get('requests', 10)),
+                                  int(data.get('top', 40)))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(status)
+    return jsonify(profiler.get_status())
+
+@main.route('/api/admin/profile/<result_id>', methods=['GET'])
+def api_admin_profile_result(result_id):
+    """Get a finished capture's report, or its raw file with ?download=1"""
+    admin_error = _admin_error()
+    if admin_error:
+        return admin_error
+    
+    result = profiler.get_result(result_id)
+    if result is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('download'):
+        return send_file(os.path.abspath(result['file']), as_attachment=True, download_name=result['id'])
+    return jsonify(result)
+
 # ==================== STUDY TOOLS API ====================
 
-@app.route('/api/generate_summary', methods=['POST'])
+@main.route('/api/generate_summary', methods=['POST'])
 def api_generate_summary():
     """Generate summary for a file"""
     if not study_features_available:
@@ -409,7 +639,7 @@ def api_generate_summary():
     
     return jsonify({'error': 'File not found'}), 404
 
-@app.route('/api/generate_quiz', methods=['POST'])
+@main.route('/api/generate_quiz', methods=['POST'])
 def api_generate_quiz():
     """Generate quiz for a file"""
     if not study_features_available:
@@ -428,7 +658,7 @@ def api_generate_quiz():
     
     return jsonify({'error': 'File not found'}), 404
 
-@app.route('/api/submit_quiz', methods=['POST'])
+@main.route('/api/submit_quiz', methods=['POST'])
 def api_submit_quiz():
     """Submit quiz answers and get score"""
     if not study_features_available:
@@ -455,7 +685,7 @@ def api_submit_quiz():
         'score': score
     })
 
-@app.route('/api/extract_concepts', methods=['POST'])
+@main.route('/api/extract_concepts', methods=['POST'])
 def api_extract_concepts():
     """Extract key concepts from a file"""
     if not study_features_available:
@@ -473,7 +703,7 @@ def api_extract_concepts():
     
     return jsonify({'error': 'File not found'}), 404
 
-@app.route('/api/generate_flashcards', methods=['POST'])
+@main.route('/api/generate_flashcards', methods=['POST'])
 def api_generate_flashcards():
     """Generate flashcards for a file"""
     if not study_features_available:
@@ -488,22 +718,64 @@ def api_generate_flashcards():
     
     if file_text:
         flashcards = generate_flashcards(file_text, num_cards, CHAT_MODEL)
-        return jsonify({'flashcards': flashcards})
+        # Keep the cards in the file's deck so later reviews need no LLM call
+        deck = save_flashcards(filename, flashcards)
+        return jsonify({'flashcards': flashcards, 'deck': deck})
     
     return jsonify({'error': 'File not found'}), 404
 
-@app.route('/api/get_study_progress', methods=['GET'])
+@main.route('/api/flashcards/decks', methods=['GET'])
+def api_flashcard_decks():
+    """Get flashcard decks with card and due counts"""
+    if not study_features_available:
+        return jsonify({'error': 'Study features not available'}), 400
+    
+    return jsonify({'decks': get_flashcard_decks()})
+
+@main.route('/api/flashcards/due', methods=['GET'])
+def api_due_flashcards():
+    """Get flashcards due for review (optionally from one deck)"""
+    if not study_features_available:
+        return jsonify({'error': 'Study features not available'}), 400
+    
+    deck = request.args.get('deck')
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    return jsonify({'cards': get_due_flashcards(deck, limit)})
+
+@main.route('/api/flashcards/review', methods=['POST'])
+def api_review_flashcard():
+    """Record a flashcard review and get the card's next due date"""
+    if not study_features_available:
+        return jsonify({'error': 'Study features not available'}), 400
+    
+    data = request.get_json() or {}
+    card_id = data.get('card_id')
+    quality = data.get('quality')
+    if not isinstance(card_id, int) or not isinstance(quality, int) or not 0 <= quality <= 5:
+        return jsonify({'error': 'card_id and a quality from 0 to 5 are required'}), 400
+    
+    card = review_flashcard(card_id, quality)
+    if card is None:
+        return jsonify({'error': 'Card not found'}), 404
+    return jsonify({'success': True, 'card': card})
+
+@main.route('/api/get_study_progress', methods=['GET'])
 def api_get_study_progress():
-    """Get study progress"""
+    """Get per-file study progress summaries (and one file's sessions with ?filename=)"""
     if not study_features_available:
         return jsonify({'error': 'Study features not available'}), 400
     
+    filename = request.args.get('filename')
+    if filename:
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        return jsonify({'filename': filename, 'sessions': get_study_sessions(filename, limit)})
+    
     progress = get_study_progress()
     return jsonify({'progress': progress})
 
 # ==================== CALENDAR API ====================
 
-@app.route('/api/calendar/authenticate', methods=['POST'])
+@main.route('/api/calendar/authenticate', methods=['POST'])
 def api_calendar_authenticate():
     """Authenticate with Google Calendar"""
     if not calendar_enabled:
@@ -518,7 +790,7 @@ def api_calendar_authenticate():
             'error': 'credentials.json not found. Please download it from Google Cloud Console and place it in the app directory.'
         }), 400
     
-    cal_mgr = CalendarManager()
+    cal_mgr = get_calendar_manager()
     success = cal_mgr.authenticate()
     
     if success:
@@ -528,33 +800,42 @@ def api_calendar_authenticate():
     
     return jsonify({'error': 'Authentication failed. Check server logs for details.'}), 400
 
-@app.route('/api/calendar/create_event', methods=['POST'])
+def _calendar_auth_error():
+    """Authenticate from the stored token if needed; returns an error response or None"""
+    if session.get('calendar_authenticated'):
+        return None
+    
+    from pathlib import Path
+    credentials_path = Path(__file__).parent / 'credentials.json'
+    
+    if not credentials_path.exists():
+        return jsonify({
+            'error': 'Please authenticate first. credentials.json not found.',
+            'needs_auth': True
+        }), 401
+    
+    # Try to authenticate using existing token
+    cal_mgr = get_calendar_manager()
+    if cal_mgr.authenticate():
+        session['calendar_authenticated'] = True
+        session.modified = True
+        return None
+    
+    return jsonify({
+        'error': 'Please authenticate first. Click "Connect Google Calendar" button.',
+        'needs_auth': True
+    }), 401
+
+@main.route('/api/calendar/create_event', methods=['POST'])
 def api_calendar_create_event():
     """Create a calendar event"""
     if not calendar_enabled:
         return jsonify({'error': 'Calendar feature is not enabled'}), 400
     
     # Try to authenticate if not already authenticated
-    if not session.get('calendar_authenticated'):
-        from pathlib import Path
-        credentials_path = Path(__file__).parent / 'credentials.json'
-        
-        if not credentials_path.exists():
-            return jsonify({
-                'error': 'Please authenticate first. credentials.json not found.',
-                'needs_auth': True
-            }), 401
-        
-        # Try to authenticate using existing token
-        cal_mgr = CalendarManager()
-        if cal_mgr.authenticate():
-            session['calendar_authenticated'] = True
-            session.modified = True
-        else:
-            return jsonify({
-                'error': 'Please authenticate first. Click "Connect Google Calendar" button.',
-                'needs_auth': True
-            }), 401
+    auth_error = _calendar_auth_error()
+    if auth_error:
+        return auth_error
     
     data = request.get_json()
     
@@ -590,7 +871,7 @@ def api_calendar_create_event():
             local_tz = pytz.timezone(str(get_localzone()))
             start_time = local_tz.localize(naive_dt)
         
-        cal_mgr = CalendarManager()
+        cal_mgr = get_calendar_manager()
         event = cal_mgr.create_event(
             title=title,
             start_time=start_time,
@@ -616,38 +897,156 @@ def api_calendar_create_event():
         print(f"Error creating calendar event: {str(e)}")
         return jsonify({'error': f'Error creating event: {str(e)}'}), 500
 
-@app.route('/api/calendar/get_events', methods=['GET'])
+@main.route('/api/calendar/create_events', methods=['POST'])
+def api_calendar_create_events():
+    """Create many study sessions at once, or one recurring event
+
+    Body: {"sessions": [{"title", "date", "time", "duration", "description", "reminder"}, ...]}
+    or {"title", "date", "time", "duration", "rrule": "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=30"}
+    """
+    if not calendar_enabled:
+        return jsonify({'error': 'Calendar feature is not enabled'}), 400
+    
+    auth_error = _calendar_auth_error()
+    if auth_error:
+        return auth_error
+    
+    data = request.get_json() or {}
+    cal_mgr = get_calendar_manager()
+    
+    try:
+        if data.get('rrule'):
+            if not data.get('title') or not data.get('date') or not data.get('time'):
+                return jsonify({'error': 'Missing required fields: title, date, or time'}), 400
+            start_time = datetime.strptime(f"{data['date']} {data['time']}", "%Y-%m-%d %H:%M")
+            event = cal_mgr.create_recurring_event(
+                title=data['title'],
+                start_time=start_time,
+                rrule=data['rrule'],
+                duration_minutes=int(data.get('duration', 60)),
+                description=data.get('description', ''),
+                reminder_minutes=int(data.get('reminder', 30))
+            )
+            if not event:
+                return jsonify({'error': 'Failed to create recurring event. Check the rule (FREQ plus COUNT or UNTIL).'}), 400
+            return jsonify({
+                'success': True,
+                'event': {
+                    'id': event.get('id'),
+                    'title': data['title'],
+                    'start': event.get('start', {}).get('dateTime'),
+                    'recurrence': event.get('recurrence'),
+                    'htmlLink': event.get('htmlLink')
+                }
+            })
+        
+        items = data.get('sessions')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Provide a non-empty "sessions" list or an "rrule"'}), 400
+        
+        # Naive local datetimes; the manager localizes them all with one timezone lookup
+        sessions, invalid = [], []
+        for index, item in enumerate(items):
+            try:
+                sessions.append({
+                    'index': index,
+                    'title': item['title'],
+                    'start_time': datetime.strptime(f"{item['date']} {item['time']}", "%Y-%m-%d %H:%M"),
+                    'duration_minutes': int(item.get('duration', 60)),
+                    'description': item.get('description', ''),
+                    'reminder_minutes': int(item.get('reminder', 30))
+                })
+            except (KeyError, TypeError, ValueError) as e:
+                invalid.append({'index': index, 'error': f'Invalid session: {str(e)}'})
+        
+        result = cal_mgr.create_events(sessions)
+        created = [{
+            'index': sessions[c['index']]['index'],
+            'id': c['event'].get('id'),
+            'title': c['event'].get('summary'),
+            'start': c['event'].get('start', {}).get('dateTime'),
+            'htmlLink': c['event'].get('htmlLink')
+        } for c in result['created']]
+        failed = sorted(invalid + [
+            {'index': sessions[f['index']]['index'], 'error': f['error']} for f in result['failed']
+        ], key=lambda f: f['index'])
+        
+        return jsonify({'success': not failed, 'created': created, 'failed': failed})
+        
+    except Exception as e:
+        print(f"Error creating calendar events: {str(e)}")
+        return jsonify({'error': f'Error creating events: {str(e)}'}), 500
+
+@main.route('/api/calendar/find_slots', methods=['POST'])
+def api_calendar_find_slots():
+    """Propose free study slots; commit them by posting the sessions to /api/calendar/create_events"""
+    if not calendar_enabled:
+        return jsonify({'error': 'Calendar feature is not enabled'}), 400
+    
+    auth_error = _calendar_auth_error()
+    if auth_error:
+        return auth_error
+    
+    data = request.get_json() or {}
+    
+    try:
+        duration = int(data.get('duration', 60))
+        count = int(data.get('count', 3))
+        days = int(data.get('days', 7))
+        max_per_day = data.get('max_per_day', 1)
+        if duration <= 0 or not 0 < count <= 100 or not 0 < days <= 366:
+            return jsonify({'error': 'duration must be positive, count 1-100 and days 1-366'}), 400
+        
+        start = None
+        if data.get('start_date'):
+            start = datetime.strptime(data['start_date'], "%Y-%m-%d")
+        
+        started = time.perf_counter()
+        slots = get_calendar_manager().find_free_slots(
+            duration_minutes=duration,
+            count=count,
+            days=days,
+            start=start,
+            work_start=data.get('work_start', '09:00'),
+            work_end=data.get('work_end', '21:00'),
+            min_gap_minutes=int(data.get('min_gap', 15)),
+            max_per_day=int(max_per_day) if max_per_day else None
+        )
+        took_ms = round((time.perf_counter() - started) * 1000, 2)
+        
+        title = data.get('title', 'Study Session')
+        sessions = [{
+            'title': title,
+            'date': slot['start'].strftime('%Y-%m-%d'),
+            'time': slot['start'].strftime('%H:%M'),
+            'duration': duration,
+            'start': slot['start'].isoformat(),
+            'end': slot['end'].isoformat()
+        } for slot in slots]
+        
+        return jsonify({'sessions': sessions, 'took_ms': took_ms})
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request: {str(e)}'}), 400
+    except Exception as e:
+        print(f"Error finding free slots: {str(e)}")
+        return jsonify({'error': f'Error finding slots: {str(e)}'}), 500
+
+@main.route('/api/calendar/get_events', methods=['GET'])
 def api_calendar_get_events():
     """Get upcoming calendar events"""
     if not calendar_enabled:
         return jsonify({'error': 'Calendar feature is not enabled'}), 400
     
     # Try to authenticate if not already authenticated
-    if not session.get('calendar_authenticated'):
-        from pathlib import Path
-        credentials_path = Path(__file__).parent / 'credentials.json'
-        
-        if not credentials_path.exists():
-            return jsonify({
-                'error': 'Please authenticate first. credentials.json not found.',
-                'needs_auth': True
-            }), 401
-        
-        # Try to authenticate using existing token
-        cal_mgr = CalendarManager()
-        if cal_mgr.authenticate():
-            session['calendar_authenticated'] = True
-            session.modified = True
-        else:
-            return jsonify({
-                'error': 'Please authenticate first. Click "Connect Google Calendar" button.',
-                'needs_auth': True
-            }), 401
+    auth_error = _calendar_auth_error()
+    if auth_error:
+        return auth_error
     
     try:
         max_results = request.args.get('max_results', 10, type=int)
         
-        cal_mgr = CalendarManager()
+        cal_mgr = get_calendar_manager()
         events = cal_mgr.get_upcoming_events(max_results)
         
         formatted_events = []
@@ -667,13 +1066,13 @@ def api_calendar_get_events():
         print(f"Error getting calendar events: {str(e)}")
         return jsonify({'error': f'Error loading events: {str(e)}'}), 500
 
-@app.route('/api/calendar/delete_event/<event_id>', methods=['DELETE'])
+@main.route('/api/calendar/delete_event/<event_id>', methods=['DELETE'])
 def api_calendar_delete_event(event_id):
     """Delete a calendar event"""
     if not calendar_enabled or not session.get('calendar_authenticated'):
         return jsonify({'error': 'Calendar not available'}), 400
     
-    cal_mgr = CalendarManager()
+    cal_mgr = get_calendar_manager()
     success = cal_mgr.delete_event(event_id)
     
     return jsonify({'success': success})
@@ -681,7 +1080,7 @@ def api_calendar_delete_event(event_id):
 # ==================== VOICE ASSISTANT API (DISABLED) ====================
 
 # Voice assistant API routes disabled
-# @app.route('/api/voice/check_microphone', methods=['GET'])
+# @main.route('/api/voice/check_microphone', methods=['GET'])
 # def api_voice_check_microphone():
 #     """Check if microphone is available"""
 #     if not voice_assistant_available:
@@ -691,7 +1090,7 @@ def api_calendar_delete_event(event_id):
 #     result = voice_assistant.check_microphone()
 #     return jsonify(result)
 
-# @app.route('/api/voice/speech_to_text', methods=['POST'])
+# @main.route('/api/voice/speech_to_text', methods=['POST'])
 # def api_voice_speech_to_text():
 #     """Convert speech to text"""
 #     if not voice_assistant_available:
@@ -701,7 +1100,7 @@ def api_calendar_delete_event(event_id):
 #     result = voice_assistant.speech_to_text(timeout=5, phrase_time_limit=30)
 #     return jsonify(result)
 
-# @app.route('/api/voice/text_to_speech', methods=['POST'])
+# @main.route('/api/voice/text_to_speech', methods=['POST'])
 # def api_voice_text_to_speech():
 #     """Convert text to speech"""
 #     if not voice_assistant_available:
@@ -718,7 +1117,7 @@ def api_calendar_delete_event(event_id):
 #     
 #     return jsonify({'success': success})
 
-# @app.route('/api/voice/stop_speaking', methods=['POST'])
+# @main.route('/api/voice/stop_speaking', methods=['POST'])
 # def api_voice_stop_speaking():
 #     """Stop current speech"""
 #     if not voice_assistant_available:
@@ -729,7 +1128,7 @@ def api_calendar_delete_event(event_id):
 #     
 #     return jsonify({'success': True})
 
-# @app.route('/api/voice/set_rate', methods=['POST'])
+# @main.route('/api/voice/set_rate', methods=['POST'])
 # def api_voice_set_rate():
 #     """Set speech rate"""
 #     if not voice_assistant_available:
@@ -743,7 +1142,7 @@ def api_calendar_delete_event(event_id):
 #     
 #     return jsonify({'success': success})
 
-# @app.route('/api/voice/send_message', methods=['POST'])
+# @main.route('/api/voice/send_message', methods=['POST'])
 # def api_voice_send_message():
 #     """Process voice chat messages (same as regular chat but returns for voice)"""
 #     data = request.get_json()
@@ -754,7 +1153,7 @@ def api_calendar_delete_event(event_id):
 #     
 #     # Initialize chat ID if needed
 #     if not session.get('current_chat_id'):
-#         session['current_chat_id'] = datetime.now().strftime("%Y%m%d_%H%M%S")
+#         session['current_chat_id'] = new_chat_id()
 #     
 #     # Generate title from first message
 #     if not session.get('messages'):
@@ -800,7 +1199,7 @@ def api_calendar_delete_event(event_id):
 #         'chat_title': session.get('chat_title')
 #     })
 
-# @app.route('/api/voice/new_chat', methods=['POST'])
+# @main.route('/api/voice/new_chat', methods=['POST'])
 # def api_voice_new_chat():
 #     """Start a new voice chat"""
 #     # Save current chat if exists
@@ -812,7 +1211,7 @@ def api_calendar_delete_event(event_id):
 #         )
 #     
 #     # Reset session
-#     session['current_chat_id'] = datetime.now().strftime("%Y%m%d_%H%M%S")
+#     session['current_chat_id'] = new_chat_id()
 #     session['messages'] = []
 #     session['chat_title'] = "Voice Chat"
 #     session.modified = True
@@ -821,15 +1220,17 @@ def api_calendar_delete_event(event_id):
 
 # ==================== ERROR HANDLERS ====================
 
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def internal_error(error):
     return render_template('500.html'), 500
 
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; use gunicorn.conf.py for multi-worker production serving
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true')
+    create_app().run(debug=debug, host='0.0.0.0', port=5000)
@@ -0,0 +1,234 @@
+"""
+End-to-end benchmark
+Drives the Flask routes against a fake Ollama server and an in-process vector store
+
+Measures ingestion throughput, /api/send_message latency percentiles, streaming
+time-to-first-token and study tool latency, and writes the results as JSON.
+
+Usage: python benchmarks/bench_e2e.py [--messages 100] [--ttft 0.05] [--tps 200] [--output e2e.json]
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_utils import REPO_ROOT, summarize, write_results
+from fake_ollama import FakeOllamaServer
+from fake_vector_store import FakePinecone
+
+QUESTIONS = [
+    "What is a page table?", "Explain how the scheduler picks the next thread.",
+    "How does a hash index speed up a query?", "What is the difference between a stack and a heap?",
+    "Summarize the notes on network protocol layers.", "Why do we need a lock around the queue?",
+    "How is a tree different from a graph?", "What does the kernel do on a page fault?",
+]
+
+_VOCABULARY = ("process memory page table scheduler thread lock queue index query node tree graph cache "
+               "buffer disk file system kernel network packet layer protocol model data value key function "
+               "class object method stack heap pointer array list hash sort search time space").split()
+
+
+def make_document(seed: int, words: int) -> str:
+    """Deterministic study notes of roughly `words` words"""
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < words:
+        length = rng.randint(8, 20)
+        sentences.append(' '.join(rng.choice(_VOCABULARY) for _ in range(length)).capitalize() + '.')
+        count += length
+    return ' '.join(sentences)
+
+
+def load_app(ollama_url: str, workdir: Path):
+    """Build the app configured for the fakes, with all its data in workdir"""
+    os.chdir(workdir)
+    os.environ.update({
+        'OLLAMA_HOST': ollama_url,
+        'OLLAMA_HOSTS': '',
+        'OLLAMA_WARMUP': 'false',
+        'PINECONE_API_KEY': 'benchmark',
+        'PINECONE_INDEX_NAME': 'benchmark-notes',
+        'ENABLE_CALENDAR': 'false',
+        'SESSION_BACKEND': 'memory',
+        'CHAT_ARCHIVE_DAYS': '0',
+        'SECRET_KEY': 'benchmark',
+    })
+    # Measure the uncached path unless the caller asks for the shared cache
+    os.environ.setdefault('SHARED_CACHE', 'false')
+
+    import utils.pinecone_handler as pinecone_handler
+    pinecone_handler.Pinecone = FakePinecone
+
+    from app import create_app
+    return create_app({'TESTING': True})
+
+
+def bench_ingestion(client, docs: int, words: int) -> dict:
+    from utils.pinecone_handler import chunk_text
+
+    latencies, total_bytes, total_chunks = [], 0, 0
+    started = time.perf_counter()
+    for i in range(docs):
+        text = make_document(i, words)
+        data = text.encode('utf-8')
+        total_bytes += len(data)
+        total_chunks += len(chunk_text(text))
+
+        t0 = time.perf_counter()
+        response = client.post('/api/upload_files', data={'files[]': (io.BytesIO(data), f'notes_{i}.md')},
+                               content_type='multipart/form-data')
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"Upload failed: {response.status_code} {response.get_data(as_text=True)}")
+    elapsed = time.perf_counter() - started
+
+    return {
+        'documents': docs,
+        'bytes': total_bytes,
+        'chunks': total_chunks,
+        'seconds': round(elapsed, 3),
+        'documents_per_second': round(docs / elapsed, 2),
+        'chunks_per_second': round(total_chunks / elapsed, 2),
+        'mb_per_second': round(total_bytes / elapsed / 1e6, 3),
+        'request_latency': summarize(latencies),
+    }
+
+
+def bench_send_message(client, messages: int, turns_per_chat: int) -> dict:
+    latencies = []
+    for i in range(messages):
+        if i % turns_per_chat == 0:
+            client.post('/api/new_chat')
+        question = QUESTIONS[i % len(QUESTIONS)]
+        t0 = time.perf_counter()
+        response = client.post('/api/send_message', json={'message': f"{question} ({i})"})
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"send_message failed: {response.status_code}")
+    return {'turns_per_chat': turns_per_chat, 'latency': summarize(latencies)}
+
+
+def bench_streaming(runs: int, model: str) -> dict:
+    from utils.ollama_handler import get_nexnote_response_stream
+
+    ttfts, totals, rates = [], [], []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        first, tokens = None, 0
+        for _ in get_nexnote_response_stream(f"{QUESTIONS[i % len(QUESTIONS)]} [stream {i}]", [], model,
+                                             chat_id=f"stream-{i}"):
+            if first is None:
+                first = time.perf_counter() - t0
+            tokens += 1
+        total = time.perf_counter() - t0
+        ttfts.append(first or total)
+        totals.append(total)
+        if total > (first or 0) and tokens > 1:
+            rates.append((tokens - 1) / (total - first))
+
+    return {
+        'ttft': summarize(ttfts),
+        'total': summarize(totals),
+        'tokens_per_second': round(sum(rates) / len(rates), 2) if rates else None,
+    }
+
+
+def bench_study_tools(client, runs: int, words: int) -> dict:
+    # A single document in the index, so every retrieved chunk belongs to it
+    FakePinecone.reset()
+    filename = 'study_notes.md'
+    data = make_document(1000, words).encode('utf-8')
+    client.post('/api/upload_files', data={'files[]': (io.BytesIO(data), filename)},
+                content_type='multipart/form-data')
+
+    results = {}
+    for tool, route, extra in [
+        ('summary', '/api/generate_summary', {}),
+        ('quiz', '/api/generate_quiz', {'num_questions': 5}),
+        ('concepts', '/api/extract_concepts', {}),
+        ('flashcards', '/api/generate_flashcards', {'num_cards': 10}),
+    ]:
+        latencies = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            response = client.post(route, json=dict(extra, filename=filename))
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code != 200:
+                raise RuntimeError(f"{route} failed: {response.status_code} {response.get_data(as_text=True)}")
+        results[tool] = summarize(latencies)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NexNote end-to-end benchmark")
+    parser.add_argument('--ttft', type=float, default=0.05, help="fake Ollama time to first token (s)")
+    parser.add_argument('--tps', type=float, default=200.0, help="fake Ollama tokens per second")
+    parser.add_argument('--tokens', type=int, default=64, help="tokens per fake answer")
+    parser.add_argument('--embed-latency', type=float, default=0.0, help="fake embedding call latency (s)")
+    parser.add_argument('--vector-latency', type=float, default=0.0, help="fake vector store call latency (s)")
+    parser.add_argument('--docs', type=int, default=10, help="documents to ingest")
+    parser.add_argument('--doc-words', type=int, default=2000, help="words per document")
+    parser.add_argument('--messages', type=int, default=100, help="chat messages to send")
+    parser.add_argument('--turns-per-chat', type=int, default=10)
+    parser.add_argument('--stream-runs', type=int, default=20)
+    parser.add_argument('--study-runs', type=int, default=5)
+    parser.add_argument('--output', default='benchmark_e2e.json', help="results file")
+    parser.add_argument('--keep-data', action='store_true', help="keep the temporary data directory")
+    args = parser.parse_args()
+
+    output = Path(args.output).resolve()
+    workdir = Path(tempfile.mkdtemp(prefix='nexnote-bench-'))
+    server = FakeOllamaServer(ttft=args.ttft, tokens_per_second=args.tps, response_tokens=args.tokens,
+                              embed_latency=args.embed_latency).start()
+    FakePinecone.latency = args.vector_latency
+
+    try:
+        client = load_app(server.url, workdir).test_client()
+        from app import CHAT_MODEL
+
+        print("Ingestion...")
+        ingestion = bench_ingestion(client, args.docs, args.doc_words)
+        print("Chat messages...")
+        chat = bench_send_message(client, args.messages, args.turns_per_chat)
+        print("Streaming...")
+        streaming = bench_streaming(args.stream_runs, CHAT_MODEL)
+        print("Study tools...")
+        study = bench_study_tools(client, args.study_runs, args.doc_words)
+    finally:
+        server.stop()
+        os.chdir(REPO_ROOT)
+        if args.keep_data:
+            print(f"Data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    metrics = {
+        'ingestion': ingestion,
+        'send_message': chat,
+        'streaming': streaming,
+        'study_tools': study,
+        'ollama_requests': dict(server.fake.requests),
+    }
+    config = {k: v for k, v in vars(args).items() if k not in ('output', 'keep_data')}
+    write_results(str(output), 'e2e', config, metrics)
+
+    print(f"\nIngestion:    {ingestion['documents_per_second']} docs/s, {ingestion['chunks_per_second']} chunks/s")
+    print(f"send_message: p50 {chat['latency']['p50_ms']} ms, p95 {chat['latency']['p95_ms']} ms, "
+          f"p99 {chat['latency']['p99_ms']} ms")
+    print(f"Streaming:    TTFT p50 {streaming['ttft']['p50_ms']} ms, p95 {streaming['ttft']['p95_ms']} ms, "
+          f"{streaming['tokens_per_second']} tokens/s")
+    for tool, stats in study.items():
+        print(f"{tool + ':':13} p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Ingestion micro-benchmark
+Times each upload stage (extract, chunk, embed, upsert) for PDF, DOCX, TXT and MD files of 1 to 1000 pages
+
+Documents are generated deterministically; real files can be added with --fixtures.
+Embeddings go through get_embedding to the fake Ollama server and vectors are
+upserted into the in-process vector store, batched as in process_uploaded_files.
+Each stage reports pages/s, chunks/s and MB/s of source file, plus its peak
+traced memory from a separate tracemalloc pass.
+
+Usage: python benchmarks/bench_ingestion.py [--sizes 1 10 100 1000] [--formats pdf docx txt md]
+                                            [--fixtures DIR] [--output ingestion.json] [--baseline old.json]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_e2e import make_document
+from bench_utils import load_results, print_comparison, write_results
+from fake_ollama import FakeOllamaServer
+from fake_vector_store import FakeIndex
+
+FORMATS = ['pdf', 'docx', 'txt', 'md']
+STAGES = ['extract', 'chunk', 'embed', 'upsert']
+UPSERT_BATCH_SIZE = 100
+PDF_LINE_CHARS = 90
+
+
+def _pages(pages: int, words_per_page: int) -> List[str]:
+    return [make_document(page, words_per_page) for page in range(pages)]
+
+
+def make_txt(pages: List[str]) -> bytes:
+    return '\n\f\n'.join(pages).encode('utf-8')
+
+
+def make_md(pages: List[str]) -> bytes:
+    return '\n\n'.join(f"## Page {i + 1}\n\n{text}" for i, text in enumerate(pages)).encode('utf-8')
+
+
+def make_docx(pages: List[str]) -> bytes:
+    import docx
+
+    document = docx.Document()
+    for i, text in enumerate(pages):
+        if i:
+            document.add_page_break()
+        document.add_heading(f"Page {i + 1}", level=2)
+        sentences = text.split('. ')
+        for start in range(0, len(sentences), 5):
+            document.add_paragraph('. '.join(sentences[start:start + 5]))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _pdf_lines(text: str) -> List[str]:
+    lines, line = [], ''
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > PDF_LINE_CHARS:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Minimal text PDF (Helvetica, one content stream per page) without a PDF writer library"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        escaped = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in _pdf_lines(text)]
+        stream = ("BT /F1 10 Tf 12 TL 40 800 Td " + ' '.join(f"({line}) Tj T*" for line in escaped) + " ET")
+        stream = stream.encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode('ascii')
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+GENERATORS: Dict[str, Callable[[List[str]], bytes]] = {
+    'pdf': make_pdf, 'docx': make_docx, 'txt': make_txt, 'md': make_md,
+}
+
+
+def load_fixtures(directory: str) -> List[Tuple[str, str, bytes, Optional[int]]]:
+    """(label, filename, data, pages) for every supported file in directory"""
+    import PyPDF2
+
+    fixtures = []
+    for path in sorted(Path(directory).iterdir()):
+        file_type = path.suffix.lower().lstrip('.')
+        if file_type not in FORMATS:
+            continue
+        data = path.read_bytes()
+        if file_type == 'pdf':
+            pages = len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+        else:
+            pages = None  # estimated from the extracted text
+        fixtures.append((f"fixture_{path.name}", path.name, data, pages))
+    return fixtures
+
+
+def run_stages(filename: str, data: bytes, index: FakeIndex) -> Tuple[Dict[str, float], Dict]:
+    """Run one document through the upload pipeline, returning seconds per stage and its sizes"""
+    from werkzeug.datastructures import FileStorage
+    from utils.pinecone_handler import chunk_text, extract_text_from_file, get_embedding
+
+    seconds = {}
+    file = FileStorage(stream=io.BytesIO(data), filename=filename)
+
+    t0 = time.perf_counter()
+    text = extract_text_from_file(file)
+    seconds['extract'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    chunks = chunk_text(text)
+    seconds['chunk'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    embeddings = [get_embedding(chunk) for chunk in chunks]
+    seconds['embed'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    file_hash = hashlib.md5(filename.encode()).hexdigest()
+    vectors = [{
+        'id': f"{file_hash}_{chunk_idx}",
+        'values': embedding,
+        'metadata': {'filename': filename, 'chunk_index': chunk_idx, 'text': chunk}
+    } for chunk_idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)) if embedding]
+    for i in range(0, len(vectors), UPSERT_BATCH_SIZE):
+        index.upsert(vectors=vectors[i:i + UPSERT_BATCH_SIZE])
+    seconds['upsert'] = time.perf_counter() - t0
+
+    sizes = {'text_chars': len(text), 'words': len(text.split()), 'chunks': len(chunks),
+             'embedded': sum(1 for e in embeddings if e)}
+    return seconds, sizes
+
+
+def peak_memory(filename: str, data: bytes, index: FakeIndex) -> Dict[str, float]:
+    """Peak traced memory of each stage above what was allocated before it, in MB"""
+    from werkzeug.datastructures import FileStorage
+    from utils.pinecone_handler import chunk_text, extract_text_from_file, get_embedding
+
+    peaks = {}
+    tracemalloc.start()
+    try:
+        def measure(stage: str, func: Callable):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            result = func()
+            peaks[stage] = round((tracemalloc.get_traced_memory()[1] - before) / 1e6, 3)
+            return result
+
+        file = FileStorage(stream=io.BytesIO(data), filename=filename)
+        text = measure('extract', lambda: extract_text_from_file(file))
+        chunks = measure('chunk', lambda: chunk_text(text))
+        embeddings = measure('embed', lambda: [get_embedding(chunk) for chunk in chunks])
+
+        def upsert():
+            vectors = [{'id': f"mem_{i}", 'values': e, 'metadata': {'filename': filename, 'chunk_index': i,
+                                                                      'text': c}}
+                       for i, (c, e) in enumerate(zip(chunks, embeddings)) if e]
+            for i in range(0, len(vectors), UPSERT_BATCH_SIZE):
+                index.upsert(vectors=vectors[i:i + UPSERT_BATCH_SIZE])
+        measure('upsert', upsert)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def bench_document(filename: str, data: bytes, pages: Optional[int], repeat: int, memory: bool,
+                   words_per_page: int) -> Dict:
+    """Best-of-repeat stage timings and throughput for one document"""
+    best: Dict[str, float] = {}
+    sizes = {}
+    for _ in range(repeat):
+        # A fresh index each run, so upsert cost doesn't grow with earlier runs
+        seconds, sizes = run_stages(filename, data, FakeIndex('ingestion', 768, 0.0))
+        for stage, value in seconds.items():
+            best[stage] = min(value, best.get(stage, value))
+
+    if pages is None:
+        pages = max(1, round(sizes['words'] / words_per_page))
+    mb = len(data) / 1e6
+    result = {'pages': pages, 'bytes': len(data), **sizes}
+    for stage in STAGES:
+        elapsed = max(best[stage], 1e-9)
+        result[stage] = {
+            'seconds': round(best[stage], 6),
+            'pages_per_second': round(pages / elapsed, 2),
+            'chunks_per_second': round(sizes['chunks'] / elapsed, 2),
+            'mb_per_second': round(mb / elapsed, 3),
+        }
+    if memory:
+        for stage, peak in peak_memory(filename, data, FakeIndex('ingestion', 768, 0.0)).items():
+            result[stage]['peak_mb'] = peak
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NexNote ingestion micro-benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000], help="pages per document")
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS)
+    parser.add_argument('--words-per-page', type=int, default=400)
+    parser.add_argument('--fixtures', help="directory of real documents to include")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per document; the fastest is reported")
+    parser.add_argument('--embed-latency', type=float, default=0.0, help="fake embedding call latency (s)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--output', default='benchmark_ingestion.json', help="results file")
+    parser.add_argument('--baseline', help="earlier results file to compare this run against")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(embed_latency=args.embed_latency).start()
+    os.environ.update({'OLLAMA_HOST': server.url, 'OLLAMA_HOSTS': ''})
+
+    documents = []
+    for file_type in args.formats:
+        for pages in args.sizes:
+            print(f"Generating {pages}-page {file_type.upper()}...")
+            data = GENERATORS[file_type](_pages(pages, args.words_per_page))
+            documents.append((f"{file_type}_{pages}", f"synthetic_{pages}.{file_type}", data, pages))
+    if args.fixtures:
+        documents.extend(load_fixtures(args.fixtures))
+
+    metrics = {}
+    try:
+        for label, filename, data, pages in documents:
+            print(f"Benchmarking {label} ({len(data) / 1e6:.2f} MB)...")
+            metrics[label] = bench_document(filename, data, pages, args.repeat, not args.no_memory,
+                                            args.words_per_page)
+    finally:
+        server.stop()
+
+    config = {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')}
+    results = write_results(args.output, 'ingestion', config, metrics)
+
+    width = max(len(label) for label in metrics) if metrics else 8
+    print(f"\n{'document':<{width}} {'stage':<8} {'seconds':>10} {'pages/s':>11} {'chunks/s':>11} {'MB/s':>9} "
+          f"{'peak MB':>8}")
+    for label, result in metrics.items():
+        for stage in STAGES:
+            row = result[stage]
+            peak = f"{row['peak_mb']:8.2f}" if 'peak_mb' in row else f"{'-':>8}"
+            print(f"{label:<{width}} {stage:<8} {row['seconds']:10.4f} {row['pages_per_second']:11.1f} "
+                  f"{row['chunks_per_second']:11.1f} {row['mb_per_second']:9.2f} {peak}")
+
+    if args.baseline:
+        print()
+        print_comparison(load_results(args.baseline), results)
+
+
+if __name__ == '__main__':
+    main()
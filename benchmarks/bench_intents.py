@@ -0,0 +1,91 @@
+"""
+Intent router benchmark
+Checks the phrase corpus and times intent classification and schedule parsing
+
+Usage: python benchmarks/bench_intents.py [--iterations N] [--json results.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_utils import write_results
+from utils.intent_router import classify_intent, parse_schedule
+
+CORPUS_PATH = Path(__file__).parent / "intent_phrases.json"
+
+# The keyword scan send_message used before the router, for comparison
+LEGACY_KEYWORDS = ['schedule', 'remind', 'add event', 'create event', 'set reminder', 'add to calendar']
+
+
+def check_corpus(corpus: dict) -> list:
+    """Phrases whose intent or parse differs from the expected result"""
+    now = datetime.fromisoformat(corpus['now'])
+    failures = []
+    for phrase in corpus['phrases']:
+        intent = classify_intent(phrase['text'])
+        parsed = parse_schedule(phrase['text'], now) if intent != 'chat' else None
+        if parsed:
+            parsed = dict(parsed, datetime=parsed['datetime'].isoformat(timespec='minutes'))
+        if intent != phrase['intent'] or parsed != phrase['parsed']:
+            failures.append({'text': phrase['text'], 'expected': [phrase['intent'], phrase['parsed']],
+                             'got': [intent, parsed]})
+    return failures
+
+
+def time_per_call(func, items: list, iterations: int) -> float:
+    """Mean microseconds per call of func over items"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - started) / (iterations * len(items)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    failures = check_corpus(corpus)
+    for failure in failures:
+        print(f"❌ {failure['text']!r}\n   expected {failure['expected']}\n   got      {failure['got']}")
+
+    chat = [p['text'] for p in corpus['phrases'] if p['intent'] == 'chat']
+    scheduling = [p['text'] for p in corpus['phrases'] if p['intent'] != 'chat']
+    now = datetime.fromisoformat(corpus['now'])
+
+    results = {
+        'phrases': len(corpus['phrases']),
+        'failures': len(failures),
+        'classify_chat_us': round(time_per_call(classify_intent, chat, args.iterations), 3),
+        'classify_scheduling_us': round(time_per_call(classify_intent, scheduling, args.iterations), 3),
+        'legacy_keyword_scan_us': round(time_per_call(
+            lambda text: any(k in text.lower() for k in LEGACY_KEYWORDS), chat, args.iterations), 3),
+        'parse_schedule_us': round(time_per_call(
+            lambda text: parse_schedule(text, now), scheduling, max(1, args.iterations // 10)), 3),
+    }
+
+    print(f"Corpus: {results['phrases'] - results['failures']}/{results['phrases']} phrases as expected")
+    print(f"classify_intent (chat messages):       {results['classify_chat_us']:8.3f} µs")
+    print(f"classify_intent (scheduling messages): {results['classify_scheduling_us']:8.3f} µs")
+    print(f"legacy keyword scan (chat messages):   {results['legacy_keyword_scan_us']:8.3f} µs")
+    print(f"parse_schedule:                        {results['parse_schedule_us']:8.3f} µs")
+
+    if args.json:
+        write_results(args.json, 'intents', {'iterations': args.iterations}, results)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
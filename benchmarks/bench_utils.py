@@ -0,0 +1,119 @@
+"""
+Benchmark helpers
+Latency summaries and machine-readable result files shared by the benchmark scripts
+
+Compare two result files of the same benchmark:
+    python benchmarks/bench_utils.py before.json after.json
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).parent.parent
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Percentile with linear interpolation between closest ranks"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Count, mean and p50/p95/p99 of latencies given in seconds, reported in milliseconds"""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+        'min_ms': round(min(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path: str, benchmark: str, config: Dict, metrics: Dict) -> Dict:
+    """Write one run's results as JSON, with enough context to compare runs later"""
+    results = {
+        'benchmark': benchmark,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+        'metrics': metrics,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+    return results
+
+
+def load_results(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def flatten_metrics(metrics: Dict, prefix: str = '') -> Dict[str, float]:
+    """Numeric metrics keyed by their dotted path, e.g. 'pdf_100.extract.seconds'"""
+    flat = {}
+    for key, value in metrics.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare_results(before: Dict, after: Dict) -> List[Tuple[str, float, float, Optional[float]]]:
+    """(metric, before, after, percent change) for every numeric metric both runs share"""
+    old = flatten_metrics(before.get('metrics', {}))
+    new = flatten_metrics(after.get('metrics', {}))
+    rows = []
+    for key in old:
+        if key in new:
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else None
+            rows.append((key, old[key], new[key], change))
+    return rows
+
+
+def print_comparison(before: Dict, after: Dict):
+    if before.get('benchmark') != after.get('benchmark'):
+        print(f"⚠️ Comparing different benchmarks: {before.get('benchmark')} vs {after.get('benchmark')}")
+    print(f"Before: {before.get('timestamp')} ({before.get('git_revision')})")
+    print(f"After:  {after.get('timestamp')} ({after.get('git_revision')})")
+    rows = compare_results(before, after)
+    width = max((len(row[0]) for row in rows), default=6)
+    print(f"{'metric':<{width}} {'before':>14} {'after':>14} {'change':>9}")
+    for key, old, new, change in rows:
+        change_text = f"{change:+8.1f}%" if change is not None else f"{'-':>9}"
+        print(f"{key:<{width}} {old:>14.6g} {new:>14.6g} {change_text}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(f"Usage: {__doc__.strip().splitlines()[-1].strip()}")
+        sys.exit(2)
+    print_comparison(load_results(sys.argv[1]), load_results(sys.argv[2]))
@@ -0,0 +1,103 @@
+"""
+Fake Google Calendar API
+In-memory stand-in with syncToken semantics, for benchmarking and testing the calendar sync without Google
+"""
+
+import itertools
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from utils.calendar_sync import BATCH_SIZE, SyncTokenExpired
+
+
+class FakeCalendarApi:
+    """Implements the list/insert/delete/batch calls CalendarSync makes
+
+    Every change is stamped with a sequence number; a sync token is the
+    sequence number it was issued at, so incremental listings return the
+    events changed after it (deleted ones as status 'cancelled').
+    expire_sync_tokens() makes older tokens fail like an HTTP 410.
+    Batched inserts reject bodies without a start or end, like Google does.
+    """
+
+    def __init__(self, page_size: int = 250):
+        self.page_size = page_size
+        self.calls: Dict[str, int] = {'list': 0, 'insert': 0, 'delete': 0, 'batch': 0}
+        self._events: Dict[str, Dict[str, Dict]] = {}
+        self._changed: Dict[str, Dict[str, int]] = {}
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._min_token = 0
+        self._lock = threading.Lock()
+
+    def _stamp(self, calendar_id: str, event: Dict):
+        self._last_seq = next(self._seq)
+        self._events.setdefault(calendar_id, {})[event['id']] = event
+        self._changed.setdefault(calendar_id, {})[event['id']] = self._last_seq
+
+    def add_event(self, calendar_id: str, event: Dict) -> Dict:
+        """Add an event as if created elsewhere (e.g. on a phone)"""
+        with self._lock:
+            event = dict(event, id=event.get('id') or uuid.uuid4().hex, status=event.get('status', 'confirmed'))
+            self._stamp(calendar_id, event)
+            return dict(event)
+
+    def expire_sync_tokens(self):
+        """Invalidate every token issued so far; tokens from later listings stay valid"""
+        with self._lock:
+            self._last_seq = next(self._seq)
+            self._min_token = self._last_seq
+
+    def list_events(self, calendar_id: str, sync_token: Optional[str] = None,
+                    page_token: Optional[str] = None) -> Dict:
+        with self._lock:
+            self.calls['list'] += 1
+            since = 0
+            if sync_token:
+                since = int(sync_token)
+                if since < self._min_token:
+                    raise SyncTokenExpired()
+
+            changed = self._changed.get(calendar_id, {})
+            events = [
+                e for e in self._events.get(calendar_id, {}).values()
+                if changed[e['id']] > since and (sync_token or e.get('status') != 'cancelled')
+            ]
+            events.sort(key=lambda e: changed[e['id']])
+
+            offset = int(page_token or 0)
+            page: Dict = {'items': [dict(e) for e in events[offset:offset + self.page_size]]}
+            if offset + self.page_size < len(events):
+                page['nextPageToken'] = str(offset + self.page_size)
+            else:
+                page['nextSyncToken'] = str(self._last_seq)
+            return page
+
+    def insert_event(self, calendar_id: str, body: Dict) -> Dict:
+        self.calls['insert'] += 1
+        return self.add_event(calendar_id, dict(body, id=None))
+
+    def insert_events(self, calendar_id: str, bodies: List[Dict]) -> List[Tuple[Optional[Dict], Optional[str]]]:
+        self.calls['batch'] += (len(bodies) + BATCH_SIZE - 1) // BATCH_SIZE
+        results: List[Tuple[Optional[Dict], Optional[str]]] = []
+        for body in bodies:
+            if not (body.get('start') or {}).get('dateTime', (body.get('start') or {}).get('date')) \
+                    or not (body.get('end') or {}).get('dateTime', (body.get('end') or {}).get('date')):
+                results.append((None, "Missing start or end time"))
+            else:
+                results.append((self.add_event(calendar_id, dict(body, id=None)), None))
+        return results
+
+    def delete_event(self, calendar_id: str, event_id: str) -> None:
+        with self._lock:
+            self.calls['delete'] += 1
+            event = self._events.get(calendar_id, {}).get(event_id)
+            if event is None or event.get('status') == 'cancelled':
+                raise KeyError(f"Event {event_id} not found")
+            self._stamp(calendar_id, {'id': event_id, 'status': 'cancelled'})
+
+    def events(self, calendar_id: str) -> List[Dict]:
+        """Current (not deleted) events, for assertions"""
+        with self._lock:
+            return [dict(e) for e in self._events.get(calendar_id, {}).values() if e.get('status') != 'cancelled']
@@ -0,0 +1,259 @@
+"""
+Fake Ollama server
+Deterministic stand-in for the Ollama HTTP API with configurable time-to-first-token and token rate
+
+Run on its own to point a real NexNote instance at it:
+    python benchmarks/fake_ollama.py --port 11435 --ttft 0.2 --tps 40
+    OLLAMA_HOST=http://127.0.0.1:11435 python app.py
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+
+EMBEDDING_DIM = 768
+
+_WORDS = ("the process memory page table scheduler thread lock queue index query node tree graph "
+          "cache buffer disk file system kernel network packet layer protocol model data value key "
+          "function class object method stack heap pointer array list hash sort search time space").split()
+_WORD_RE = re.compile(r"\w+")
+
+# Canned JSON answers for the study tools, keyed by the last line of their prompts
+_STUDY_ANSWERS = {
+    'Quiz:': json.dumps([{
+        "question": f"Question {i + 1} about the notes?",
+        "options": {"A": "First", "B": "Second", "C": "Third", "D": "Fourth"},
+        "correct": "ABCD"[i % 4],
+        "explanation": "Explained in the notes."
+    } for i in range(5)]),
+    'Flashcards:': json.dumps([{"front": f"Term {i + 1}?", "back": f"Definition {i + 1}."} for i in range(10)]),
+    'Analysis:': json.dumps({"topics": ["Topic A", "Topic B", "Topic C"],
+                             "terms": ["term one", "term two"], "points": ["point one", "point two"]}),
+}
+
+
+def embed(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Hashed bag-of-words vector, so texts sharing words are close in cosine distance"""
+    vector = [0.0] * dim
+    for word in _WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode('utf-8'))
+        vector[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllama:
+    """Response generation and timing shared by all request handlers"""
+
+    def __init__(self, ttft: float = 0.05, tokens_per_second: float = 200.0, response_tokens: int = 64,
+                 embed_latency: float = 0.0, parallel: int = 0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.embed_latency = embed_latency
+        # Like OLLAMA_NUM_PARALLEL: generations beyond this many wait for a slot (0 = unlimited)
+        self._slots = threading.Semaphore(parallel) if parallel > 0 else None
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def tokens_for(self, prompt: str) -> List[str]:
+        """The same prompt always gets the same answer"""
+        tail = prompt.rstrip().rsplit('\n', 1)[-1].strip()
+        if tail in _STUDY_ANSWERS:
+            answer = _STUDY_ANSWERS[tail]
+            return [answer[i:i + 4] for i in range(0, len(answer), 4)]
+        rng = random.Random(zlib.crc32(prompt.encode('utf-8')))
+        return [(' ' if i else '') + rng.choice(_WORDS) for i in range(self.response_tokens)]
+
+    def generate(self, prompt: str) -> Iterator[tuple]:
+        """Yield (token, is_last) pacing tokens by TTFT and token rate"""
+        tokens = self.tokens_for(prompt)
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            time.sleep(self.ttft)
+            interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+            next_at = time.perf_counter()
+            for i, token in enumerate(tokens):
+                if i:
+                    next_at += interval
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                yield token, i == len(tokens) - 1
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def final_stats(self, prompt: str, tokens: int, started: float) -> Dict:
+        total = time.perf_counter() - started
+        return {
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int(total * 1e9),
+            'load_duration': 1000000,
+            'prompt_eval_count': max(1, len(prompt) // 4),
+            'prompt_eval_duration': int(self.ttft * 1e9),
+            'eval_count': tokens,
+            'eval_duration': int(max(total - self.ttft, 1e-6) * 1e9),
+        }
+
+
+def _prompt_of(body: Dict) -> str:
+    if 'messages' in body:
+        return '\n'.join(m.get('content', '') for m in body['messages'])
+    return body.get('prompt', '') or ''
+
+
+def _make_handler(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; with Nagle on, each keep-alive
+        # response would wait ~40 ms for the client's delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload: Dict, status: int = 200):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, payload: Dict):
+            data = (json.dumps(payload) + '\n').encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_GET(self):
+            fake.count(self.path)
+            if self.path == '/api/tags':
+                self._send_json({'models': []})
+            elif self.path == '/api/ps':
+                self._send_json({'models': []})
+            elif self.path == '/api/version':
+                self._send_json({'version': '0.0.0-fake'})
+            else:
+                self._send_json({'status': 'Ollama is running'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            fake.count(self.path)
+
+            if self.path in ('/api/embeddings', '/api/embed'):
+                time.sleep(fake.embed_latency)
+                if self.path == '/api/embeddings':
+                    self._send_json({'embedding': embed(body.get('prompt', ''))})
+                else:
+                    inputs = body.get('input', '')
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    self._send_json({'model': body.get('model'), 'embeddings': [embed(t) for t in inputs]})
+                return
+
+            if self.path not in ('/api/chat', '/api/generate'):
+                self._send_json({'error': f'unknown endpoint {self.path}'}, 404)
+                return
+
+            chat = self.path == '/api/chat'
+            prompt = _prompt_of(body)
+            started = time.perf_counter()
+            base = {'model': body.get('model'), 'created_at': datetime.now(timezone.utc).isoformat()}
+
+            # An empty generate prompt only loads the model
+            if not chat and not prompt:
+                self._send_json(dict(base, response='', **fake.final_stats(prompt, 0, started)))
+                return
+
+            def piece(token: str) -> Dict:
+                if chat:
+                    return {'message': {'role': 'assistant', 'content': token}}
+                return {'response': token}
+
+            if body.get('stream', True):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                count = 0
+                for token, _ in fake.generate(prompt):
+                    count += 1
+                    self._write_chunk(dict(base, done=False, **piece(token)))
+                self._write_chunk(dict(base, **piece(''), **fake.final_stats(prompt, count, started)))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            else:
+                tokens = [token for token, _ in fake.generate(prompt)]
+                self._send_json(dict(base, **piece(''.join(tokens)),
+                                     **fake.final_stats(prompt, len(tokens), started)))
+
+    return Handler
+
+
+class FakeOllamaServer:
+    """Fake Ollama listening on a local port, served from a background thread"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **options):
+        self.fake = FakeOllama(**options)
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self.fake))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeOllamaServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--ttft', type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument('--tps', type=float, default=40.0, help="generated tokens per second")
+    parser.add_argument('--tokens', type=int, default=128, help="tokens per chat answer")
+    parser.add_argument('--embed-latency', type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument('--parallel', type=int, default=0, help="concurrent generations (0 = unlimited)")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, ttft=args.ttft, tokens_per_second=args.tps,
+                              response_tokens=args.tokens, embed_latency=args.embed_latency,
+                              parallel=args.parallel)
+    print(f"Fake Ollama listening on {server.url} (TTFT {args.ttft}s, {args.tps} tokens/s)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Fake vector store
+In-process stand-in for the parts of the Pinecone client NexNote uses (exact cosine search)
+"""
+
+import math
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+class FakeIndex:
+    """One index: vectors in a dict, queried by brute-force cosine similarity"""
+
+    def __init__(self, name: str, dimension: int, latency: float):
+        self.name = name
+        self.dimension = dimension
+        self.latency = latency
+        self._vectors: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Dict], **kwargs) -> Dict:
+        time.sleep(self.latency)
+        with self._lock:
+            for vector in vectors:
+                values = vector['values']
+                norm = math.sqrt(sum(v * v for v in values)) or 1.0
+                self._vectors[vector['id']] = {
+                    'id': vector['id'],
+                    'values': [v / norm for v in values],
+                    'metadata': vector.get('metadata', {})
+                }
+        return {'upserted_count': len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 10, include_metadata: bool = False, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        query = [v / norm for v in vector]
+        with self._lock:
+            scored = [(sum(a * b for a, b in zip(query, entry['values'])), entry)
+                      for entry in self._vectors.values()]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+
+        matches = []
+        for score, entry in scored[:top_k]:
+            match = {'id': entry['id'], 'score': score}
+            if include_metadata:
+                match['metadata'] = dict(entry['metadata'])
+            matches.append(match)
+        return {'matches': matches}
+
+    def describe_index_stats(self, **kwargs) -> Dict:
+        with self._lock:
+            return {'dimension': self.dimension, 'total_vector_count': len(self._vectors)}
+
+
+class FakePinecone:
+    """Drop-in for pinecone.Pinecone; all instances share the same indexes, like a real project"""
+
+    _indexes: Dict[str, FakeIndex] = {}
+    _lock = threading.Lock()
+    # Simulated round trip per data-plane call, in seconds
+    latency = 0.0
+
+    def __init__(self, api_key: Optional[str] = None, **kwargs):
+        self.api_key = api_key
+
+    def list_indexes(self) -> List[SimpleNamespace]:
+        with self._lock:
+            return [SimpleNamespace(name=name) for name in self._indexes]
+
+    def describe_index(self, name: str) -> SimpleNamespace:
+        with self._lock:
+            index = self._indexes[name]
+        return SimpleNamespace(name=name, dimension=index.dimension)
+
+    def create_index(self, name: str, dimension: int, **kwargs):
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = FakeIndex(name, dimension, self.latency)
+
+    def delete_index(self, name: str):
+        with self._lock:
+            self._indexes.pop(name, None)
+
+    def Index(self, name: str) -> FakeIndex:
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is None:
+                # Searching before the first upload finds an empty index
+                index = self._indexes[name] = FakeIndex(name, 768, self.latency)
+            return index
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._indexes.clear()
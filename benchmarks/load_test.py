@@ -0,0 +1,323 @@
+"""
+Load test
+Simulated students hitting NexNote concurrently, in stages of increasing concurrency
+
+Each virtual user has its own session and loops over a weighted mix of chat
+messages, chat-list refreshes (with ETags, like the UI), study tools, uploads
+and new chats, pausing for an exponentially distributed think time between
+requests. Every stage reports throughput, latency percentiles and error and
+"busy" rates, and the run reports where the app saturates.
+
+By default the app is served in-process over real HTTP against the fake Ollama
+server and vector store. Point --url at a running server (for example a
+production-mode server backed by `fake_ollama.py`) to test it instead; that
+also keeps the load generator out of the server's process.
+
+Usage: python benchmarks/load_test.py [--users 1 2 4 8 16 32] [--duration 30] [--think 2.0]
+                                      [--mix chat=60,chat_list=20,study=10,upload=5,new_chat=5]
+                                      [--url http://127.0.0.1:5000] [--output load.json]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_e2e import QUESTIONS, load_app, make_document
+from bench_utils import REPO_ROOT, summarize, write_results
+from fake_ollama import FakeOllamaServer
+
+OPERATIONS = ['chat', 'chat_list', 'study', 'upload', 'new_chat']
+DEFAULT_MIX = 'chat=60,chat_list=20,study=10,upload=5,new_chat=5'
+STUDY_TOOLS = [
+    ('/api/generate_summary', {}),
+    ('/api/generate_quiz', {'num_questions': 5}),
+    ('/api/extract_concepts', {}),
+    ('/api/generate_flashcards', {'num_cards': 10}),
+]
+# The reply chat sends when the LLM queue is full (see ollama_handler.BUSY_MESSAGE)
+BUSY_PREFIX = '⏳'
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse 'chat=60,study=10' into operation weights"""
+    mix = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+class Recorder:
+    """Outcomes of all requests in a stage: (operation, seconds, outcome)"""
+
+    def __init__(self):
+        self.samples: List[Tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, seconds: float, outcome: str):
+        with self._lock:
+            self.samples.append((operation, seconds, outcome))
+
+
+class VirtualUser(threading.Thread):
+    """One student: own cookies and chat, weighted random operations with think time"""
+
+    def __init__(self, index: int, base_url: str, mix: Dict[str, float], think: float, stop_at: float,
+                 recorder: Recorder, files: List[str], timeout: float):
+        super().__init__(name=f"user-{index}", daemon=True)
+        self.index = index
+        self.client = httpx.Client(base_url=base_url, timeout=timeout)
+        self.operations = list(mix)
+        self.weights = [mix[op] for op in self.operations]
+        self.think = think
+        self.stop_at = stop_at
+        self.recorder = recorder
+        self.files = files
+        self.rng = random.Random(index)
+        self.etag: Optional[str] = None
+        self.sent = 0
+
+    def run(self):
+        try:
+            # Users don't arrive in lockstep
+            self._pause(self.rng.uniform(0, self.think))
+            while time.monotonic() < self.stop_at:
+                operation = self.rng.choices(self.operations, self.weights)[0]
+                started = time.perf_counter()
+                try:
+                    outcome = getattr(self, f"_{operation}")()
+                except httpx.HTTPError:
+                    outcome = 'error'
+                self.recorder.add(operation, time.perf_counter() - started, outcome)
+                self._pause(self.rng.expovariate(1 / self.think) if self.think > 0 else 0)
+        finally:
+            self.client.close()
+
+    def _pause(self, seconds: float):
+        time.sleep(max(0.0, min(seconds, self.stop_at - time.monotonic())))
+
+    def _chat(self) -> str:
+        self.sent += 1
+        question = QUESTIONS[self.rng.randrange(len(QUESTIONS))]
+        response = self.client.post('/api/send_message', json={'message': f"{question} (user {self.index}, "
+                                                                          f"message {self.sent})"})
+        if response.status_code != 200:
+            return 'error'
+        return 'busy' if response.json().get('response', '').startswith(BUSY_PREFIX) else 'ok'
+
+    def _chat_list(self) -> str:
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        response = self.client.get('/api/get_chats', params={'limit': 20}, headers=headers)
+        if response.status_code == 200:
+            self.etag = response.headers.get('ETag')
+        return 'ok' if response.status_code in (200, 304) else 'error'
+
+    def _study(self) -> str:
+        if not self.files:
+            return 'error'
+        route, extra = STUDY_TOOLS[self.rng.randrange(len(STUDY_TOOLS))]
+        response = self.client.post(route, json=dict(extra, filename=self.rng.choice(self.files)))
+        return 'ok' if response.status_code == 200 else 'error'
+
+    def _upload(self) -> str:
+        name = f"user{self.index}_notes_{self.rng.randrange(1000)}.md"
+        data = make_document(self.rng.randrange(10 ** 6), 800).encode('utf-8')
+        response = self.client.post('/api/upload_files', files={'files[]': (name, data, 'text/markdown')})
+        return 'ok' if response.status_code == 200 else 'error'
+
+    def _new_chat(self) -> str:
+        response = self.client.post('/api/new_chat')
+        return 'ok' if response.status_code == 200 else 'error'
+
+
+def seed_documents(base_url: str, count: int, timeout: float) -> List[str]:
+    """Upload the documents the study tools will work on"""
+    names = []
+    with httpx.Client(base_url=base_url, timeout=timeout) as client:
+        for i in range(count):
+            name = f"course_notes_{i}.md"
+            data = make_document(5000 + i, 1500).encode('utf-8')
+            response = client.post('/api/upload_files', files={'files[]': (name, data, 'text/markdown')})
+            if response.status_code != 200:
+                raise RuntimeError(f"Seeding {name} failed: {response.status_code} {response.text[:200]}")
+            names.append(name)
+    return names
+
+
+def run_stage(base_url: str, users: int, duration: float, mix: Dict[str, float], think: float,
+              files: List[str], timeout: float) -> Dict:
+    recorder = Recorder()
+    started = time.monotonic()
+    stop_at = started + duration
+    threads = [VirtualUser(i, base_url, mix, think, stop_at, recorder, files, timeout) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    samples = recorder.samples
+    operations = {}
+    for operation in mix:
+        mine = [(seconds, outcome) for op, seconds, outcome in samples if op == operation]
+        operations[operation] = {
+            'requests': len(mine),
+            'errors': sum(1 for _, outcome in mine if outcome == 'error'),
+            'busy': sum(1 for _, outcome in mine if outcome == 'busy'),
+            'latency': summarize([seconds for seconds, outcome in mine if outcome == 'ok']),
+        }
+
+    total = len(samples)
+    errors = sum(1 for _, _, outcome in samples if outcome == 'error')
+    busy = sum(1 for _, _, outcome in samples if outcome == 'busy')
+    return {
+        'users': users,
+        'seconds': round(elapsed, 2),
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 3) if elapsed else 0.0,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'busy_rate': round(busy / total, 4) if total else 0.0,
+        'latency': summarize([seconds for _, seconds, outcome in samples if outcome == 'ok']),
+        'operations': operations,
+    }
+
+
+def find_saturation(stages: List[Dict], slo_ms: float, max_error_rate: float, slo_operation: str) -> Dict:
+    """Largest stage within the SLO, and the first stage where the app stopped keeping up
+
+    A stage is saturated when the SLO operation's p95 exceeds the SLO, errors plus
+    busy replies exceed the allowed rate, or throughput per user falls below half
+    of what the first stage achieved (requests are queueing instead of being served).
+    """
+    result = {'max_users_within_slo': None, 'saturated_at_users': None, 'reason': None,
+              'peak_throughput_rps': max((s['throughput_rps'] for s in stages), default=0.0)}
+    baseline = None
+    for stage in stages:
+        per_user = stage['throughput_rps'] / stage['users'] if stage['users'] else 0.0
+        if baseline is None:
+            baseline = per_user
+        p95 = stage['operations'].get(slo_operation, {}).get('latency', {}).get('p95_ms')
+        reasons = []
+        if p95 is not None and p95 > slo_ms:
+            reasons.append(f"{slo_operation} p95 {p95:.0f} ms > {slo_ms:.0f} ms")
+        if stage['error_rate'] + stage['busy_rate'] > max_error_rate:
+            reasons.append(f"error+busy rate {(stage['error_rate'] + stage['busy_rate']) * 100:.1f}%")
+        if baseline and per_user < baseline / 2:
+            reasons.append(f"throughput per user fell to {per_user / baseline * 100:.0f}% of the first stage")
+
+        if reasons:
+            if result['saturated_at_users'] is None:
+                result['saturated_at_users'] = stage['users']
+                result['reason'] = '; '.join(reasons)
+        elif result['saturated_at_users'] is None:
+            result['max_users_within_slo'] = stage['users']
+    return result
+
+
+def serve_in_process(args, workdir: Path) -> Tuple[str, object, FakeOllamaServer]:
+    """Start the fake Ollama server and the app on a threaded local HTTP server"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    fake = FakeOllamaServer(ttft=args.ttft, tokens_per_second=args.tps, response_tokens=args.tokens,
+                            embed_latency=args.embed_latency, parallel=args.ollama_parallel).start()
+    os.environ['LLM_MAX_CONCURRENCY'] = str(args.llm_concurrency)
+    server = make_server('127.0.0.1', 0, load_app(fake.url, workdir), threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="nexnote-http", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server, fake
+
+
+def print_stage(stage: Dict):
+    latency = stage['latency']
+    chat = stage['operations'].get('chat', {}).get('latency', {})
+    print(f"{stage['users']:>6} {stage['throughput_rps']:>9.2f} {latency.get('p50_ms', 0):>9.1f} "
+          f"{latency.get('p95_ms', 0):>9.1f} {latency.get('p99_ms', 0):>9.1f} {chat.get('p95_ms', 0):>11.1f} "
+          f"{stage['error_rate'] * 100:>7.2f}% {stage['busy_rate'] * 100:>6.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NexNote concurrent-user load test")
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help="concurrent users per stage")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds per stage")
+    parser.add_argument('--think', type=float, default=2.0, help="mean think time between requests (s)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="operation weights")
+    parser.add_argument('--timeout', type=float, default=120.0, help="per-request timeout (s)")
+    parser.add_argument('--seed-docs', type=int, default=3, help="documents uploaded for the study tools")
+    parser.add_argument('--slo-ms', type=float, default=5000.0, help="chat p95 latency objective (ms)")
+    parser.add_argument('--slo-operation', default='chat', choices=OPERATIONS)
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="allowed errors + busy replies")
+    parser.add_argument('--url', help="test a running server instead of an in-process one")
+    parser.add_argument('--ttft', type=float, default=0.2, help="fake Ollama time to first token (s)")
+    parser.add_argument('--tps', type=float, default=40.0, help="fake Ollama tokens per second")
+    parser.add_argument('--tokens', type=int, default=64, help="tokens per fake answer")
+    parser.add_argument('--embed-latency', type=float, default=0.01, help="fake embedding call latency (s)")
+    parser.add_argument('--ollama-parallel', type=int, default=4, help="fake Ollama parallel generations")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="app LLM_MAX_CONCURRENCY (in-process)")
+    parser.add_argument('--output', default='benchmark_load.json', help="results file")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    output = Path(args.output).resolve()
+    workdir = Path(tempfile.mkdtemp(prefix='nexnote-load-'))
+    server = fake = None
+    stages = []
+
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            base_url, server, fake = serve_in_process(args, workdir)
+        print(f"Target: {base_url}")
+        files = seed_documents(base_url, args.seed_docs, args.timeout) if mix.get('study') else []
+
+        print(f"\n{'users':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'chat p95':>11} "
+              f"{'errors':>8} {'busy':>7}")
+        for users in args.users:
+            stage = run_stage(base_url, users, args.duration, mix, args.think, files, args.timeout)
+            stages.append(stage)
+            print_stage(stage)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if fake is not None:
+            fake.stop()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    saturation = find_saturation(stages, args.slo_ms, args.max_error_rate, args.slo_operation)
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    config['mix'] = mix
+    write_results(str(output), 'load', config, {'stages': stages, 'saturation': saturation})
+
+    print(f"\nPeak throughput: {saturation['peak_throughput_rps']} req/s")
+    print(f"Max users within SLO: {saturation['max_users_within_slo']}")
+    if saturation['saturated_at_users'] is not None:
+        print(f"Saturated at {saturation['saturated_at_users']} users: {saturation['reason']}")
+    else:
+        print("No saturation within the tested range")
+
+
+if __name__ == '__main__':
+    main()
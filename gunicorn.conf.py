@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration for production serving
+Start with: gunicorn -c gunicorn.conf.py
+
+Each worker process imports app.py and calls create_app(), which builds the
+Flask app and runs the per-worker start-up (model warm-up, background jobs)
+once. Sessions, chat history and the shared cache live in SQLite files that all
+workers share, so any worker can serve any request. Settings come from the
+environment (.env) and can be overridden on the command line (-w, --threads, -b).
+"""
+
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+wsgi_app = "app:create_app()"
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Worker processes scale request handling with cores; threads keep each
+# worker busy while its requests wait on Ollama, Pinecone or disk
+workers = int(os.getenv('WEB_WORKERS', '0')) or multiprocessing.cpu_count()
+threads = int(os.getenv('WEB_THREADS', '8'))
+worker_class = "gthread"
+
+# Generation can take minutes on CPU; the client timeout is OLLAMA_TIMEOUT
+timeout = int(os.getenv('WEB_TIMEOUT', '330'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+
+# Background threads (warm-up, archiver, trace export) must start in each
+# worker, after the fork
+preload_app = False
+
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    workers_count = server.cfg.workers
+    print(f"🚀 NexNote: {workers_count} workers x {server.cfg.threads} threads on {server.cfg.bind[0]}")
+    if workers_count > 1 and os.getenv('SESSION_BACKEND', 'sqlite').lower() == 'memory':
+        print("⚠️  SESSION_BACKEND=memory keeps sessions per worker; use sqlite with several workers")
+    if workers_count > 1:
+        print("   /metrics and /api/admin/* report on one worker per request (see DEPLOYMENT.md)")
+    concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '1'))
+    print(f"   Up to {workers_count * concurrency} concurrent Ollama generations "
+          f"(LLM_MAX_CONCURRENCY={concurrency} per worker)")
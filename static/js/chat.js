@@ -328,6 +328,11 @@ document.addEventListener('DOMContentLoaded', function() {
                     }
                 }
                 
+                // Move this chat to the top of the sidebar (fetches only the delta)
+                if (typeof refreshChatHistory === 'function') {
+                    refreshChatHistory();
+                }
+                
                 // Show sources if available
                 if (data.sources && data.sources.length > 0) {
                     showSources(data.sources);
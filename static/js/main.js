@@ -61,41 +61,147 @@ function showLoading(elementId) {
 
 // ==================== CHAT HISTORY ====================
 
+const CHAT_PAGE_SIZE = 30;
+
+// Sidebar list state: chats are fetched a page at a time and later refreshed
+// with deltas since the last seen list version
+const chatHistoryState = {
+    version: null,
+    cursor: null,
+    loading: false,
+    initialized: false
+};
+
+function renderChatItem(chat) {
+    const item = document.createElement('div');
+    item.className = 'chat-item';
+    item.dataset.chatId = chat.id;
+    item.innerHTML = `
+        <button class="chat-btn" onclick="loadChat('${chat.id}')">
+            💬 ${chat.title}
+        </button>
+        <button class="delete-btn" onclick="deleteChat('${chat.id}')" title="Delete">
+            🗑️
+        </button>
+        <small class="chat-meta">
+            ${new Date(chat.timestamp).toLocaleDateString()} • ${chat.message_count} msgs
+        </small>
+    `;
+    return item;
+}
+
+function getChatListElement() {
+    const container = document.getElementById('chatHistoryContainer');
+    let list = container.querySelector('.chat-list');
+    if (!list) {
+        container.innerHTML = '<div class="chat-list"></div>';
+        list = container.querySelector('.chat-list');
+    }
+    return list;
+}
+
+function showEmptyChatHistory() {
+    const container = document.getElementById('chatHistoryContainer');
+    if (!container.querySelector('.chat-item')) {
+        container.innerHTML = '<p class="text-muted">💭 No chat history yet</p>';
+    }
+}
+
 function loadChatHistory() {
-    fetch('/api/get_chats')
+    // First page; further pages load as the sidebar is scrolled
+    chatHistoryState.version = null;
+    chatHistoryState.cursor = null;
+    loadMoreChats(true);
+    
+    if (!chatHistoryState.initialized) {
+        chatHistoryState.initialized = true;
+        const container = document.getElementById('chatHistoryContainer');
+        container.addEventListener('scroll', function() {
+            if (container.scrollTop + container.clientHeight >= container.scrollHeight - 50) {
+                loadMoreChats(false);
+            }
+        });
+    }
+}
+
+function loadMoreChats(reset) {
+    if (chatHistoryState.loading || (!reset && !chatHistoryState.cursor)) {
+        return;
+    }
+    chatHistoryState.loading = true;
+    
+    const params = new URLSearchParams({ limit: CHAT_PAGE_SIZE });
+    if (!reset) params.set('cursor', chatHistoryState.cursor);
+    
+    fetch(`/api/get_chats?${params}`)
         .then(response => response.json())
         .then(data => {
             const container = document.getElementById('chatHistoryContainer');
             const loading = document.getElementById('chatHistoryLoading');
             
             if (loading) loading.remove();
+            if (reset) container.innerHTML = '';
             
             if (data.chats && data.chats.length > 0) {
-                container.innerHTML = `
-                    <div class="chat-list">
-                        ${data.chats.map(chat => `
-                            <div class="chat-item">
-                                <button class="chat-btn" onclick="loadChat('${chat.id}')">
-                                    💬 ${chat.title}
-                                </button>
-                                <button class="delete-btn" onclick="deleteChat('${chat.id}')" title="Delete">
-                                    🗑️
-                                </button>
-                                <small class="chat-meta">
-                                    ${new Date(chat.timestamp).toLocaleDateString()} • ${chat.message_count} msgs
-                                </small>
-                            </div>
-                        `).join('')}
-                    </div>
-                `;
+                const list = getChatListElement();
+                data.chats.forEach(chat => {
+                    if (!list.querySelector(`[data-chat-id="${chat.id}"]`)) {
+                        list.appendChild(renderChatItem(chat));
+                    }
+                });
             } else {
-                container.innerHTML = '<p class="text-muted">💭 No chat history yet</p>';
+                showEmptyChatHistory();
+            }
+            
+            if (reset || chatHistoryState.version === null) {
+                chatHistoryState.version = data.version;
             }
+            chatHistoryState.cursor = data.next_cursor || null;
         })
         .catch(error => {
             console.error('Error loading chat history:', error);
             const container = document.getElementById('chatHistoryContainer');
-            container.innerHTML = '<p class="text-muted">Error loading chats</p>';
+            if (reset) container.innerHTML = '<p class="text-muted">Error loading chats</p>';
+        })
+        .finally(() => {
+            chatHistoryState.loading = false;
+        });
+}
+
+function refreshChatHistory() {
+    // Only fetch what changed since the list was loaded; the store's version
+    // counter makes an unchanged list a cheap revalidation
+    if (chatHistoryState.version === null || chatHistoryState.version === undefined) {
+        loadChatHistory();
+        return;
+    }
+    
+    fetch(`/api/get_chats?since=${chatHistoryState.version}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.full || !data.changed) {
+                loadChatHistory();
+                return;
+            }
+            
+            const list = getChatListElement();
+            data.deleted.forEach(chatId => {
+                const item = list.querySelector(`[data-chat-id="${chatId}"]`);
+                if (item) item.remove();
+            });
+            
+            // Changed chats are newest first, so they go to the top in order
+            data.changed.slice().reverse().forEach(chat => {
+                const existing = list.querySelector(`[data-chat-id="${chat.id}"]`);
+                if (existing) existing.remove();
+                list.insertBefore(renderChatItem(chat), list.firstChild);
+            });
+            
+            if (!list.children.length) showEmptyChatHistory();
+            chatHistoryState.version = data.version;
+        })
+        .catch(error => {
+            console.error('Error refreshing chat history:', error);
         });
 }
 
@@ -144,7 +250,7 @@ function deleteChat(chatId) {
     .then(data => {
         if (data.success) {
             showToast('Chat deleted', 'success');
-            loadChatHistory();
+            refreshChatHistory();
         } else {
             showToast('Error deleting chat', 'error');
         }
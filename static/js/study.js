@@ -277,6 +277,9 @@ async function generateFlashcards() {
             currentFlashcards = data.flashcards;
             currentCard = 0;
             displayFlashcard();
+            if (data.deck && data.deck.added > 0) {
+                showToast(`${data.deck.added} cards saved to your review deck`, 'success');
+            }
         }
     } catch (error) {
         console.error('Error generating flashcards:', error);
@@ -345,6 +348,95 @@ function nextCard() {
     }
 }
 
+// ==================== SPACED REPETITION ====================
+
+let reviewQueue = [];
+
+async function startReview() {
+    // Deck is the selected note, or every deck when none is selected
+    const deck = document.getElementById('flashcardsFileSelect').value;
+    const resultDiv = document.getElementById('flashcardsResult');
+    resultDiv.innerHTML = '<div class="loading">Loading due cards...</div>';
+    
+    try {
+        const params = new URLSearchParams({ limit: 50 });
+        if (deck) params.set('deck', deck);
+        const response = await fetch(`/api/flashcards/due?${params}`);
+        const data = await response.json();
+        
+        if (data.error) {
+            resultDiv.innerHTML = `<div class="status-item error">❌ ${data.error}</div>`;
+            return;
+        }
+        reviewQueue = data.cards;
+        displayReviewCard();
+    } catch (error) {
+        console.error('Error loading due cards:', error);
+        resultDiv.innerHTML = '<div class="status-item error">❌ Error loading due cards</div>';
+    }
+}
+
+function displayReviewCard() {
+    const resultDiv = document.getElementById('flashcardsResult');
+    
+    if (reviewQueue.length === 0) {
+        resultDiv.innerHTML = '<p class="text-muted">🎉 No cards due right now. Come back later!</p>';
+        return;
+    }
+    
+    const card = reviewQueue[0];
+    resultDiv.innerHTML = `
+        <div class="flashcard-container">
+            <p style="text-align: center; margin-bottom: 1rem; color: var(--text-secondary);">
+                ${reviewQueue.length} card${reviewQueue.length === 1 ? '' : 's'} due
+            </p>
+            <div class="flashcard" id="flashcard" style="background: var(--primary-color); padding: 3rem 2rem; border-radius: 1rem; min-height: 200px; display: flex; align-items: center; justify-content: center; text-align: center; cursor: pointer; margin-bottom: 1.5rem;" onclick="flipCard()">
+                <div class="card-front" id="cardFront">
+                    <h3>${card.front}</h3>
+                </div>
+                <div class="card-back" id="cardBack" style="display: none;">
+                    <p style="font-size: 1.1rem;">${card.back}</p>
+                </div>
+            </div>
+            <div style="display: flex; gap: 1rem; justify-content: center; flex-wrap: wrap;">
+                <button class="btn btn-outline" onclick="submitReview(1)">😣 Again</button>
+                <button class="btn btn-outline" onclick="submitReview(3)">🤔 Hard</button>
+                <button class="btn btn-secondary" onclick="submitReview(4)">🙂 Good</button>
+                <button class="btn btn-primary" onclick="submitReview(5)">😎 Easy</button>
+            </div>
+        </div>
+    `;
+}
+
+async function submitReview(quality) {
+    const card = reviewQueue[0];
+    if (!card) return;
+    
+    try {
+        const response = await fetch('/api/flashcards/review', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ card_id: card.id, quality: quality })
+        });
+        const data = await response.json();
+        
+        if (data.error) {
+            showToast(data.error, 'error');
+            return;
+        }
+        
+        reviewQueue.shift();
+        // Failed cards come back later in the same session
+        if (quality < 3) reviewQueue.push(card);
+        displayReviewCard();
+    } catch (error) {
+        console.error('Error recording review:', error);
+        showToast('Error recording review', 'error');
+    }
+}
+
 // ==================== PROGRESS ====================
 
 async function loadStudyProgress() {
@@ -368,11 +460,8 @@ async function loadStudyProgress() {
             let html = '<div class="progress-list">';
             
             for (const [filename, data] of Object.entries(progress)) {
-                const sessions = data.sessions || [];
-                const scoredSessions = sessions.filter(s => s.score !== null && s.score !== undefined);
-                const avgScore = scoredSessions.length > 0 
-                    ? scoredSessions.reduce((sum, s) => sum + s.score, 0) / scoredSessions.length 
-                    : 0;
+                // Summaries are precomputed server-side; no session replay needed
+                const recentScores = data.recent_scores || [];
                 
                 html += `
                     <details class="progress-item" style="margin-bottom: 1rem; background: var(--dark-bg); border-radius: 0.5rem; padding: 1rem;">
@@ -380,17 +469,18 @@ async function loadStudyProgress() {
                             📄 ${filename}
                         </summary>
                         <div style="margin-top: 1rem; padding-top: 1rem; border-top: 1px solid var(--border-color);">
-                            <p><strong>Total Sessions:</strong> ${sessions.length}</p>
-                            ${scoredSessions.length > 0 ? `<p><strong>Average Score:</strong> ${avgScore.toFixed(0)}%</p>` : ''}
+                            <p><strong>Total Sessions:</strong> ${data.session_count}</p>
+                            ${data.scored_sessions > 0 ? `<p><strong>Average Score:</strong> ${data.average_score.toFixed(0)}%</p>` : ''}
+                            ${data.scored_sessions > 1 ? `<p><strong>Recent Trend:</strong> ${data.rolling_average.toFixed(0)}%</p>` : ''}
                             <p><strong>First Studied:</strong> ${new Date(data.first_studied).toLocaleDateString()}</p>
                             <p><strong>Last Studied:</strong> ${new Date(data.last_studied).toLocaleDateString()}</p>
                             
-                            ${scoredSessions.length > 0 ? `
+                            ${recentScores.length > 0 ? `
                                 <div style="margin-top: 1rem;">
                                     <strong>Recent Scores:</strong>
                                     <div style="display: flex; gap: 0.5rem; margin-top: 0.5rem; flex-wrap: wrap;">
-                                        ${scoredSessions.slice(-5).map(s => `
-                                            <span class="badge ${s.score >= 70 ? 'badge-success' : 'badge-secondary'}">${s.score}%</span>
+                                        ${recentScores.map(score => `
+                                            <span class="badge ${score >= 70 ? 'badge-success' : 'badge-secondary'}">${score}%</span>
                                         `).join('')}
                                     </div>
                                 </div>
@@ -0,0 +1,17 @@
+import pytest
+
+from utils import chat_history
+from utils.chat_archive import ChatArchive
+from utils.chat_history import ConversationCache
+from utils.chat_store_sqlite import SQLiteChatStore
+
+
+@pytest.fixture
+def chat_env(tmp_path, monkeypatch):
+    """Point the chat store, archive and conversation cache at a temp directory"""
+    store = SQLiteChatStore(tmp_path / 'chats.db')
+    archive = ChatArchive(tmp_path / 'archive')
+    monkeypatch.setattr(chat_history, '_store', store)
+    monkeypatch.setattr(chat_history, '_archive', archive)
+    monkeypatch.setattr(chat_history, '_conversations', ConversationCache(8))
+    return store, archive
@@ -0,0 +1,80 @@
+import pytest
+
+import app as nexnote
+from utils import chat_history
+
+
+@pytest.fixture
+def client(chat_env, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SESSION_BACKEND', 'memory')
+    monkeypatch.setenv('OLLAMA_WARMUP', 'false')
+    monkeypatch.setenv('CHAT_ARCHIVE_DAYS', '0')
+    monkeypatch.setattr(nexnote, 'ADMIN_TOKEN', 'secret')
+    return nexnote.create_app({'TESTING': True}).test_client()
+
+
+def test_create_app_builds_a_new_app_each_time(client):
+    first = nexnote.create_app({'TESTING': True, 'UPLOAD_FOLDER': 'a'})
+    second = nexnote.create_app({'UPLOAD_FOLDER': 'b'})
+    assert first is not second
+    assert (first.config['UPLOAD_FOLDER'], second.config['UPLOAD_FOLDER']) == ('a', 'b')
+    assert 'main.get_chats' in second.view_functions
+
+
+@pytest.mark.parametrize('method, path', [
+    ('POST', '/api/admin/chat_archive'),
+    ('GET', '/api/admin/traces'),
+    ('GET', '/api/admin/profile'),
+])
+def test_admin_routes_need_the_token(client, method, path):
+    assert client.open(path, method=method).status_code == 401
+    assert client.open(path, method=method, headers={'X-Admin-Token': 'wrong'}).status_code == 401
+    assert client.open(path, method=method, headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_metrics_need_the_token_only_once_one_is_set(client, monkeypatch):
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert b'nexnote_http_requests_total' in response.data
+
+    monkeypatch.setattr(nexnote, 'ADMIN_TOKEN', '')
+    assert client.get('/metrics').status_code == 200
+
+
+def test_admin_routes_are_off_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(nexnote, 'ADMIN_TOKEN', '')
+    assert client.post('/api/admin/chat_archive', headers={'X-Admin-Token': ''}).status_code == 403
+
+
+def test_chat_list_revalidates_with_etags(client):
+    chat_history.append_chat_messages('c1', [{'role': 'user', 'content': 'hi'}], title='First')
+    first = client.get('/api/get_chats?limit=20')
+    assert first.status_code == 200
+    assert [c['id'] for c in first.get_json()['chats']] == ['c1']
+
+    etag = first.headers['ETag']
+    assert client.get('/api/get_chats?limit=20', headers={'If-None-Match': etag}).status_code == 304
+
+    chat_history.append_chat_messages('c2', [{'role': 'user', 'content': 'hello'}], title='Second')
+    changed = client.get('/api/get_chats?limit=20', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_responses_carry_a_request_id_and_pages_render(client):
+    response = client.get('/', headers={'X-Request-ID': 'req-42'})
+    assert response.status_code == 200
+    assert response.headers['X-Request-ID'] == 'req-42'
+    assert b'href="/chat"' in response.data
+    assert client.get('/no-such-page').status_code == 404
+
+
+def test_new_chats_in_the_same_second_get_different_ids(client):
+    ids = set()
+    for _ in range(20):
+        client.post('/api/new_chat')
+        with client.session_transaction() as sess:
+            ids.add(sess['current_chat_id'])
+    assert len(ids) == 20
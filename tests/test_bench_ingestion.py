@@ -0,0 +1,40 @@
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from bench_ingestion import FORMATS, GENERATORS, STAGES, _pages, run_stages
+from fake_ollama import FakeOllamaServer
+from fake_vector_store import FakeIndex
+from utils import ollama_client
+from utils.pinecone_handler import extract_text_from_file
+
+
+@pytest.mark.parametrize('file_type', FORMATS)
+def test_generated_documents_extract_every_page(file_type):
+    pages = _pages(3, 50)
+    data = GENERATORS[file_type](pages)
+    text = extract_text_from_file(FileStorage(stream=io.BytesIO(data), filename=f"doc.{file_type}"))
+    words = text.split()
+    # Headings and page markers may add a few words, but nothing is lost
+    assert len(words) >= 150
+    for page in pages:
+        assert page.split()[0].strip('.,') in text
+
+
+def test_run_stages_times_every_stage(monkeypatch):
+    server = FakeOllamaServer(ttft=0).start()
+    monkeypatch.setenv('OLLAMA_HOST', server.url)
+    monkeypatch.setenv('OLLAMA_HOSTS', '')
+    monkeypatch.setenv('SHARED_CACHE', 'false')
+    monkeypatch.setattr(ollama_client, '_clients', {})
+    try:
+        index = FakeIndex('notes', 768, latency=0)
+        seconds, sizes = run_stages('notes.md', GENERATORS['md'](_pages(2, 200)), index)
+    finally:
+        server.stop()
+
+    assert list(seconds) == STAGES
+    assert sizes['chunks'] > 0
+    assert sizes['embedded'] == sizes['chunks']
+    assert index.describe_index_stats()['total_vector_count'] == sizes['chunks']
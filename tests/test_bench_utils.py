@@ -0,0 +1,62 @@
+import json
+
+import ollama
+import pytest
+
+from bench_utils import compare_results, flatten_metrics, percentile, summarize, write_results
+from fake_ollama import FakeOllamaServer, embed
+from fake_vector_store import FakeIndex
+
+
+def test_percentile_interpolates_between_ranks():
+    samples = [4.0, 1.0, 3.0, 2.0]
+    assert percentile(samples, 0) == 1.0
+    assert percentile(samples, 50) == 2.5
+    assert percentile(samples, 100) == 4.0
+    assert percentile([], 95) == 0.0
+
+
+def test_summarize_reports_milliseconds():
+    summary = summarize([0.010, 0.020, 0.030])
+    assert (summary['count'], summary['p50_ms'], summary['max_ms']) == (3, 20.0, 30.0)
+    assert summarize([]) == {'count': 0}
+
+
+def test_results_round_trip_and_compare(tmp_path):
+    before = write_results(str(tmp_path / 'before.json'), 'e2e', {'runs': 1},
+                           {'chat': {'p50_ms': 100.0, 'ok': True}, 'errors': 0})
+    after = json.loads((tmp_path / 'before.json').read_text())
+    after['metrics']['chat']['p50_ms'] = 80.0
+    assert flatten_metrics(before['metrics']) == {'chat.p50_ms': 100.0, 'errors': 0}
+    rows = {key: change for key, _, _, change in compare_results(before, after)}
+    assert rows == {'chat.p50_ms': pytest.approx(-20.0), 'errors': None}
+
+
+def test_fake_embeddings_put_related_texts_closer():
+    def cosine(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    query = embed("photosynthesis in plants")
+    assert embed("photosynthesis in plants") == query
+    assert cosine(query, embed("plants use photosynthesis")) > cosine(query, embed("tcp congestion control"))
+
+    index = FakeIndex('notes', len(query), latency=0)
+    index.upsert([{'id': 'bio', 'values': embed("plants use photosynthesis"), 'metadata': {'f': 'bio.md'}},
+                  {'id': 'net', 'values': embed("tcp congestion control"), 'metadata': {'f': 'net.md'}}])
+    matches = index.query(query, top_k=1, include_metadata=True)['matches']
+    assert [(m['id'], m['metadata']) for m in matches] == [('bio', {'f': 'bio.md'})]
+
+
+def test_fake_ollama_answers_deterministically_over_http():
+    server = FakeOllamaServer(ttft=0, tokens_per_second=0, response_tokens=8).start()
+    try:
+        client = ollama.Client(host=server.url)
+        messages = [{'role': 'user', 'content': 'What is osmosis?'}]
+        first = client.chat(model='m', messages=messages)
+        assert first['message']['content'] == client.chat(model='m', messages=messages)['message']['content']
+        streamed = ''.join(part['message']['content'] for part in client.chat(model='m', messages=messages,
+                                                                             stream=True))
+        assert streamed == first['message']['content']
+        assert server.fake.requests['/api/chat'] == 3
+    finally:
+        server.stop()
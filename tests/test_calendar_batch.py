@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pytz')
+
+from benchmarks.fake_calendar import FakeCalendarApi
+from utils.calendar_manager import CalendarManager, normalize_rrule
+from utils.calendar_sync import EventCache
+
+
+@pytest.fixture
+def manager(tmp_path):
+    api = FakeCalendarApi()
+    return CalendarManager(api=api, cache=EventCache(tmp_path / 'calendar.db')), api
+
+
+def sessions(n, start=None):
+    start = start or datetime.now().replace(microsecond=0) + timedelta(days=1)
+    return [{'title': f"Session {i}", 'start_time': start + timedelta(days=i)} for i in range(n)]
+
+
+def test_a_semester_of_sessions_takes_few_round_trips(manager):
+    calendar, api = manager
+    result = calendar.create_events(sessions(60))
+    assert len(result['created']) == 60
+    assert result['failed'] == []
+    assert api.calls['batch'] == 2
+    assert api.calls['insert'] == 0
+    assert len(calendar.get_sync().cache.upcoming('primary', limit=100)) == 60
+
+
+def test_invalid_items_fail_individually(manager):
+    calendar, api = manager
+    items = sessions(3)
+    items[1] = {'title': 'No start'}
+    items.append({'title': 'Bad duration', 'start_time': datetime.now(), 'duration_minutes': 'long'})
+    result = calendar.create_events(items)
+    assert [c['index'] for c in result['created']] == [0, 2]
+    assert [f['index'] for f in result['failed']] == [1, 3]
+    assert len(api.events('primary')) == 2
+
+
+def test_recurring_plans_are_one_bounded_event(manager):
+    calendar, api = manager
+    assert normalize_rrule('freq=weekly;byday=mo,we;count=30') == 'RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=30'
+    assert normalize_rrule('FREQ=WEEKLY') is None
+    assert normalize_rrule('FREQ=HOURLY;COUNT=3') is None
+    assert calendar.create_recurring_event('Forever', datetime.now(), 'FREQ=DAILY') is None
+
+    event = calendar.create_recurring_event('Review', datetime.now() + timedelta(days=1),
+                                            'FREQ=WEEKLY;BYDAY=MO;COUNT=10')
+    assert event['recurrence'] == ['RRULE:FREQ=WEEKLY;BYDAY=MO;COUNT=10']
+    assert api.calls['insert'] == 1
@@ -0,0 +1,67 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+
+from google.auth.exceptions import RefreshError
+
+from utils import calendar_manager
+from utils.calendar_manager import CalendarService
+
+
+class _Creds:
+    def __init__(self, expires_in):
+        self.expiry = datetime.utcnow() + expires_in
+        self.refresh_token = 'refresh'
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    builds, creds = [], _Creds(timedelta(hours=1))
+    monkeypatch.setattr(CalendarService, '_load_credentials', lambda self, allow_flow: creds)
+    monkeypatch.setattr(CalendarService, '_save_credentials', lambda self, c: None)
+    monkeypatch.setattr(calendar_manager, 'build', lambda *a, **k: builds.append(k) or object())
+    return CalendarService(), builds, creds
+
+
+def test_service_is_built_once_and_shared_across_threads(service):
+    holder, builds, _ = service
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(holder.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(builds) == 1
+    assert builds[0]['static_discovery'] is True
+    assert len({id(r) for r in results}) == 1
+
+
+def test_token_is_refreshed_shortly_before_expiry(service):
+    holder, _, creds = service
+    holder.get()
+    assert creds.refreshes == 0
+    creds.expiry = datetime.utcnow() + timedelta(minutes=2)
+    holder.get()
+    assert creds.refreshes == 1
+
+
+def test_revoked_token_resets_the_holder(service):
+    holder, builds, _ = service
+    holder.get()
+
+    class _Request:
+        def execute(self, http):
+            raise RefreshError('revoked')
+
+    with pytest.raises(RefreshError):
+        holder.execute(_Request())
+    holder.get()
+    assert len(builds) == 2
@@ -0,0 +1,63 @@
+import time
+from datetime import datetime, time as dt_time, timezone
+
+from utils.calendar_slots import FreeSlotFinder, busy_intervals, merge_intervals
+
+UTC = timezone.utc
+# A Monday
+DAY = datetime(2026, 3, 2, tzinfo=UTC)
+
+
+def at(hour, minute=0, day=0):
+    return DAY.replace(day=DAY.day + day, hour=hour, minute=minute).timestamp()
+
+
+def hours(slots):
+    return [(s['start'].day - DAY.day, s['start'].strftime('%H:%M'), s['end'].strftime('%H:%M')) for s in slots]
+
+
+def test_merge_intervals_sorts_and_joins_overlaps():
+    assert merge_intervals([(5, 6), (1, 3), (2, 4), (4, 4.5), (9, 8)]) == [(1, 4.5), (5, 6)]
+
+
+def test_busy_intervals_skip_free_and_all_day_events():
+    events = [
+        {'start': {'dateTime': '2026-03-02T10:00:00Z'}, 'end': {'dateTime': '2026-03-02T11:00:00Z'}},
+        {'start': {'dateTime': '2026-03-02T12:00:00Z'}, 'end': {'dateTime': '2026-03-02T13:00:00Z'},
+         'transparency': 'transparent'},
+        {'start': {'date': '2026-03-02'}, 'end': {'date': '2026-03-03'}},
+        {'start': {'date': '2026-03-04'}, 'end': {'date': '2026-03-05'}, 'transparency': 'opaque'},
+        {'status': 'cancelled', 'start': {'dateTime': '2026-03-02T14:00:00Z'},
+         'end': {'dateTime': '2026-03-02T15:00:00Z'}},
+    ]
+    assert len(busy_intervals(events)) == 2
+
+
+def test_slots_avoid_busy_time_and_keep_the_gap():
+    finder = FreeSlotFinder([(at(9), at(10)), (at(11, 30), at(13))], UTC, min_gap_minutes=15)
+    slots = finder.find(DAY, DAY.replace(hour=23), duration_minutes=60, count=3,
+                        work_start=dt_time(9), work_end=dt_time(17), max_per_day=None)
+    assert hours(slots) == [(0, '10:15', '11:15'), (0, '13:15', '14:15'), (0, '14:30', '15:30')]
+
+
+def test_slots_spread_across_days_and_respect_weekdays():
+    finder = FreeSlotFinder([], UTC)
+    slots = finder.find(DAY, DAY.replace(day=8), duration_minutes=90, count=3,
+                        work_start=dt_time(18), work_end=dt_time(21), weekdays=[0, 2, 4])
+    assert hours(slots) == [(0, '18:00', '19:30'), (2, '18:00', '19:30'), (4, '18:00', '19:30')]
+
+
+def test_a_fully_booked_window_has_no_slots():
+    finder = FreeSlotFinder([(at(8), at(22))], UTC)
+    assert finder.find(DAY, DAY.replace(hour=23), count=2) == []
+
+
+def test_months_of_busy_intervals_stay_fast():
+    # Half-hour meetings on every hour from 9:00 to 18:00 for four months
+    busy = [(at(9) + d * 86400 + h * 3600, at(9) + d * 86400 + h * 3600 + 1800)
+            for d in range(120) for h in range(10)]
+    finder = FreeSlotFinder(busy, UTC, min_gap_minutes=10)
+    started = time.perf_counter()
+    slots = finder.find(DAY, DAY.replace(month=6), duration_minutes=120, count=20, max_per_day=None)
+    assert time.perf_counter() - started < 0.05
+    assert all(s['end'].hour >= 19 for s in slots)
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from benchmarks.fake_calendar import FakeCalendarApi
+from utils.calendar_sync import CalendarSync, EventCache
+
+
+def timed(title, hours_from_now, length=1):
+    start = time.gmtime(time.time() + hours_from_now * 3600)
+    end = time.gmtime(time.time() + (hours_from_now + length) * 3600)
+    return {
+        'summary': title,
+        'start': {'dateTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', start)},
+        'end': {'dateTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', end)},
+    }
+
+
+@pytest.fixture
+def calendar(tmp_path):
+    api = FakeCalendarApi(page_size=2)
+    sync = CalendarSync(api, EventCache(tmp_path / 'calendar.db'), max_age=3600)
+    return api, sync
+
+
+def titles(events):
+    return sorted(e['summary'] for e in events)
+
+
+def test_first_read_does_a_full_sync_then_reads_hit_the_cache(calendar):
+    api, sync = calendar
+    for i in range(3):
+        api.add_event('primary', timed(f"event {i}", i + 1))
+
+    assert titles(sync.upcoming()) == ['event 0', 'event 1', 'event 2']
+    assert sync.stats['full_syncs'] == 1
+    # Three events over two pages
+    assert api.calls['list'] == 2
+
+    sync.upcoming()
+    assert api.calls['list'] == 2
+
+
+def test_sync_token_round_trip_fetches_only_changes(calendar):
+    api, sync = calendar
+    kept = api.add_event('primary', timed("kept", 1))
+    dropped = api.add_event('primary', timed("dropped", 2))
+    assert sync.sync() == 'full'
+    token = sync.cache.sync_state('primary')['sync_token']
+
+    api.add_event('primary', timed("added on a phone", 3))
+    api.delete_event('primary', dropped['id'])
+    calls = api.calls['list']
+    assert sync.sync() == 'incremental'
+    assert api.calls['list'] == calls + 1
+    assert titles(sync.cache.upcoming('primary')) == ['added on a phone', 'kept']
+    assert sync.cache.sync_state('primary')['sync_token'] != token
+
+    # Nothing changed: still an incremental sync, still one page
+    assert sync.sync() == 'incremental'
+    assert kept['id'] in {e['id'] for e in sync.cache.upcoming('primary')}
+
+
+def test_expired_sync_token_falls_back_to_a_full_resync(calendar):
+    api, sync = calendar
+    api.add_event('primary', timed("before", 1))
+    sync.sync()
+
+    api.add_event('primary', timed("after", 2))
+    api.expire_sync_tokens()
+    assert sync.sync() == 'full'
+    assert sync.stats['full_syncs'] == 2
+    assert titles(sync.cache.upcoming('primary')) == ['after', 'before']
+    assert sync.sync() == 'incremental'
+
+
+def test_writes_go_through_to_the_cache(calendar):
+    api, sync = calendar
+    sync.sync()
+    event = sync.create(timed("study session", 1))
+    assert [e['id'] for e in sync.cache.upcoming('primary')] == [event['id']]
+
+    results = sync.create_many([timed("review", 2), {'summary': "no times"}])
+    assert results[1] == (None, "Missing start or end time")
+    assert titles(sync.cache.upcoming('primary')) == ['review', 'study session']
+
+    sync.delete(event['id'])
+    assert titles(sync.cache.upcoming('primary')) == ['review']
+    assert titles(api.events('primary')) == ['review']
@@ -0,0 +1,101 @@
+import multiprocessing
+
+import pytest
+
+from utils.chat_archive import ChatArchive, archive_cold_chats
+from utils.chat_store_jsonl import fcntl
+from utils.chat_history import (append_chat_messages, get_chat_changes, get_chat_list_version, get_chats_page,
+                                get_conversation)
+
+
+def add(chat_id, n=2):
+    append_chat_messages(chat_id, [{'role': 'user', 'content': f"{chat_id} {i}"} for i in range(n)], chat_id)
+
+
+def test_cold_chats_move_to_the_archive_and_stay_listed(chat_env):
+    store, archive = chat_env
+    add('old')
+    version = get_chat_list_version()
+
+    assert archive_cold_chats(store, archive, days=0)['archived'] == 1
+    assert store.chat_meta('old') is None
+    assert archive.load('old')['messages'][1]['content'] == 'old 1'
+    assert [(c['id'], c.get('archived')) for c in get_chats_page(10)['chats']] == [('old', True)]
+    # Archiving is not a deletion as far as delta listings are concerned
+    assert 'old' not in get_chat_changes(version)['deleted']
+
+
+def test_turn_arriving_during_archival_keeps_the_chat_hot(chat_env, monkeypatch):
+    store, archive = chat_env
+    add('busy')
+    original_add = archive.add
+
+    def add_then_reply(chat_data):
+        original_add(chat_data)
+        append_chat_messages('busy', [{'role': 'user', 'content': 'late turn'}], 'busy')
+
+    monkeypatch.setattr(archive, 'add', add_then_reply)
+    result = archive_cold_chats(store, archive, days=0)
+    assert (result['archived'], result['skipped']) == (0, 1)
+    assert store.chat_meta('busy')['message_count'] == 3
+    assert not archive.contains('busy')
+
+
+def test_opening_an_archived_chat_restores_it(chat_env):
+    store, archive = chat_env
+    add('old', n=3)
+    archive_cold_chats(store, archive, days=0)
+    version = get_chat_list_version()
+
+    chat = get_conversation('old')
+    assert chat['message_count'] == 3
+    assert store.chat_meta('old')['message_count'] == 3
+    assert not archive.contains('old')
+    assert [c['id'] for c in get_chat_changes(version)['changed']] == ['old']
+
+
+def test_retention_purges_old_archived_chats(chat_env):
+    store, archive = chat_env
+    add('old')
+    result = archive_cold_chats(store, archive, days=0, retention_days=0)
+    assert result['purged'] == 0
+    archive.add({'id': 'ancient', 'title': 'Ancient', 'timestamp': '2000-01-01T00:00:00', 'messages': []})
+    result = archive_cold_chats(store, archive, days=0, retention_days=30)
+    assert result['purged'] == 1
+    assert archive.contains('old') and not archive.contains('ancient')
+
+
+def test_only_one_job_runs_at_a_time(chat_env):
+    store, archive = chat_env
+    add('old')
+    assert archive.acquire_job_lock()
+    try:
+        assert archive_cold_chats(store, archive, days=0)['archived'] == 0
+    finally:
+        archive.release_job_lock()
+    assert archive_cold_chats(store, archive, days=0)['archived'] == 1
+
+
+def _archive_from_process(directory, worker, count):
+    archive = ChatArchive(directory)
+    for i in range(count):
+        archive.add({'id': f"w{worker}-{i}", 'title': 'Chat', 'timestamp': '2020-01-01T00:00:00', 'messages': []})
+        # Restores and deletes in other workers remove chats while the job adds them
+        if i % 2:
+            archive.remove(f"w{worker}-{i}")
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock")
+def test_worker_processes_do_not_overwrite_each_others_index(tmp_path):
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_archive_from_process, args=(str(tmp_path), n, 20)) for n in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+        assert p.exitcode == 0
+
+    archive = ChatArchive(tmp_path)
+    expected = {f"w{n}-{i}" for n in range(4) for i in range(0, 20, 2)}
+    assert {c['id'] for c in archive.list_chats()} == expected
+    assert all(archive.load(chat_id)['id'] == chat_id for chat_id in expected)
@@ -0,0 +1,99 @@
+import json
+import threading
+
+import pytest
+
+from utils import chat_history
+from utils.chat_history import JsonChatStore, ConversationCache, append_chat_messages, get_conversation
+
+
+def msg(i):
+    return {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"message {i}"}
+
+
+@pytest.fixture
+def json_store(tmp_path, monkeypatch):
+    store = JsonChatStore(tmp_path)
+    monkeypatch.setattr(chat_history, '_store', store)
+    monkeypatch.setattr(chat_history, '_conversations', ConversationCache(4))
+    return store
+
+
+def test_json_chat_meta_parses_only_changed_files(json_store, tmp_path, monkeypatch):
+    json_store.save_chat('c1', [msg(0), msg(1)], 'Chat')
+    loads = []
+    original = JsonChatStore.load_chat
+    monkeypatch.setattr(json_store, 'load_chat', lambda *a, **k: loads.append(a) or original(json_store, *a, **k))
+
+    assert json_store.chat_meta('c1')['message_count'] == 2
+    assert json_store.chat_meta('c1')['message_count'] == 2
+    assert loads == []
+
+    # Rewritten by another worker process
+    with open(tmp_path / 'c1.json', 'w', encoding='utf-8') as f:
+        json.dump({'id': 'c1', 'title': 'Chat', 'messages': [msg(0), msg(1), msg(2)], 'message_count': 3}, f)
+    assert json_store.chat_meta('c1')['message_count'] == 3
+    assert len(loads) == 1
+
+    json_store.delete_chat('c1')
+    assert json_store.chat_meta('c1') is None
+
+
+def test_json_listing_parses_only_changed_files(json_store, tmp_path, monkeypatch):
+    for n in range(3):
+        json_store.save_chat(f"c{n}", [msg(0)], f"Chat {n}")
+    (tmp_path / 'broken.json').write_text('{not json', encoding='utf-8')
+    loads = []
+    original = JsonChatStore.load_chat
+    monkeypatch.setattr(json_store, 'load_chat', lambda *a, **k: loads.append(a[0]) or original(json_store, *a, **k))
+
+    assert [c['id'] for c in json_store.list_chats()] == ['c2', 'c1', 'c0']
+    assert loads == ['broken']
+
+    with open(tmp_path / 'c1.json', 'w', encoding='utf-8') as f:
+        json.dump({'id': 'c1', 'title': 'Renamed', 'timestamp': '2000-01-01T00:00:00', 'message_count': 1}, f)
+    assert [c['title'] for c in json_store.list_chats()][-1] == 'Renamed'
+    assert sorted(loads) == ['broken', 'broken', 'c1']
+
+
+def test_json_append_does_not_overwrite_a_memo_saved_meanwhile(json_store, monkeypatch):
+    json_store.save_chat('c1', [msg(0)], 'Chat')
+    original = JsonChatStore.load_chat
+    memo_writer = []
+
+    def load_then_race(chat_id, last_n=None):
+        chat_data = original(json_store, chat_id, last_n)
+        if not memo_writer:
+            # A background compaction saves its memo while the turn is being appended
+            memo_writer.append(threading.Thread(target=json_store.save_memo, args=('c1', {'summary': 'S', 'covers': 1})))
+            memo_writer[0].start()
+            memo_writer[0].join(0.2)
+        return chat_data
+
+    monkeypatch.setattr(json_store, 'load_chat', load_then_race)
+    json_store.append_messages('c1', [msg(1)], 'Chat')
+    memo_writer[0].join(5)
+
+    chat = original(json_store, 'c1')
+    assert chat['message_count'] == 2
+    assert chat['memo'] == {'summary': 'S', 'covers': 1}
+
+
+def test_conversation_cache_reloads_chats_extended_elsewhere(json_store):
+    append_chat_messages('c1', [msg(0), msg(1)], 'Chat')
+    first = get_conversation('c1')
+    assert get_conversation('c1') is first
+
+    # A different worker appends straight to the store
+    json_store.append_messages('c1', [msg(2), msg(3)], 'Chat')
+    reloaded = get_conversation('c1')
+    assert reloaded is not first
+    assert reloaded['messages'] == [msg(i) for i in range(4)]
+
+
+def test_conversation_cache_is_bounded():
+    cache = ConversationCache(2)
+    for chat_id in ('a', 'b', 'c'):
+        cache.put(chat_id, {'messages': [], 'message_count': 0})
+    assert cache.get('a') is None
+    assert cache.get('c') is not None
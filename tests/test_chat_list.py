@@ -0,0 +1,41 @@
+import pytest
+
+from utils.chat_history import (decode_cursor, get_chat_changes, get_chat_list_version, get_chats_page,
+                                append_chat_messages, delete_chat)
+
+
+def add(chat_id):
+    append_chat_messages(chat_id, [{'role': 'user', 'content': chat_id}], chat_id)
+
+
+def test_cursor_pages_cover_every_chat_once(chat_env):
+    for i in range(7):
+        add(f"c{i}")
+    seen, cursor = [], None
+    while True:
+        page = get_chats_page(3, cursor)
+        seen += [c['id'] for c in page['chats']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [f"c{i}" for i in reversed(range(7))]
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_changes_since_a_version(chat_env):
+    add('a')
+    add('b')
+    version = get_chat_list_version()
+    add('c')
+    add('a')
+    delete_chat('b')
+
+    changes = get_chat_changes(version)
+    assert [c['id'] for c in changes['changed']] == ['a', 'c']
+    assert changes['deleted'] == ['b']
+    assert get_chat_list_version() == version + 3
+    assert get_chat_changes(get_chat_list_version()) == {'changed': [], 'deleted': []}
@@ -0,0 +1,65 @@
+import pytest
+
+from utils.chat_search import InvertedIndex, make_snippet, parse_query
+from utils.chat_store_jsonl import JsonlChatStore
+from utils.chat_store_sqlite import SQLiteChatStore
+
+
+def user(content):
+    return {'role': 'user', 'content': content}
+
+
+@pytest.fixture(params=['jsonl', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'jsonl':
+        return JsonlChatStore(tmp_path)
+    return SQLiteChatStore(tmp_path / 'chats.db')
+
+
+def test_snippet_is_escaped_and_highlights_prefix_matches():
+    terms = parse_query("Plant photos")
+    snippet = make_snippet("Plants use <b>photosynthesis</b> and photo cells", terms)
+    assert '&lt;b&gt;' in snippet
+    # Only the last term matches as a prefix
+    assert '<mark>photosynthesis</mark>' in snippet
+    assert '<mark>Plants</mark>' not in snippet
+    assert '<mark>photo</mark>' not in snippet
+
+
+def test_every_term_must_match_and_best_message_ranks_the_chat(store):
+    store.append_messages('bio', [user("mitochondria is the powerhouse of the cell"), user("cell walls")], 'Bio')
+    store.append_messages('chem', [user("the cell voltage of a battery")], 'Chem')
+    store.append_messages('hist', [user("the powerhouse of ancient Rome")], 'History')
+
+    results = store.search(parse_query("powerhouse cell"))
+    assert [r['id'] for r in results] == ['bio']
+    assert results[0]['seq'] == 0
+    assert '<mark>powerhouse</mark>' in results[0]['snippet']
+    assert {r['id'] for r in store.search(parse_query("cell"))} == {'bio', 'chem'}
+    assert store.search(parse_query("mito"))[0]['id'] == 'bio'
+
+
+def test_index_follows_appends_and_deletes(store):
+    store.append_messages('c1', [user("first note about enzymes")], 'Chat')
+    assert [r['id'] for r in store.search(['enzymes'])] == ['c1']
+    store.append_messages('c1', [user("and now catalysts")], 'Chat')
+    assert store.search(['catalysts'])[0]['seq'] == 1
+    store.delete_chat('c1')
+    assert store.search(['enzymes']) == []
+
+
+def test_inverted_index_reads_only_new_messages():
+    index = InvertedIndex()
+    messages = {'c1': [user("alpha"), user("beta")]}
+    reads = []
+
+    def read(chat_id, start, count):
+        reads.append((chat_id, start, count))
+        return messages[chat_id][start:count]
+
+    index.sync([{'id': 'c1', 'message_count': 2}], read)
+    messages['c1'].append(user("gamma"))
+    index.sync([{'id': 'c1', 'message_count': 3}], read)
+    index.sync([{'id': 'c1', 'message_count': 3}], read)
+    assert reads == [('c1', 0, 2), ('c1', 2, 3)]
+    assert index.search(['gamma'])[0]['seq'] == 2
@@ -0,0 +1,104 @@
+import multiprocessing
+
+import pytest
+
+from utils import chat_store_jsonl
+from utils.chat_store_jsonl import JsonlChatStore, fcntl
+
+
+def msg(i):
+    return {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"message {i}"}
+
+
+def _append_from_process(directory, worker, count):
+    store = JsonlChatStore(directory)
+    for i in range(count):
+        store.append_messages('shared', [{'role': 'user', 'content': f"w{worker}-{i}"}], 'Shared')
+        store.append_messages(f"own-{worker}", [msg(i)], f"Own {worker}")
+
+
+def test_append_and_tail(tmp_path):
+    store = JsonlChatStore(tmp_path)
+    store.append_messages('c1', [msg(0), msg(1)], 'Chat')
+    store.append_messages('c1', [msg(2)], 'Chat')
+    assert store.load_chat('c1')['messages'] == [msg(0), msg(1), msg(2)]
+    assert store.load_chat('c1', last_n=1)['messages'] == [msg(2)]
+    assert store.chat_meta('c1')['message_count'] == 3
+
+
+def test_second_store_sees_writes_from_the_first(tmp_path):
+    first, second = JsonlChatStore(tmp_path), JsonlChatStore(tmp_path)
+    first.append_messages('c1', [msg(0)], 'Chat')
+    assert second.chat_meta('c1')['message_count'] == 1
+    second.append_messages('c1', [msg(1)], 'Chat')
+    first.append_messages('c1', [msg(2)], 'Chat')
+    assert first.load_chat('c1')['messages'] == [msg(0), msg(1), msg(2)]
+    assert first.list_version() == second.list_version() == 3
+
+
+def test_a_turn_appends_one_index_record_instead_of_rewriting_the_index(tmp_path):
+    store = JsonlChatStore(tmp_path)
+    for n in range(50):
+        store.append_messages(f"c{n}", [msg(0)], 'Chat')
+    snapshot = store.index_path.stat() if store.index_path.exists() else None
+    log_size = store.index_log_path.stat().st_size
+
+    store.append_messages('c0', [msg(1)], 'Chat')
+    assert (store.index_path.stat() if store.index_path.exists() else None) == snapshot
+    record = store.index_log_path.read_bytes()[log_size:]
+    assert record.count(b'\n') == 1 and len(record) < 200
+
+
+def test_index_log_is_compacted_into_the_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_store_jsonl, 'INDEX_COMPACT_RECORDS', 5)
+    store = JsonlChatStore(tmp_path)
+    for i in range(7):
+        store.append_messages('c1', [msg(i)], 'Chat')
+    assert store.index_log_path.read_bytes().count(b'\n') == 2
+
+    fresh = JsonlChatStore(tmp_path)
+    assert fresh.chat_meta('c1')['message_count'] == 7
+    assert fresh.list_version() == 7
+
+
+def test_a_torn_index_record_does_not_swallow_the_next_one(tmp_path):
+    store = JsonlChatStore(tmp_path)
+    store.append_messages('c1', [msg(0)], 'Chat')
+    with open(store.index_log_path, 'ab') as f:
+        f.write(b'{"op":"put","chat":{"id":"torn"')
+    store.append_messages('c2', [msg(0)], 'Chat')
+    assert {c['id'] for c in JsonlChatStore(tmp_path).list_chats()} == {'c1', 'c2'}
+
+
+def test_old_tombstones_are_pruned_and_stale_clients_get_the_full_list(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_store_jsonl, 'INDEX_COMPACT_RECORDS', 1)
+    monkeypatch.setattr(chat_store_jsonl, 'MAX_TOMBSTONES', 2)
+    store = JsonlChatStore(tmp_path)
+    for n in range(4):
+        store.append_messages(f"c{n}", [msg(0)], 'Chat')
+    for n in range(4):
+        store.delete_chat(f"c{n}")
+
+    assert len(store._deleted) == 2
+    assert store.changes_since(0) is None
+    assert JsonlChatStore(tmp_path).changes_since(4) is None
+    assert store.changes_since(6) == {'changed': [], 'deleted': ['c2', 'c3']}
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl.flock")
+def test_worker_processes_do_not_lose_index_updates(tmp_path):
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_append_from_process, args=(str(tmp_path), n, 25)) for n in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(30)
+        assert p.exitcode == 0
+
+    store = JsonlChatStore(tmp_path)
+    shared = store.load_chat('shared')
+    assert shared['message_count'] == 100
+    assert len(shared['messages']) == 100
+    assert {c['id'] for c in store.list_chats()} == {'shared', 'own-0', 'own-1', 'own-2', 'own-3'}
+    assert all(store.chat_meta(f"own-{n}")['message_count'] == 25 for n in range(4))
+    assert store.list_version() == 200
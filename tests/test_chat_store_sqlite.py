@@ -0,0 +1,76 @@
+import json
+import threading
+
+import pytest
+
+from utils.chat_store_sqlite import SQLiteChatStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteChatStore(tmp_path / 'chats.db')
+
+
+def msg(i, **extra):
+    return {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"message {i}", **extra}
+
+
+def test_append_round_trips_messages_and_extra_fields(store):
+    store.append_messages('c1', [msg(0), msg(1, sources=['a.md'])], 'First')
+    store.append_messages('c1', [msg(2)], 'First')
+    chat = store.load_chat('c1')
+    assert chat['messages'] == [msg(0), msg(1, sources=['a.md']), msg(2)]
+    assert chat['message_count'] == 3
+    assert store.load_chat('c1', last_n=2)['messages'] == [msg(1, sources=['a.md']), msg(2)]
+    assert store.load_chat('missing') is None
+
+
+def test_save_chat_inserts_only_new_messages_and_handles_rewrites(store):
+    store.save_chat('c1', [msg(i) for i in range(4)], 'Chat')
+    store.save_chat('c1', [msg(i) for i in range(6)], 'Chat')
+    assert store.chat_meta('c1')['message_count'] == 6
+    store.save_chat('c1', [msg(9)], 'Rewritten')
+    chat = store.load_chat('c1')
+    assert chat['messages'] == [msg(9)]
+    assert chat['title'] == 'Rewritten'
+
+
+def test_list_chats_is_newest_first_with_pagination(store):
+    for i in range(5):
+        store.append_messages(f"c{i}", [msg(0)], f"Chat {i}")
+    ids = [c['id'] for c in store.list_chats()]
+    assert ids == ['c4', 'c3', 'c2', 'c1', 'c0']
+    assert [c['id'] for c in store.list_chats(limit=2, offset=2)] == ['c2', 'c1']
+    last = store.list_chats(limit=2)[-1]
+    assert [c['id'] for c in store.list_chats(limit=2, before=(last['timestamp'], last['id']))] == ['c2', 'c1']
+
+
+def test_concurrent_appends_keep_every_message(store):
+    def worker(n):
+        for i in range(20):
+            store.append_messages('shared', [{'role': 'user', 'content': f"w{n}-{i}"}], 'Shared')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    chat = store.load_chat('shared')
+    assert chat['message_count'] == 80
+    assert sorted(m['content'] for m in chat['messages']) == sorted(f"w{n}-{i}" for n in range(4) for i in range(20))
+
+
+def test_json_files_are_migrated_once(store, tmp_path):
+    legacy = tmp_path / 'legacy'
+    legacy.mkdir()
+    with open(legacy / 'old.json', 'w', encoding='utf-8') as f:
+        json.dump({'id': 'old', 'title': 'Old chat', 'timestamp': '2025-01-01T00:00:00',
+                   'messages': [msg(0), msg(1)], 'memo': {'text': 'm', 'covers': 1}}, f)
+    (legacy / 'broken.json').write_text('{not json', encoding='utf-8')
+
+    assert store.migrate_json_files(legacy) == 1
+    assert store.migrate_json_files(legacy) == 0
+    chat = store.load_chat('old')
+    assert chat['messages'] == [msg(0), msg(1)]
+    assert chat['memo'] == {'text': 'm', 'covers': 1}
@@ -0,0 +1,64 @@
+import pytest
+
+from utils import chat_history, conversation_memory
+from utils.chat_history import JsonChatStore, save_chat_history, save_chat_memo
+from utils.chat_store_jsonl import JsonlChatStore
+from utils.chat_store_sqlite import SQLiteChatStore
+from utils.conversation_memory import get_memo, prepare_history
+
+
+@pytest.fixture(params=['json', 'jsonl', 'sqlite'])
+def store(request, tmp_path, monkeypatch):
+    if request.param == 'json':
+        store = JsonChatStore(tmp_path)
+    elif request.param == 'jsonl':
+        store = JsonlChatStore(tmp_path)
+    else:
+        store = SQLiteChatStore(tmp_path / 'chats.db')
+    monkeypatch.setattr(chat_history, '_store', store)
+    return store
+
+
+class _FakeClient:
+    def __init__(self, text):
+        self.text = text
+
+    def chat(self, **kwargs):
+        return {'message': {'content': self.text}}
+
+
+def messages(n):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"turn {i}"} for i in range(n)]
+
+
+def test_missing_memo_is_not_cached(store):
+    save_chat_history('c1', messages(6), 'Chat')
+    assert get_memo('c1') is None
+
+    save_chat_memo('c1', {'text': 'summary', 'covers': 2, 'updated': 'now'})
+    assert get_memo('c1')['text'] == 'summary'
+    memo_text, recent = prepare_history('c1', messages(6))
+    assert memo_text == 'summary'
+    assert recent == messages(6)[2:]
+
+
+def test_memo_written_elsewhere_is_seen(store):
+    save_chat_history('c1', messages(6), 'Chat')
+    save_chat_memo('c1', {'text': 'first', 'covers': 2, 'updated': 'now'})
+    assert get_memo('c1')['text'] == 'first'
+    # Another worker writes straight to the shared store
+    store.save_memo('c1', {'text': 'second', 'covers': 4, 'updated': 'later'})
+    assert get_memo('c1')['text'] == 'second'
+
+
+def test_compaction_does_not_overwrite_a_newer_memo(store, monkeypatch):
+    save_chat_history('c1', messages(10), 'Chat')
+    store.save_memo('c1', {'text': 'newer', 'covers': 6, 'updated': 'later'})
+    monkeypatch.setattr(conversation_memory, 'get_client', lambda: _FakeClient('older'))
+
+    conversation_memory._compact('c1', '', messages(4), 4, 'm')
+    assert get_memo('c1')['text'] == 'newer'
+
+    conversation_memory._compact('c1', 'newer', messages(8)[6:], 8, 'm')
+    memo = get_memo('c1')
+    assert (memo['text'], memo['covers']) == ('older', 8)
@@ -0,0 +1,66 @@
+import pytest
+
+from utils.flashcards import DAY_SECONDS, MIN_EASE, FlashcardStore, sm2
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FlashcardStore(tmp_path / 'flashcards.db')
+
+
+def cards(*fronts):
+    return [{'front': f, 'back': f"answer to {f}"} for f in fronts]
+
+
+def test_sm2_intervals_grow_and_lapses_restart():
+    ease, interval, reps = sm2(2.5, 0, 0, 5)
+    assert (interval, reps) == (1, 1)
+    ease, interval, reps = sm2(ease, interval, reps, 4)
+    assert (interval, reps) == (6, 2)
+    ease, interval, reps = sm2(ease, interval, reps, 4)
+    # Ease is 2.6 after a 5 and a 4, so the third interval is round(6 * 2.6)
+    assert interval == 16
+    assert sm2(ease, interval, reps, 2) == (ease, 1, 0)
+
+
+def test_sm2_ease_never_drops_below_the_minimum():
+    ease = 2.5
+    for _ in range(20):
+        ease, _, _ = sm2(ease, 1, 2, 3)
+    assert ease == MIN_EASE
+
+
+def test_due_queue_and_reviews(store, monkeypatch):
+    monkeypatch.setattr('utils.flashcards.time.time', lambda: NOW)
+    assert store.add_cards('bio.pdf', cards('cell', 'atp', 'cell'))['added'] == 2
+    assert store.add_cards('bio.pdf', cards('atp', 'dna'))['added'] == 1
+
+    due = store.due_cards('bio.pdf', now=NOW)
+    assert [c['front'] for c in due] == ['cell', 'atp', 'dna']
+
+    reviewed = store.review(due[0]['id'], 5, now=NOW)
+    assert reviewed['due'] == NOW + DAY_SECONDS
+    failed = store.review(due[1]['id'], 1, now=NOW)
+    assert (failed['lapses'], failed['repetitions']) == (1, 0)
+    assert [c['front'] for c in store.due_cards(now=NOW)] == ['dna']
+    assert len(store.due_cards(now=NOW + DAY_SECONDS)) == 3
+    assert store.review(999, 5) is None
+
+    deck = store.list_decks(now=NOW)[0]
+    assert (deck['name'], deck['cards'], deck['due']) == ('bio.pdf', 3, 1)
+
+
+def test_due_query_uses_the_due_index(store):
+    plan = ' '.join(row[3] for row in store._conn().execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM cards WHERE due <= ? ORDER BY due LIMIT ?", (NOW, 20)))
+    assert 'idx_cards_due' in plan
+
+
+def test_deleting_a_deck_removes_its_cards(store):
+    store.add_cards('bio.pdf', cards('cell'))
+    store.add_cards('chem.pdf', cards('ion'))
+    assert store.delete_deck('bio.pdf')
+    assert [c['front'] for c in store.due_cards(now=NOW * 2)] == ['ion']
+    assert not store.delete_deck('bio.pdf')
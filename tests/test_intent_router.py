@@ -0,0 +1,32 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from utils.intent_router import CHAT_INTENT, SCHEDULING_INTENTS, classify_intent, parse_schedule
+
+CORPUS = json.loads((Path(__file__).parent.parent / 'benchmarks' / 'intent_phrases.json').read_text())
+NOW = datetime.fromisoformat(CORPUS['now'])
+
+
+@pytest.mark.parametrize('phrase', CORPUS['phrases'], ids=lambda p: p['text'][:40])
+def test_corpus_phrase(phrase):
+    intent = classify_intent(phrase['text'])
+    assert intent == phrase['intent']
+    parsed = parse_schedule(phrase['text'], NOW) if intent in SCHEDULING_INTENTS else None
+    if parsed:
+        parsed = dict(parsed, datetime=parsed['datetime'].isoformat(timespec='minutes'))
+    assert parsed == phrase['parsed']
+
+
+def test_chat_messages_are_not_scheduling_intents():
+    assert CHAT_INTENT not in SCHEDULING_INTENTS
+    assert classify_intent('') == CHAT_INTENT
+    assert classify_intent("What does the scheduler in an OS do?") == CHAT_INTENT
+
+
+def test_parse_schedule_is_deterministic_for_a_fixed_now():
+    first = parse_schedule("schedule revision tomorrow at 9am", NOW)
+    assert first == parse_schedule("schedule revision tomorrow at 9am", NOW)
+    assert first['datetime'] == datetime(2025, 11, 6, 9, 0)
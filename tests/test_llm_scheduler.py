@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from utils.llm_scheduler import (
+    LLMScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_STUDY, SchedulerBusy, _parse_model_limits
+)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_parse_model_limits_skips_bad_entries():
+    assert _parse_model_limits('a=2, b=x,c,d=0') == {'a': 2, 'd': 1}
+
+
+def test_concurrency_limit_is_never_exceeded():
+    scheduler = LLMScheduler(default_concurrency=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    threads = [threading.Thread(target=scheduler.run, args=('m', PRIORITY_STUDY, work)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    assert scheduler.get_stats()['models']['m']['running'] == 0
+
+
+def test_waiters_are_served_by_priority():
+    scheduler = LLMScheduler(default_concurrency=1)
+    scheduler.acquire('m', PRIORITY_INTERACTIVE)
+    order = []
+
+    def waiter(priority, name):
+        scheduler.acquire('m', priority)
+        order.append(name)
+        scheduler.release('m')
+
+    background = threading.Thread(target=waiter, args=(PRIORITY_BACKGROUND, 'background'))
+    background.start()
+    _wait_for(lambda: scheduler.get_stats()['models']['m']['queued']['background'] == 1)
+    interactive = threading.Thread(target=waiter, args=(PRIORITY_INTERACTIVE, 'interactive'))
+    interactive.start()
+    _wait_for(lambda: scheduler.get_stats()['models']['m']['queued']['interactive'] == 1)
+
+    scheduler.release('m')
+    background.join()
+    interactive.join()
+    assert order == ['interactive', 'background']
+
+
+def test_full_queue_rejects_and_timeout_gives_up():
+    scheduler = LLMScheduler(default_concurrency=1, queue_limits={PRIORITY_INTERACTIVE: 0, PRIORITY_STUDY: 1})
+    scheduler.acquire('m', PRIORITY_STUDY)
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire('m', PRIORITY_INTERACTIVE)
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire('m', PRIORITY_STUDY, timeout=0.05)
+
+    stats = scheduler.get_stats()
+    assert stats['queue_wait']['interactive']['rejected'] == 1
+    assert stats['queue_wait']['study']['timed_out'] == 1
+    # The timed-out ticket left the queue, so the slot goes to the next caller
+    assert stats['models']['m']['queued']['study'] == 0
+    scheduler.release('m')
+    assert scheduler.acquire('m', PRIORITY_STUDY, timeout=1) >= 0
+
+
+def test_stream_holds_the_slot_until_exhausted():
+    scheduler = LLMScheduler(default_concurrency=1)
+    stream = scheduler.stream('m', PRIORITY_INTERACTIVE, lambda: iter([1, 2]))
+    assert next(stream) == 1
+    assert scheduler.get_stats()['models']['m']['running'] == 1
+    assert list(stream) == [2]
+    assert scheduler.get_stats()['models']['m']['running'] == 0
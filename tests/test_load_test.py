@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+pytest.importorskip('httpx')
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from load_test import find_saturation, parse_mix, run_stage
+
+
+def stage(users, rps, chat_p95=100.0, error_rate=0.0, busy_rate=0.0):
+    return {'users': users, 'throughput_rps': rps, 'error_rate': error_rate, 'busy_rate': busy_rate,
+            'operations': {'chat': {'latency': {'p95_ms': chat_p95}}}}
+
+
+def test_parse_mix_weights_and_errors():
+    assert parse_mix('chat=60, chat_list=20,new_chat') == {'chat': 60.0, 'chat_list': 20.0, 'new_chat': 1.0}
+    with pytest.raises(ValueError):
+        parse_mix('chat=1,browse=2')
+    with pytest.raises(ValueError):
+        parse_mix('chat=0')
+
+
+def test_saturation_is_the_first_stage_that_breaks_the_slo():
+    stages = [stage(1, 1.0), stage(2, 2.0), stage(4, 3.9, chat_p95=2500), stage(8, 7.5)]
+    result = find_saturation(stages, slo_ms=2000, max_error_rate=0.01, slo_operation='chat')
+    assert result['max_users_within_slo'] == 2
+    assert result['saturated_at_users'] == 4
+    assert 'chat p95' in result['reason']
+    assert result['peak_throughput_rps'] == 7.5
+
+
+def test_saturation_from_busy_replies_and_stalled_throughput():
+    busy = find_saturation([stage(1, 1.0), stage(2, 2.0, busy_rate=0.05)], 2000, 0.01, 'chat')
+    assert (busy['saturated_at_users'], busy['reason']) == (2, 'error+busy rate 5.0%')
+    stalled = find_saturation([stage(1, 1.0), stage(8, 3.0)], 2000, 0.01, 'chat')
+    assert stalled['saturated_at_users'] == 8
+    assert 'throughput per user' in stalled['reason']
+    assert find_saturation([stage(1, 1.0), stage(2, 2.0)], 2000, 0.01, 'chat')['saturated_at_users'] is None
+
+
+def test_run_stage_reports_per_operation_outcomes():
+    app = Flask(__name__)
+    hits = {'revalidated': 0}
+
+    @app.route('/api/get_chats')
+    def get_chats():
+        if request.headers.get('If-None-Match') == '"v1"':
+            hits['revalidated'] += 1
+            return '', 304
+        response = jsonify(chats=[])
+        response.headers['ETag'] = '"v1"'
+        return response
+
+    @app.route('/api/new_chat', methods=['POST'])
+    def new_chat():
+        return jsonify(success=True)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        result = run_stage(f"http://127.0.0.1:{server.server_port}", users=3, duration=0.5,
+                           mix={'chat_list': 1, 'new_chat': 1}, think=0.01, files=[], timeout=5)
+    finally:
+        server.shutdown()
+
+    assert result['users'] == 3
+    assert result['requests'] > 0
+    assert result['error_rate'] == 0.0
+    assert set(result['operations']) == {'chat_list', 'new_chat'}
+    assert result['operations']['chat_list']['latency']['count'] == result['operations']['chat_list']['requests']
+    assert hits['revalidated'] > 0
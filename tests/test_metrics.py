@@ -0,0 +1,58 @@
+import threading
+
+from utils.metrics import Registry, render_metrics, stage_timer
+
+
+def test_counters_render_with_escaped_labels():
+    registry = Registry()
+    requests = registry.counter('app_requests', "Requests", ('route',))
+    requests.labels('/a"b\\c\nd').inc()
+    requests.labels('/a"b\\c\nd').inc(2)
+    text = registry.render()
+    assert '# TYPE app_requests_total counter' in text
+    assert 'app_requests_total{route="/a\\"b\\\\c\\nd"} 3' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('app_seconds', "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert 'app_seconds_bucket{le="0.1"} 2' in lines
+    assert 'app_seconds_bucket{le="1"} 3' in lines
+    assert 'app_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'app_seconds_sum 2.65' in lines
+    assert 'app_seconds_count 4' in lines
+
+
+def test_concurrent_increments_are_not_lost():
+    registry = Registry()
+    counter = registry.counter('app_hits', "Hits")
+    threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert 'app_hits_total 8000' in registry.render()
+
+
+def test_collectors_are_read_at_scrape_time_and_failures_are_skipped():
+    registry = Registry()
+    depth = {'value': 1}
+
+    def broken():
+        raise RuntimeError("boom")
+        yield
+
+    registry.register_collector(broken)
+    registry.register_collector(lambda: [('app_queue_depth', 'gauge', "Queued", [({'model': 'm'}, depth['value'])])])
+    assert 'app_queue_depth{model="m"} 1' in registry.render()
+    depth['value'] = 5
+    assert 'app_queue_depth{model="m"} 5' in registry.render()
+
+
+def test_stage_timer_feeds_the_process_registry():
+    with stage_timer('test', 'render'):
+        pass
+    assert 'nexnote_stage_seconds_count{component="test",stage="render"}' in render_metrics()
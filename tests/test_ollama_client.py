@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from utils import ollama_client
+from utils.ollama_client import get_client, get_keep_alive, get_timing_stats, in_working_hours, record_timings
+
+
+def test_keep_alive_lasts_until_end_of_working_hours(monkeypatch):
+    monkeypatch.setenv('OLLAMA_WORKING_HOURS', '8-22')
+    assert in_working_hours(datetime(2026, 1, 5, 21, 30))
+    assert get_keep_alive(datetime(2026, 1, 5, 21, 30)) == '1800s'
+    # Never shorter than a minute right before the end of the day
+    assert get_keep_alive(datetime(2026, 1, 5, 21, 59, 50)) == '60s'
+
+
+def test_keep_alive_outside_working_hours_uses_configured_value(monkeypatch):
+    monkeypatch.setenv('OLLAMA_WORKING_HOURS', '8-22')
+    monkeypatch.setenv('OLLAMA_KEEP_ALIVE', '10m')
+    assert not in_working_hours(datetime(2026, 1, 5, 23, 0))
+    assert get_keep_alive(datetime(2026, 1, 5, 23, 0)) == '10m'
+    monkeypatch.setenv('OLLAMA_WORKING_HOURS', 'nonsense')
+    assert get_keep_alive(datetime(2026, 1, 5, 12, 0)) == '10m'
+
+
+def test_clients_are_shared_and_chats_stick_to_one_host(monkeypatch):
+    monkeypatch.setenv('OLLAMA_HOSTS', 'http://a:11434,http://b:11434')
+    monkeypatch.setattr(ollama_client, '_clients', {})
+    assert get_client() is get_client()
+    assert get_client('chat-1') is get_client('chat-1')
+    hosts = {id(get_client(f"chat-{i}")) for i in range(20)}
+    assert len(hosts) == 2
+
+
+def test_record_timings_counts_cold_loads(monkeypatch):
+    monkeypatch.setattr(ollama_client, '_timings', {})
+    record_timings('m', {'load_duration': 2e9, 'prompt_eval_count': 10, 'prompt_eval_duration': 1e8,
+                         'eval_count': 50, 'eval_duration': 1e9})
+    record_timings('m', {'load_duration': 1e6, 'prompt_eval_count': 10, 'eval_count': 50, 'eval_duration': 5e8})
+    stats = get_timing_stats()['m']
+    assert stats['requests'] == 2
+    assert stats['cold_loads'] == 1
+    assert stats['generated_tokens'] == 100
+    assert stats['tokens_per_second'] == round(100 / 1.5, 2)
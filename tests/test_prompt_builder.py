@@ -0,0 +1,82 @@
+from utils import prompt_builder
+from utils.prompt_builder import (build_messages, count_tokens, get_prompt_stats, record_prefill,
+                                  truncate_to_tokens)
+
+SYSTEM = "You are a study assistant."
+
+
+def render(context, question):
+    return f"Context:\n{context}\n\nQuestion: {question}" if context else f"Question: {question}"
+
+
+def chunk(text, score=0.9, filename='notes.md'):
+    return {'score': score, 'metadata': {'text': text, 'filename': filename}}
+
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f"question {i} " + "word " * 30})
+        messages.append({'role': 'assistant', 'content': f"answer {i} " + "word " * 60})
+    return messages
+
+
+def test_truncate_to_tokens_respects_the_limit():
+    text = "alpha beta gamma " * 200
+    cut = truncate_to_tokens(text, 50)
+    assert count_tokens(cut) <= 50
+    assert text.startswith(cut)
+    assert truncate_to_tokens("short", 50) == "short"
+    assert truncate_to_tokens("anything", 0) == ''
+
+
+def test_prompt_stays_within_budget_with_large_inputs():
+    context = [chunk("fact " * 800, score=s) for s in (0.9, 0.8, 0.7)]
+    for budget in (200, 600, 1536):
+        messages, stats = build_messages(SYSTEM, "What is osmosis?", context, history(20), render, budget=budget,
+                                         memo="m " * 300)
+        assert stats['total_tokens'] <= budget
+        assert messages[0] == {'role': 'system', 'content': SYSTEM}
+        assert messages[-1]['role'] == 'user'
+        assert 'What is osmosis?' in messages[-1]['content']
+
+
+def test_best_context_goes_in_first_and_recent_history_is_kept():
+    context = [chunk("first chunk " * 20, filename='a.md'), chunk("second chunk " * 20, filename='b.md')]
+    messages, stats = build_messages(SYSTEM, "Explain", context, history(10), render, budget=400)
+    prompt = messages[-1]['content']
+    assert 'a.md' in prompt
+    if 'b.md' in prompt:
+        assert prompt.index('a.md') < prompt.index('b.md')
+    kept = messages[1:-1]
+    # Whatever history fits is the most recent, contiguous tail
+    assert kept == history(10)[len(history(10)) - len(kept):]
+    assert stats['history_dropped'] == 20 - len(kept)
+
+
+def test_oversized_question_is_truncated_to_fit():
+    messages, stats = build_messages(SYSTEM, "why " * 1000, [], [], render, budget=100)
+    assert stats['total_tokens'] <= 100
+    assert messages[-1]['content'].startswith('Question: why')
+
+
+def test_consecutive_turns_share_a_byte_identical_prefix():
+    context = [chunk("volatile context " * 10)]
+    turn_a, _ = build_messages(SYSTEM, "Next?", context, history(10), render, budget=8192,
+                               memo="earlier summary", history_step=4)
+    turn_b, _ = build_messages(SYSTEM, "And then?", context, history(11), render, budget=8192,
+                               memo="earlier summary", history_step=4)
+    prefix = turn_a[:-1]
+    assert turn_b[:len(prefix)] == prefix
+    # Context and question only ever appear in the final message
+    assert all('volatile context' not in m['content'] for m in turn_b[:-1])
+    assert 'And then?' in turn_b[-1]['content']
+
+
+def test_prefix_reuse_ratio_compares_prompt_size_with_evaluated_tokens(monkeypatch):
+    monkeypatch.setattr(prompt_builder, '_totals', {k: 0 for k in prompt_builder._totals})
+    record_prefill(1000, 250)
+    record_prefill(1000, None)
+    stats = get_prompt_stats()
+    assert stats['prefill_requests'] == 1
+    assert stats['prefix_reuse_ratio'] == 0.75
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from utils.request_coalescer import RequestCoalescer, make_key
+
+
+def test_make_key_ignores_whitespace_in_nested_messages():
+    a = [{'role': 'user', 'content': 'What is  a\nmitochondrion?'}]
+    b = [{'role': 'user', 'content': ' What is a mitochondrion? '}]
+    assert make_key('chat', 'm', a, {'temperature': 0.7}) == make_key('chat', 'm', b, {'temperature': 0.7})
+    assert make_key('chat', 'm', a) != make_key('chat', 'other', a)
+    assert make_key('chat', 'm', a) != make_key('chat', 'm', [{'role': 'user', 'content': 'Something else'}])
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    coalescer = RequestCoalescer()
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return 'answer'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coalescer.do('k', fn))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['answer'] * 5
+    assert len(calls) == 1
+    assert coalescer.get_stats()['coalesced'] == 4
+    assert coalescer.get_stats()['in_flight'] == 0
+
+
+def test_errors_reach_every_waiter_and_the_key_is_released():
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError('ollama down')
+
+    errors = []
+
+    def call():
+        try:
+            coalescer.do('k', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ['ollama down'] * 3
+    # A later request starts a fresh call instead of reusing the failed one
+    assert coalescer.do('k', lambda: 'ok') == 'ok'
+
+
+def test_stream_fans_out_to_late_subscribers():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+
+    def source():
+        yield 'a'
+        started.set()
+        release.wait(5)
+        yield 'b'
+
+    first = coalescer.stream('s', source)
+    assert next(first) == 'a'
+    started.wait(5)
+    second = coalescer.stream('s', lambda: pytest.fail("the source must not run twice"))
+    release.set()
+    assert list(first) == ['b']
+    assert list(second) == ['a', 'b']
@@ -0,0 +1,66 @@
+import pytest
+
+from utils import shared_cache, study_assistant
+from utils.shared_cache import SharedCache, get_answer_cache, get_embedding_cache
+
+
+@pytest.fixture
+def fresh_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, '_caches', {})
+    monkeypatch.setenv('SHARED_CACHE', 'true')
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'shared_cache.db'))
+    monkeypatch.delenv('ANSWER_CACHE_ENTRIES', raising=False)
+    monkeypatch.delenv('EMBEDDING_CACHE_ENTRIES', raising=False)
+
+
+def test_values_round_trip_and_namespaces_are_separate(tmp_path):
+    path = tmp_path / 'cache.db'
+    embeddings = SharedCache(path, 'embedding', 10, 60)
+    answers = SharedCache(path, 'answer', 10, 60)
+    embeddings.put_vector('k', [0.5, -1.0])
+    answers.put_text('k', 'Osmosis is…')
+    assert embeddings.get_vector('k') == [0.5, -1.0]
+    assert answers.get_text('k') == 'Osmosis is…'
+    # Another worker opening the same file sees the entries
+    assert SharedCache(path, 'answer', 10, 60).get_text('k') == 'Osmosis is…'
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = SharedCache(tmp_path / 'cache.db', 'answer', 10, ttl=-1)
+    cache.put_text('k', 'stale')
+    assert cache.get_text('k') is None
+    assert cache.entries() == 0
+
+
+def test_sweep_trims_to_max_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'SWEEP_PROBABILITY', 1.0)
+    cache = SharedCache(tmp_path / 'cache.db', 'embedding', 3, 60)
+    for i in range(6):
+        cache.put_text(f'k{i}', str(i))
+    assert cache.entries() == 3
+    assert cache.get_text('k5') == '5'
+
+
+def test_answers_are_opt_in_and_embeddings_are_on_by_default(fresh_caches, monkeypatch):
+    assert get_answer_cache() is None
+    assert get_embedding_cache() is not None
+
+    monkeypatch.setattr(shared_cache, '_caches', {})
+    monkeypatch.setenv('ANSWER_CACHE_ENTRIES', '100')
+    assert get_answer_cache() is not None
+
+
+def test_study_tools_are_generated_afresh_even_with_the_answer_cache_on(fresh_caches, monkeypatch):
+    monkeypatch.setenv('ANSWER_CACHE_ENTRIES', '100')
+    calls = []
+
+    class FakeClient:
+        def chat(self, model, messages, keep_alive=None):
+            calls.append(messages)
+            return {'message': {'role': 'assistant', 'content': f"quiz {len(calls)}"}}
+
+    monkeypatch.setattr(study_assistant, 'get_client', lambda: FakeClient())
+    first = study_assistant._coalesced_chat('quiz', 'Make a quiz', 'm')
+    second = study_assistant._coalesced_chat('quiz', 'Make a quiz', 'm')
+    assert len(calls) == 2
+    assert first['message']['content'] != second['message']['content']
@@ -0,0 +1,61 @@
+import json
+import multiprocessing
+import threading
+
+from utils.study_progress import StudyProgressStore
+
+
+def _record_from_process(db_path, count):
+    store = StudyProgressStore(db_path)
+    for i in range(count):
+        store.record_session('shared.pdf', 80)
+
+
+def test_aggregates_are_updated_with_each_session(tmp_path):
+    store = StudyProgressStore(tmp_path / 'progress.db')
+    for score in (60, None, 100, 80):
+        store.record_session('notes.md', score)
+
+    summary = store.get_summaries()['notes.md']
+    assert summary['session_count'] == 4
+    assert summary['scored_sessions'] == 3
+    assert summary['average_score'] == 80.0
+    # 60 -> 72 -> 74.4 with an alpha of 0.3
+    assert summary['rolling_average'] == 74.4
+    assert summary['recent_scores'] == [60, 100, 80]
+    assert [s['score'] for s in store.get_sessions('notes.md', limit=2)] == [80, 100]
+
+
+def test_concurrent_sessions_from_threads_and_processes_are_all_kept(tmp_path):
+    db_path = tmp_path / 'progress.db'
+    store = StudyProgressStore(db_path)
+    threads = [threading.Thread(target=lambda: [store.record_session('shared.pdf', 80) for _ in range(20)])
+               for _ in range(4)]
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_record_from_process, args=(str(db_path), 20)) for _ in range(2)]
+    # Fork before starting threads, so no child inherits a lock held mid-write
+    for worker in processes + threads:
+        worker.start()
+    for worker in threads + processes:
+        worker.join(30)
+    assert all(p.exitcode == 0 for p in processes)
+
+    summary = store.get_summaries()['shared.pdf']
+    assert summary['session_count'] == 120
+    assert summary['scored_sessions'] == 120
+
+
+def test_legacy_json_log_is_migrated_once(tmp_path):
+    log_path = tmp_path / 'study_log.json'
+    log_path.write_text(json.dumps({'bio.pdf': {'sessions': [
+        {'date': '2025-02-01T10:00:00', 'score': 90},
+        {'date': '2025-01-01T10:00:00', 'score': 50},
+    ]}}))
+    store = StudyProgressStore(tmp_path / 'progress.db')
+    assert store.migrate_json_log(log_path) == 2
+    assert store.migrate_json_log(log_path) == 0
+
+    summary = store.get_summaries()['bio.pdf']
+    assert summary['first_studied'] == '2025-01-01T10:00:00'
+    assert summary['last_studied'] == '2025-02-01T10:00:00'
+    assert summary['recent_scores'] == [50, 90]
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from utils.profiling import RequestProfiler
+from utils.request_coalescer import RequestCoalescer
+from utils.tracing import (Tracer, clean_request_id, current_request_id, end_span, record_span, start_span,
+                           to_otlp)
+
+
+def test_spans_nest_under_the_request_and_reset_the_current_span():
+    tracer = Tracer()
+    root = tracer.start_trace('POST /api/chat', request_id='req-1')
+    span = start_span('retrieval', k=4)
+    record_span('embed', 0.01)
+    end_span(span)
+    assert current_request_id() == 'req-1'
+    tracer.finish_trace(root)
+
+    assert current_request_id() is None
+    spans = {s['name']: s for s in tracer.find('req-1')['spans']}
+    assert spans['retrieval']['parent_id'] == spans['POST /api/chat']['span_id']
+    assert spans['embed']['parent_id'] == spans['retrieval']['span_id']
+    assert spans['embed']['duration_ms'] == pytest.approx(10, abs=1)
+
+
+def test_spans_outside_a_request_are_no_ops():
+    assert start_span('orphan') is None
+    record_span('orphan', 0.1)
+    assert Tracer(enabled=False).start_trace('GET /') is None
+
+
+def test_otlp_export_marks_errors_and_the_server_span():
+    tracer = Tracer()
+    root = tracer.start_trace('GET /', request_id='req-2')
+    end_span(start_span('store'), RuntimeError('disk full'))
+    tracer.finish_trace(root)
+    spans = to_otlp([root.trace])['resourceSpans'][0]['scopeSpans'][0]['spans']
+    kinds = {s['name']: (s['kind'], s['status']['code']) for s in spans}
+    assert kinds == {'GET /': (2, 0), 'store': (1, 2)}
+
+
+def test_clean_request_id_rejects_unsafe_values():
+    assert clean_request_id('abc-123') == 'abc-123'
+    assert clean_request_id('bad id\n') is None
+    assert clean_request_id('x' * 65) is None
+
+
+def test_spans_recorded_by_a_coalesced_stream_join_the_request_trace():
+    tracer = Tracer()
+    root = tracer.start_trace('POST /api/chat_stream', request_id='req-3')
+
+    def source():
+        record_span('queue_wait', 0.001)
+        span = start_span('generate')
+        yield 'a'
+        yield 'b'
+        end_span(span)
+
+    assert list(RequestCoalescer().stream('k', source)) == ['a', 'b']
+    # The pump may still be finishing its last span after the final chunk
+    deadline = time.time() + 2
+    while len(root.trace.spans) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    tracer.finish_trace(root)
+
+    names = [s['name'] for s in tracer.find('req-3')['spans']]
+    assert sorted(names) == ['POST /api/chat_stream', 'generate', 'queue_wait']
+
+
+def test_cprofile_capture_merges_the_requested_number_of_requests(tmp_path):
+    profiler = RequestProfiler(tmp_path)
+    profiler.arm('cprofile', 2)
+    for request_id in ('r1', 'r2', 'r3'):
+        handle = profiler.start_request(request_id)
+        sum(range(1000))
+        profiler.finish_request(handle)
+
+    status = profiler.get_status()
+    assert not status['armed']
+    [result] = status['results']
+    assert result['request_ids'] == ['r1', 'r2']
+    assert (tmp_path / result['id']).exists()
+    assert 'cumulative' in profiler.get_result(result['id'])['report']
+
+
+def test_profiler_rejects_bad_arguments_and_double_arming(tmp_path):
+    profiler = RequestProfiler(tmp_path)
+    with pytest.raises(ValueError):
+        profiler.arm('perf', 1)
+    with pytest.raises(ValueError):
+        profiler.arm('cprofile', 0)
+    profiler.arm('tracemalloc', 1)
+    with pytest.raises(ValueError):
+        profiler.arm('cprofile', 1)
+    assert profiler.cancel()['armed'] is False
+    assert profiler.start_request('r1') is None
@@ -5,20 +5,27 @@ Handles calendar events, reminders, and study schedules
 
 import os
 import pickle
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List
-import re
 import pytz
 from tzlocal import get_localzone
 
+from utils.calendar_slots import FreeSlotFinder
+from utils.intent_router import parse_schedule
+from utils.calendar_sync import CalendarSync, EventCache, GoogleCalendarApi
+from utils.metrics import register_collector, stage_timer
+
 # Google Calendar imports
 try:
     from google.auth.transport.requests import Request
+    from google.auth.exceptions import RefreshError
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
     from googleapiclient.discovery import build
-    from dateutil import parser as date_parser
+    import google_auth_httplib2
+    import httplib2
     CALENDAR_AVAILABLE = True
 except ImportError:
     CALENDAR_AVAILABLE = False
@@ -31,6 +38,12 @@ SCOPES = ['https://www.googleapis.com/auth/calendar']
 PROJECT_ROOT = Path(__file__).parent.parent
 TOKEN_PATH = PROJECT_ROOT / "calendar_token.pickle"
 CREDENTIALS_PATH = PROJECT_ROOT / "credentials.json"
+# Local copy of the calendar, kept current with incremental sync
+EVENT_CACHE_PATH = PROJECT_ROOT / "calendar_cache.db"
+
+# Refresh the access token this long before it expires, so no API call hits an expired one
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+HTTP_TIMEOUT = 30
 
 # Get local timezone
 try:
@@ -40,72 +53,178 @@ except Exception:
     LOCAL_TIMEZONE = 'UTC'
 
 
+class CalendarService:
+    """Process-wide Google Calendar service
+
+    Credentials are loaded and the discovery client is built once, on first
+    use, from the discovery document bundled with google-api-python-client
+    (no discovery HTTP fetch). The token is refreshed shortly before it
+    expires. The service object is shared, but httplib2 connections are not
+    thread-safe, so each thread executes requests over its own authorized
+    connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._creds = None
+        self._service = None
+        self._local = threading.local()
+
+    def _save_credentials(self, creds):
+        print(f"Saving token to: {TOKEN_PATH}")
+        with open(TOKEN_PATH, 'wb') as token:
+            pickle.dump(creds, token)
+
+    def _load_credentials(self, allow_flow: bool):
+        """Load the stored token, refreshing it or running the OAuth flow when needed"""
+        creds = None
+
+        # The file token.pickle stores the user's access and refresh tokens
+        if TOKEN_PATH.exists():
+            print(f"Loading existing token from: {TOKEN_PATH}")
+            with open(TOKEN_PATH, 'rb') as token:
+                creds = pickle.load(token)
+
+        # If there are no (valid) credentials available, let the user log in.
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                print("Refreshing expired token...")
+                creds.refresh(Request())
+            else:
+                if not allow_flow:
+                    return None
+                if not CREDENTIALS_PATH.exists():
+                    print(f"credentials.json not found at: {CREDENTIALS_PATH}")
+                    return None
+
+                print(f"Starting OAuth flow with credentials from: {CREDENTIALS_PATH}")
+                print("A browser window will open for authentication...")
+
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    str(CREDENTIALS_PATH),
+                    SCOPES,
+                    redirect_uri='http://localhost'
+                )
+
+                creds = flow.run_local_server(
+                    port=8080,
+                    access_type='offline',
+                    prompt='consent'
+                )
+
+                print("Authentication successful!")
+
+            # Save the credentials for the next run
+            self._save_credentials(creds)
+
+        return creds
+
+    def _refresh_if_needed(self):
+        """Refresh the access token if it expires within TOKEN_REFRESH_MARGIN; must hold the lock"""
+        creds = self._creds
+        if creds is None or not creds.refresh_token:
+            return
+        # google-auth keeps expiry as naive UTC
+        if creds.expiry is None or creds.expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+            return
+        print("Refreshing calendar token before it expires...")
+        creds.refresh(Request())
+        self._save_credentials(creds)
+
+    def get(self, allow_flow: bool = False):
+        """Get the shared service, initializing it on first use (None if not authorized)"""
+        with self._lock:
+            if self._service is None:
+                creds = self._load_credentials(allow_flow)
+                if creds is None:
+                    return None
+                print("Building calendar service...")
+                self._service = build('calendar', 'v3', credentials=creds,
+                                      cache_discovery=False, static_discovery=True)
+                self._creds = creds
+                print("✅ Calendar service ready")
+            self._refresh_if_needed()
+            return self._service
+
+    def execute(self, request):
+        """Execute an API request over this thread's authorized connection"""
+        with self._lock:
+            self._refresh_if_needed()
+        http = getattr(self._local, 'http', None)
+        if http is None or http.credentials is not self._creds:
+            http = google_auth_httplib2.AuthorizedHttp(self._creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            self._local.http = http
+        try:
+            return request.execute(http=http)
+        except RefreshError:
+            # Token revoked or expired for good; re-authenticate on next use
+            self.reset()
+            raise
+
+    def reset(self):
+        """Forget the cached service (e.g. after the token was revoked)"""
+        with self._lock:
+            self._service = None
+            self._creds = None
+
+
+_calendar_service = CalendarService()
+
+
+def get_calendar_service(allow_flow: bool = False):
+    """Get the process-wide calendar service holder, initialized if authorized"""
+    if not CALENDAR_AVAILABLE:
+        return None
+    return _calendar_service if _calendar_service.get(allow_flow) is not None else None
+
+
 class CalendarManager:
-    """Manages Google Calendar integration"""
+    """Manages Google Calendar integration
+
+    Reads are served from a local event cache; pass `api` (e.g. a
+    FakeCalendarApi) to run against something other than Google.
+    """
     
-    def __init__(self):
+    def __init__(self, api=None, cache: Optional[EventCache] = None):
         self.service = None
-        self.authenticated = False
+        self.authenticated = api is not None
+        self._api = api
+        self._cache = cache
+        self._sync = None
         
     def authenticate(self) -> bool:
-        """Authenticate with Google Calendar"""
+        """Authenticate with Google Calendar (reuses the process-wide service)"""
+        if self._api is not None:
+            return True
         if not CALENDAR_AVAILABLE:
             print("Calendar packages not available")
             return False
             
         try:
-            creds = None
-            
-            # The file token.pickle stores the user's access and refresh tokens
-            if TOKEN_PATH.exists():
-                print(f"Loading existing token from: {TOKEN_PATH}")
-                with open(TOKEN_PATH, 'rb') as token:
-                    creds = pickle.load(token)
-            
-            # If there are no (valid) credentials available, let the user log in.
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    print("Refreshing expired token...")
-                    creds.refresh(Request())
-                else:
-                    if not CREDENTIALS_PATH.exists():
-                        print(f"credentials.json not found at: {CREDENTIALS_PATH}")
-                        return False
-                    
-                    print(f"Starting OAuth flow with credentials from: {CREDENTIALS_PATH}")
-                    print("A browser window will open for authentication...")
-                    
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        str(CREDENTIALS_PATH), 
-                        SCOPES,
-                        redirect_uri='http://localhost'
-                    )
-                    
-                    creds = flow.run_local_server(
-                        port=8080,
-                        access_type='offline',
-                        prompt='consent'
-                    )
-                    
-                    print("Authentication successful!")
-                
-                # Save the credentials for the next run
-                print(f"Saving token to: {TOKEN_PATH}")
-                with open(TOKEN_PATH, 'wb') as token:
-                    pickle.dump(creds, token)
-            
-            print("Building calendar service...")
-            self.service = build('calendar', 'v3', credentials=creds)
-            self.authenticated = True
-            print("✅ Calendar service ready")
-            return True
+            self.service = _calendar_service.get(allow_flow=True)
+            self.authenticated = self.service is not None
+            return self.authenticated
             
         except Exception as e:
             print(f"❌ Calendar authentication failed: {str(e)}")
             import traceback
             traceback.print_exc()
+            _calendar_service.reset()
             return False
     
+    def get_sync(self) -> CalendarSync:
+        """Get the cache-backed sync layer (requires authentication)"""
+        if self._sync is None:
+            api = self._api or GoogleCalendarApi(_calendar_service)
+            cache = self._cache or EventCache(Path(os.getenv('CALENDAR_CACHE_PATH', str(EVENT_CACHE_PATH))))
+            self._sync = CalendarSync(api, cache, max_age=float(os.getenv('CALENDAR_SYNC_SECONDS', '60')))
+        return self._sync
+    
+    def _ensure_authenticated(self) -> bool:
+        if self.authenticated and (self.service or self._api):
+            return True
+        return self.authenticate()
+    
     def create_event(self, 
                     title: str, 
                     start_time: datetime, 
@@ -113,44 +232,15 @@ class CalendarManager:
                     description: str = "",
                     reminder_minutes: int = 30) -> Optional[Dict]:
         """Create a calendar event"""
-        if not self.authenticated or not self.service:
-            # Try to authenticate
-            if not self.authenticate():
-                return None
+        if not self._ensure_authenticated():
+            return None
         
         try:
-            # Ensure start_time is timezone-aware
-            if start_time.tzinfo is None:
-                # If naive datetime, assume it's in local timezone
-                local_tz = pytz.timezone(LOCAL_TIMEZONE)
-                start_time = local_tz.localize(start_time)
-            
-            end_time = start_time + timedelta(minutes=duration_minutes)
-            
-            event = {
-                'summary': title,
-                'description': description,
-                'start': {
-                    'dateTime': start_time.isoformat(),
-                    'timeZone': LOCAL_TIMEZONE,
-                },
-                'end': {
-                    'dateTime': end_time.isoformat(),
-                    'timeZone': LOCAL_TIMEZONE,
-                },
-                'reminders': {
-                    'useDefault': False,
-                    'overrides': [
-                        {'method': 'popup', 'minutes': reminder_minutes},
-                        {'method': 'email', 'minutes': reminder_minutes},
-                    ],
-                },
-            }
+            event = _event_body(title, start_time, duration_minutes, description, reminder_minutes,
+                                pytz.timezone(LOCAL_TIMEZONE))
             
-            created_event = self.service.events().insert(
-                calendarId='primary', 
-                body=event
-            ).execute()
+            # Write-through: the new event goes into the local cache too
+            created_event = self.get_sync().create(event)
             
             return created_event
             
@@ -158,24 +248,117 @@ class CalendarManager:
             print(f"Failed to create event: {str(e)}")
             return None
     
-    def get_upcoming_events(self, max_results: int = 10) -> List[Dict]:
-        """Get upcoming calendar events"""
-        if not self.authenticated or not self.service:
-            if not self.authenticate():
-                return []
+    def create_events(self, sessions: List[Dict]) -> Dict:
+        """Create many events in batched requests
+
+        Each session has title, start_time and optionally duration_minutes,
+        description and reminder_minutes. Failures are reported per item by
+        index, and don't stop the others.
+        """
+        created, failed = [], []
+        if not self._ensure_authenticated():
+            return {'created': created, 'failed': [{'index': i, 'error': 'Calendar not authenticated'}
+                                                   for i in range(len(sessions))]}
+        
+        # Validate everything up front and resolve the timezone once
+        local_tz = pytz.timezone(LOCAL_TIMEZONE)
+        bodies, indexes = [], []
+        for index, item in enumerate(sessions):
+            try:
+                if not item.get('title') or not isinstance(item.get('start_time'), datetime):
+                    raise ValueError("title and start_time are required")
+                bodies.append(_event_body(item['title'], item['start_time'],
+                                          int(item.get('duration_minutes', 60)), item.get('description', ''),
+                                          int(item.get('reminder_minutes', 30)), local_tz))
+                indexes.append(index)
+            except (ValueError, TypeError) as e:
+                failed.append({'index': index, 'error': str(e)})
+        
+        if bodies:
+            try:
+                results = self.get_sync().create_many(bodies)
+            except Exception as e:
+                print(f"Failed to create events: {str(e)}")
+                results = [(None, str(e))] * len(bodies)
+            for index, (event, error) in zip(indexes, results):
+                if event is not None:
+                    created.append({'index': index, 'event': event})
+                else:
+                    failed.append({'index': index, 'error': error or 'Unknown error'})
+        
+        failed.sort(key=lambda f: f['index'])
+        return {'created': created, 'failed': failed}
+    
+    def create_recurring_event(self,
+                               title: str,
+                               start_time: datetime,
+                               rrule: str,
+                               duration_minutes: int = 60,
+                               description: str = "",
+                               reminder_minutes: int = 30) -> Optional[Dict]:
+        """Create one recurring event from an RFC 5545 rule (e.g. "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=30")"""
+        rrule = normalize_rrule(rrule)
+        if rrule is None or not self._ensure_authenticated():
+            return None
+        
+        try:
+            event = _event_body(title, start_time, duration_minutes, description, reminder_minutes,
+                                pytz.timezone(LOCAL_TIMEZONE))
+            event['recurrence'] = [rrule]
+            return self.get_sync().create(event)
+            
+        except Exception as e:
+            print(f"Failed to create recurring event: {str(e)}")
+            return None
+    
+    def find_free_slots(self,
+                        duration_minutes: int = 60,
+                        count: int = 3,
+                        days: int = 7,
+                        start: Optional[datetime] = None,
+                        work_start: str = "09:00",
+                        work_end: str = "21:00",
+                        min_gap_minutes: int = 15,
+                        max_per_day: Optional[int] = 1) -> List[Dict]:
+        """Propose free slots from the locally cached calendar (no extra API calls)"""
+        # Bad working hours are the caller's error, so let ValueError through
+        work_start_time = datetime.strptime(work_start, "%H:%M").time()
+        work_end_time = datetime.strptime(work_end, "%H:%M").time()
+        if not self._ensure_authenticated():
+            return []
         
         try:
-            now = datetime.utcnow().isoformat() + 'Z'
+            local_tz = pytz.timezone(LOCAL_TIMEZONE)
+            window_start = start or datetime.now(local_tz)
+            if window_start.tzinfo is None:
+                window_start = local_tz.localize(window_start)
+            window_end = window_start + timedelta(days=days)
             
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=now,
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
+            with stage_timer('calendar', 'find_slots'):
+                busy = self.get_sync().busy_between(window_start.timestamp() - 86400,
+                                                    window_end.timestamp() + 86400)
+                finder = FreeSlotFinder(busy, local_tz, min_gap_minutes)
+                return finder.find(
+                    window_start, window_end,
+                    duration_minutes=duration_minutes,
+                    count=count,
+                    work_start=work_start_time,
+                    work_end=work_end_time,
+                    max_per_day=max_per_day
+                )
             
-            return events_result.get('items', [])
+        except Exception as e:
+            print(f"Failed to find free slots: {str(e)}")
+            return []
+    
+    def get_upcoming_events(self, max_results: int = 10) -> List[Dict]:
+        """Get upcoming calendar events (from the local cache)"""
+        if not self._ensure_authenticated():
+            return []
+        
+        try:
+            with stage_timer('calendar', 'list_upcoming'):
+                return self.get_sync().upcoming(max_results)
             
         except Exception as e:
             print(f"Failed to get events: {str(e)}")
@@ -183,15 +366,11 @@ class CalendarManager:
     
     def delete_event(self, event_id: str) -> bool:
         """Delete a calendar event"""
-        if not self.authenticated or not self.service:
-            if not self.authenticate():
-                return False
+        if not self._ensure_authenticated():
+            return False
         
         try:
-            self.service.events().delete(
-                calendarId='primary',
-                eventId=event_id
-            ).execute()
+            self.get_sync().delete(event_id)
             return True
             
         except Exception as e:
@@ -199,86 +378,94 @@ class CalendarManager:
             return False
 
 
-def parse_schedule_request(text: str) -> Optional[Dict]:
-    """Parse natural language schedule request"""
-    if not CALENDAR_AVAILABLE:
-        return None
-        
-    text_lower = text.lower()
-    
-    result = {
-        'title': '',
-        'datetime': None,
-        'duration': 60,
-        'reminder': 30
-    }
+def _event_body(title: str, start_time: datetime, duration_minutes: int, description: str,
+                reminder_minutes: int, local_tz) -> Dict:
+    """Build an event resource; naive start times are taken as local time"""
+    if start_time.tzinfo is None:
+        start_time = local_tz.localize(start_time)
+    if duration_minutes <= 0:
+        raise ValueError("duration must be positive")
     
-    # Extract title
-    title_patterns = [
-        r'schedule\s+(.+?)\s+(?:tomorrow|today|on|at)',
-        r'add\s+(.+?)\s+(?:tomorrow|today|on|at)',
-        r'remind me (?:to\s+)?(.+?)\s+(?:tomorrow|today|on|at)',
-        r'create event\s+(.+?)\s+(?:tomorrow|today|on|at)',
-    ]
+    end_time = start_time + timedelta(minutes=duration_minutes)
     
-    for pattern in title_patterns:
-        match = re.search(pattern, text_lower, re.IGNORECASE)
-        if match:
-            result['title'] = match.group(1).strip().title()
-            break
-    
-    if not result['title']:
-        result['title'] = text.split(' at ')[0].split(' on ')[0].strip().title()
-    
-    # Parse datetime
-    try:
-        base_text = text_lower
-        if 'tomorrow' in text_lower:
-            tomorrow = datetime.now() + timedelta(days=1)
-            base_text = text_lower.replace('tomorrow', tomorrow.strftime('%Y-%m-%d'))
-        elif 'today' in text_lower:
-            today = datetime.now()
-            base_text = text_lower.replace('today', today.strftime('%Y-%m-%d'))
-        
-        parsed_dt = date_parser.parse(base_text, fuzzy=True)
-        
-        # Check for time
-        time_patterns = [
-            r'(\d{1,2})\s*(?::(\d{2}))?\s*(am|pm)',
-            r'at\s+(\d{1,2})\s*(?::(\d{2}))?\s*(am|pm)?',
-        ]
-        
-        for pattern in time_patterns:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
-            if match:
-                hour = int(match.group(1))
-                minute = int(match.group(2)) if match.group(2) else 0
-                am_pm = match.group(3).lower() if match.group(3) else None
-                
-                if am_pm == 'pm' and hour < 12:
-                    hour += 12
-                elif am_pm == 'am' and hour == 12:
-                    hour = 0
-                
-                parsed_dt = parsed_dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                break
-        
-        result['datetime'] = parsed_dt
-        
-    except Exception as e:
-        result['datetime'] = None
-    
-    # Extract duration
-    duration_match = re.search(r'(\d+)\s*(?:hour|hr|h)', text_lower)
-    if duration_match:
-        result['duration'] = int(duration_match.group(1)) * 60
+    return {
+        'summary': title,
+        'description': description,
+        'start': {
+            'dateTime': start_time.isoformat(),
+            'timeZone': LOCAL_TIMEZONE,
+        },
+        'end': {
+            'dateTime': end_time.isoformat(),
+            'timeZone': LOCAL_TIMEZONE,
+        },
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'popup', 'minutes': reminder_minutes},
+                {'method': 'email', 'minutes': reminder_minutes},
+            ],
+        },
+    }
+
+
+RRULE_FREQS = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+
+
+def normalize_rrule(rrule: str) -> Optional[str]:
+    """Check a recurrence rule and return it as "RRULE:..." (None if invalid or unbounded)"""
+    rule = (rrule or '').strip().upper()
+    if rule.startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
     
-    # Extract reminder
-    reminder_match = re.search(r'remind\s+(?:me\s+)?(\d+)\s*(?:min|minute)', text_lower)
-    if reminder_match:
-        result['reminder'] = int(reminder_match.group(1))
+    parts = {}
+    for part in rule.split(';'):
+        key, sep, value = part.partition('=')
+        if not sep or not value:
+            return None
+        parts[key] = value
     
-    return result if result['datetime'] else None
+    if parts.get('FREQ') not in RRULE_FREQS:
+        return None
+    # A study plan ends; refuse rules that would repeat forever
+    if 'COUNT' not in parts and 'UNTIL' not in parts:
+        return None
+    if 'COUNT' in parts and not parts['COUNT'].isdigit():
+        return None
+    return 'RRULE:' + rule
+
+
+_calendar_manager = None
+
+
+def get_calendar_manager() -> CalendarManager:
+    """Get the process-wide calendar manager"""
+    global _calendar_manager
+    if _calendar_manager is None:
+        _calendar_manager = CalendarManager()
+    return _calendar_manager
+
+
+def _collect_calendar_sync():
+    sync = _calendar_manager._sync if _calendar_manager is not None else None
+    if sync is None:
+        return
+    stats = dict(sync.stats)
+    yield ('nexnote_calendar_syncs', 'counter', "Calendar syncs with Google by kind",
+           [({'kind': 'full'}, stats['full_syncs']), ({'kind': 'incremental'}, stats['incremental_syncs'])])
+    yield ('nexnote_calendar_api_pages', 'counter', "Event list pages fetched from Google", [({}, stats['api_pages'])])
+    yield ('nexnote_calendar_cache_reads', 'counter', "Calendar reads served from the local event cache",
+           [({}, stats['cache_reads'])])
+
+
+register_collector(_collect_calendar_sync)
+
+
+def parse_schedule_request(text: str, now: Optional[datetime] = None) -> Optional[Dict]:
+    """Parse natural language schedule request"""
+    if not CALENDAR_AVAILABLE:
+        return None
+    return parse_schedule(text, now)
 
 
 def format_event_display(event: Dict) -> str:
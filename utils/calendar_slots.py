@@ -0,0 +1,121 @@
+"""
+Free slot finder
+Computes open study slots locally from busy intervals (sorted merge), working hours and gaps
+"""
+
+from bisect import bisect_right
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from utils.calendar_sync import event_bounds
+
+# Proposed slots start on a quarter hour
+SLOT_STEP_SECONDS = 15 * 60
+
+
+def merge_intervals(intervals: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Sort and merge overlapping or touching intervals"""
+    merged: List[Tuple[float, float]] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def busy_intervals(events: List[Dict]) -> List[Tuple[float, float]]:
+    """Busy time of events as epoch intervals
+
+    Events marked "free" (transparent) don't block time, and neither do
+    all-day events unless explicitly marked busy, matching Google Calendar.
+    """
+    intervals = []
+    for event in events:
+        if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+            continue
+        if 'dateTime' not in (event.get('start') or {}) and event.get('transparency') != 'opaque':
+            continue
+        intervals.append(event_bounds(event))
+    return intervals
+
+
+def _localize(tz, value: datetime) -> datetime:
+    # pytz zones need localize() to pick the right DST offset
+    return tz.localize(value) if hasattr(tz, 'localize') else value.replace(tzinfo=tz)
+
+
+def _round_up(ts: float) -> float:
+    return -(-ts // SLOT_STEP_SECONDS) * SLOT_STEP_SECONDS
+
+
+class FreeSlotFinder:
+    """Finds open slots in a window against a merged, sorted busy list
+
+    Busy intervals are padded by min_gap on both sides before merging, so
+    every proposal keeps that distance from existing events. Lookups use
+    bisection, so a search costs O(days + busy intervals touched).
+    """
+
+    def __init__(self, busy: List[Tuple[float, float]], tz, min_gap_minutes: int = 0):
+        self.tz = tz
+        self.min_gap = min_gap_minutes * 60
+        self.busy = merge_intervals([(s - self.min_gap, e + self.min_gap) for s, e in busy])
+        self._ends = [end for _, end in self.busy]
+
+    def _free_in(self, start: float, end: float, duration: float, limit: int) -> List[Tuple[float, float]]:
+        """Up to `limit` slots of `duration` inside [start, end), min_gap apart"""
+        slots = []
+        cursor = _round_up(start)
+        # First busy interval that hasn't ended by the cursor
+        i = bisect_right(self._ends, cursor)
+        while len(slots) < limit and cursor + duration <= end:
+            if i < len(self.busy) and self.busy[i][0] < cursor + duration:
+                cursor = _round_up(max(cursor, self.busy[i][1]))
+                i += 1
+                continue
+            slots.append((cursor, cursor + duration))
+            cursor = _round_up(cursor + duration + self.min_gap)
+        return slots
+
+    def find(self,
+             window_start: datetime,
+             window_end: datetime,
+             duration_minutes: int = 60,
+             count: int = 3,
+             work_start: dt_time = dt_time(9, 0),
+             work_end: dt_time = dt_time(21, 0),
+             max_per_day: Optional[int] = 1,
+             weekdays: Optional[List[int]] = None) -> List[Dict]:
+        """Earliest `count` free slots in the window, within working hours
+
+        weekdays limits the days searched (0 = Monday); max_per_day spreads
+        sessions across days (None for no limit).
+        """
+        if window_start.tzinfo is None:
+            window_start = _localize(self.tz, window_start)
+        if window_end.tzinfo is None:
+            window_end = _localize(self.tz, window_end)
+        window_lo, window_hi = window_start.timestamp(), window_end.timestamp()
+        duration = duration_minutes * 60
+
+        slots: List[Dict] = []
+        day: date = window_start.astimezone(self.tz).date()
+        last_day = window_end.astimezone(self.tz).date()
+        while day <= last_day and len(slots) < count:
+            if weekdays is None or day.weekday() in weekdays:
+                day_lo = max(window_lo, _localize(self.tz, datetime.combine(day, work_start)).timestamp())
+                day_hi = min(window_hi, _localize(self.tz, datetime.combine(day, work_end)).timestamp())
+                limit = count - len(slots)
+                if max_per_day is not None:
+                    limit = min(limit, max_per_day)
+                for start, end in self._free_in(day_lo, day_hi, duration, limit):
+                    slots.append({
+                        'start': datetime.fromtimestamp(start, self.tz),
+                        'end': datetime.fromtimestamp(end, self.tz)
+                    })
+            day += timedelta(days=1)
+        return slots
@@ -0,0 +1,322 @@
+"""
+Calendar sync
+Local event cache kept current with Google Calendar incremental sync (syncToken)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import observe_stage, stage_timer
+
+# Google accepts up to 1000 calls per batch but recommends keeping them small
+BATCH_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_events_end ON events (calendar_id, end_ts);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT,
+    synced_at REAL
+);
+"""
+
+
+class SyncTokenExpired(Exception):
+    """The server no longer accepts the sync token (HTTP 410); a full resync is needed"""
+
+
+def event_bounds(event: Dict) -> tuple:
+    """Start and end of an event as epoch seconds (all-day dates are local midnight)"""
+    def to_ts(point: Dict, fallback: float) -> float:
+        if not point:
+            return fallback
+        if point.get('dateTime'):
+            return datetime.fromisoformat(point['dateTime'].replace('Z', '+00:00')).timestamp()
+        if point.get('date'):
+            return datetime.fromisoformat(point['date']).timestamp()
+        return fallback
+
+    start = to_ts(event.get('start'), 0.0)
+    return start, to_ts(event.get('end'), start)
+
+
+class GoogleCalendarApi:
+    """Calendar API calls used by the sync layer, over the shared calendar service"""
+
+    def __init__(self, service_holder):
+        self._holder = service_holder
+
+    def _events(self):
+        # Looked up per call so a re-authenticated service is picked up
+        service = self._holder.get()
+        if service is None:
+            raise RuntimeError("Calendar is not authenticated")
+        return service.events()
+
+    def list_events(self, calendar_id: str, sync_token: Optional[str] = None,
+                    page_token: Optional[str] = None) -> Dict:
+        from googleapiclient.errors import HttpError
+        params = {'calendarId': calendar_id, 'singleEvents': True, 'maxResults': 2500}
+        if sync_token:
+            params['syncToken'] = sync_token
+        if page_token:
+            params['pageToken'] = page_token
+        try:
+            return self._holder.execute(self._events().list(**params))
+        except HttpError as e:
+            if e.resp.status == 410:
+                raise SyncTokenExpired()
+            raise
+
+    def insert_event(self, calendar_id: str, body: Dict) -> Dict:
+        return self._holder.execute(self._events().insert(calendarId=calendar_id, body=body))
+
+    def delete_event(self, calendar_id: str, event_id: str) -> None:
+        self._holder.execute(self._events().delete(calendarId=calendar_id, eventId=event_id))
+
+    def insert_events(self, calendar_id: str, bodies: List[Dict]) -> List[Tuple[Optional[Dict], Optional[str]]]:
+        """Insert events in HTTP batches of BATCH_SIZE; returns (event, error) per body"""
+        service = self._holder.get()
+        if service is None:
+            raise RuntimeError("Calendar is not authenticated")
+
+        results: List[Tuple[Optional[Dict], Optional[str]]] = [(None, None)] * len(bodies)
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            results[index] = (None, str(exception)) if exception is not None else (response, None)
+
+        for offset in range(0, len(bodies), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for index in range(offset, min(offset + BATCH_SIZE, len(bodies))):
+                batch.add(service.events().insert(calendarId=calendar_id, body=bodies[index]),
+                          request_id=str(index))
+            self._holder.execute(batch)
+        return results
+
+
+class EventCache:
+    """Events of each calendar in SQLite, indexed by end time for "upcoming" reads"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def apply(self, calendar_id: str, events: List[Dict], conn: Optional[sqlite3.Connection] = None):
+        """Upsert changed events and drop cancelled ones"""
+        conn = conn or self._conn()
+        for event in events:
+            if event.get('status') == 'cancelled':
+                conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event['id']))
+            else:
+                start, end = event_bounds(event)
+                conn.execute(
+                    "INSERT OR REPLACE INTO events (calendar_id, id, start_ts, end_ts, data) VALUES (?, ?, ?, ?, ?)",
+                    (calendar_id, event['id'], start, end, json.dumps(event, ensure_ascii=False))
+                )
+
+    def upsert(self, calendar_id: str, event: Dict):
+        self.upsert_many(calendar_id, [event])
+
+    def upsert_many(self, calendar_id: str, events: List[Dict]):
+        conn = self._conn()
+        with conn:
+            self.apply(calendar_id, events, conn)
+
+    def delete(self, calendar_id: str, event_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event_id))
+
+    def replace_all(self, calendar_id: str, events: List[Dict], sync_token: Optional[str]):
+        """Swap in the result of a full sync in one transaction"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            self.apply(calendar_id, events, conn)
+            self._save_state(conn, calendar_id, sync_token)
+
+    def apply_changes(self, calendar_id: str, events: List[Dict], sync_token: Optional[str]):
+        """Apply an incremental sync and its new token in one transaction"""
+        conn = self._conn()
+        with conn:
+            self.apply(calendar_id, events, conn)
+            self._save_state(conn, calendar_id, sync_token)
+
+    @staticmethod
+    def _save_state(conn: sqlite3.Connection, calendar_id: str, sync_token: Optional[str]):
+        conn.execute("INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+                     (calendar_id, sync_token, time.time()))
+
+    def sync_state(self, calendar_id: str) -> Dict:
+        row = self._conn().execute("SELECT sync_token, synced_at FROM sync_state WHERE calendar_id = ?",
+                                   (calendar_id,)).fetchone()
+        return dict(row) if row else {'sync_token': None, 'synced_at': None}
+
+    def upcoming(self, calendar_id: str, limit: int = 10, now: Optional[float] = None) -> List[Dict]:
+        """Events that haven't ended yet, soonest first"""
+        now = time.time() if now is None else now
+        rows = self._conn().execute(
+            "SELECT data FROM events WHERE calendar_id = ? AND end_ts > ? ORDER BY start_ts LIMIT ?",
+            (calendar_id, now, limit)
+        ).fetchall()
+        return [json.loads(r['data']) for r in rows]
+
+    def between(self, calendar_id: str, start: float, end: float) -> List[Dict]:
+        """Events overlapping [start, end), in start order"""
+        rows = self._conn().execute(
+            "SELECT data FROM events WHERE calendar_id = ? AND end_ts > ? AND start_ts < ? ORDER BY start_ts",
+            (calendar_id, start, end)
+        ).fetchall()
+        return [json.loads(r['data']) for r in rows]
+
+    def busy_between(self, calendar_id: str, start: float, end: float) -> List[Tuple[float, float]]:
+        """Busy (start, end) intervals overlapping [start, end), without decoding events
+
+        Same rule as calendar_slots.busy_intervals: "free" events and
+        all-day events not explicitly marked busy are skipped.
+        """
+        rows = self._conn().execute(
+            "SELECT start_ts, end_ts FROM events WHERE calendar_id = ? AND end_ts > ? AND start_ts < ? "
+            "AND coalesce(json_extract(data, '$.transparency'), '') != 'transparent' "
+            "AND (json_extract(data, '$.start.dateTime') IS NOT NULL "
+            "OR json_extract(data, '$.transparency') = 'opaque') ORDER BY start_ts",
+            (calendar_id, start, end)
+        ).fetchall()
+        return [(r['start_ts'], r['end_ts']) for r in rows]
+
+
+class CalendarSync:
+    """Serves calendar reads from the local cache and keeps it current
+
+    The first read does a full sync. Later reads return cached events
+    immediately, and once the cache is older than max_age seconds a
+    background thread fetches only what changed since the last sync token.
+    If the token has expired, the cache is rebuilt with a full sync.
+    """
+
+    def __init__(self, api, cache: EventCache, calendar_id: str = 'primary', max_age: float = 60):
+        self.api = api
+        self.cache = cache
+        self.calendar_id = calendar_id
+        self.max_age = max_age
+        self._sync_lock = threading.Lock()
+        self.stats = {'full_syncs': 0, 'incremental_syncs': 0, 'api_pages': 0, 'cache_reads': 0}
+
+    def _list_all(self, sync_token: Optional[str]) -> tuple:
+        events, page_token = [], None
+        while True:
+            with stage_timer('calendar', 'api_list'):
+                page = self.api.list_events(self.calendar_id, sync_token=sync_token, page_token=page_token)
+            self.stats['api_pages'] += 1
+            events.extend(page.get('items', []))
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return events, page.get('nextSyncToken')
+
+    def sync(self) -> str:
+        """Bring the cache up to date; returns 'full' or 'incremental'"""
+        with self._sync_lock:
+            started = time.perf_counter()
+            sync_token = self.cache.sync_state(self.calendar_id)['sync_token']
+            if sync_token:
+                try:
+                    events, next_token = self._list_all(sync_token)
+                    self.cache.apply_changes(self.calendar_id, events, next_token)
+                    self.stats['incremental_syncs'] += 1
+                    observe_stage('calendar', 'sync_incremental', time.perf_counter() - started)
+                    return 'incremental'
+                except SyncTokenExpired:
+                    print("📅 Calendar sync token expired, doing a full resync")
+
+            events, next_token = self._list_all(None)
+            self.cache.replace_all(self.calendar_id, events, next_token)
+            self.stats['full_syncs'] += 1
+            observe_stage('calendar', 'sync_full', time.perf_counter() - started)
+            return 'full'
+
+    def _sync_in_background(self):
+        def run():
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Calendar background sync failed: {str(e)}")
+
+        if not self._sync_lock.locked():
+            threading.Thread(target=run, name="calendar-sync", daemon=True).start()
+
+    def ensure_fresh(self):
+        """Sync now if the cache was never filled, or refresh it in the background if stale"""
+        synced_at = self.cache.sync_state(self.calendar_id)['synced_at']
+        if synced_at is None:
+            self.sync()
+        elif time.time() - synced_at > self.max_age:
+            self._sync_in_background()
+
+    def upcoming(self, limit: int = 10) -> List[Dict]:
+        self.ensure_fresh()
+        self.stats['cache_reads'] += 1
+        return self.cache.upcoming(self.calendar_id, limit)
+
+    def between(self, start: float, end: float) -> List[Dict]:
+        self.ensure_fresh()
+        self.stats['cache_reads'] += 1
+        return self.cache.between(self.calendar_id, start, end)
+
+    def busy_between(self, start: float, end: float) -> List[Tuple[float, float]]:
+        self.ensure_fresh()
+        self.stats['cache_reads'] += 1
+        return self.cache.busy_between(self.calendar_id, start, end)
+
+    def create(self, body: Dict) -> Dict:
+        """Create an event (write-through to the cache)"""
+        with stage_timer('calendar', 'api_insert'):
+            event = self.api.insert_event(self.calendar_id, body)
+        if body.get('recurrence'):
+            # The cache holds expanded instances, which only a sync returns
+            self.sync()
+        else:
+            self.cache.upsert(self.calendar_id, event)
+        return event
+
+    def create_many(self, bodies: List[Dict]) -> List[Tuple[Optional[Dict], Optional[str]]]:
+        """Create events in batched requests; returns (event, error) per body"""
+        with stage_timer('calendar', 'api_batch_insert'):
+            results = self.api.insert_events(self.calendar_id, bodies)
+        self.cache.upsert_many(self.calendar_id, [event for event, error in results if event is not None])
+        return results
+
+    def delete(self, event_id: str) -> None:
+        """Delete an event (write-through to the cache)"""
+        with stage_timer('calendar', 'api_delete'):
+            self.api.delete_event(self.calendar_id, event_id)
+        self.cache.delete(self.calendar_id, event_id)
@@ -0,0 +1,233 @@
+"""
+Cold chat archive
+Moves chats untouched for a while into gzip segments with an offset index
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.chat_store_jsonl import _atomic_write_json, _file_stamp, _flocked
+
+INDEX_NAME = "index.idx"
+LOCK_NAME = ".archive.lock"
+INDEX_LOCK_NAME = ".index.lock"
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+COMPRESS_LEVEL = 9
+# A lock file older than this is left over from a crashed job
+STALE_LOCK_SECONDS = 3600
+
+
+class ChatArchive:
+    """Archived chats as gzip members appended to segment files
+
+    Each chat is compressed on its own, so loading one is a seek and a
+    single member decompress. The index maps chat IDs to (segment, offset,
+    length) along with the metadata needed to list them. Changes to the
+    index and segments hold an flock, so the archival job in one worker and
+    restores or deletes in another never overwrite each other's index.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / INDEX_NAME
+        self.lock_path = self.directory / INDEX_LOCK_NAME
+        self._lock = threading.Lock()
+        self._index: Optional[Dict] = None
+        self._index_stamp: Optional[tuple] = None
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the write lock: the thread lock, plus an flock shared by all worker processes"""
+        with self._lock, _flocked(self.lock_path):
+            yield
+
+    def _load_index(self) -> Dict:
+        """Load (and cache) the index; must hold the lock"""
+        stamp = _file_stamp(self.index_path)
+        if self._index is None or stamp != self._index_stamp:
+            if stamp is not None:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {'segment': 1, 'chats': {}}
+            self._index_stamp = stamp
+        return self._index
+
+    def _write_index(self) -> None:
+        _atomic_write_json(self.index_path, self._index)
+        self._index_stamp = _file_stamp(self.index_path)
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:06d}.gz"
+
+    def add(self, chat_data: Dict) -> bool:
+        """Compress a chat into the current segment"""
+        raw = json.dumps(chat_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        member = gzip.compress(raw, COMPRESS_LEVEL)
+
+        with self._exclusive():
+            index = self._load_index()
+            segment_path = self._segment_path(index['segment'])
+            if segment_path.exists() and segment_path.stat().st_size + len(member) > SEGMENT_MAX_BYTES:
+                index['segment'] += 1
+                segment_path = self._segment_path(index['segment'])
+
+            with open(segment_path, 'ab') as f:
+                offset = f.tell()
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+
+            index['chats'][chat_data['id']] = {
+                'id': chat_data['id'],
+                'title': chat_data.get('title', 'Untitled Chat'),
+                'timestamp': chat_data.get('timestamp'),
+                'message_count': chat_data.get('message_count', len(chat_data.get('messages', []))),
+                'segment': index['segment'],
+                'offset': offset,
+                'length': len(member),
+                'size': len(raw),
+                'archived_at': datetime.now().isoformat()
+            }
+            self._write_index()
+        return True
+
+    def load(self, chat_id: str) -> Optional[Dict]:
+        """Load an archived chat by decompressing its member"""
+        with self._lock:
+            entry = self._load_index()['chats'].get(chat_id)
+        if entry is None:
+            return None
+        with open(self._segment_path(entry['segment']), 'rb') as f:
+            f.seek(entry['offset'])
+            member = f.read(entry['length'])
+        return json.loads(gzip.decompress(member).decode('utf-8'))
+
+    def contains(self, chat_id: str) -> bool:
+        with self._lock:
+            return chat_id in self._load_index()['chats']
+
+    def remove(self, chat_id: str) -> bool:
+        """Drop a chat from the index (its bytes are reclaimed when the segment is emptied)"""
+        with self._exclusive():
+            index = self._load_index()
+            entry = index['chats'].pop(chat_id, None)
+            if entry is None:
+                return False
+            self._write_index()
+            self._drop_empty_segment(entry['segment'])
+        return True
+
+    def _drop_empty_segment(self, segment: int) -> None:
+        """Delete a finished segment once no indexed chat points into it; must hold the lock"""
+        index = self._index
+        if segment == index['segment']:
+            return
+        if not any(e['segment'] == segment for e in index['chats'].values()):
+            path = self._segment_path(segment)
+            if path.exists():
+                path.unlink()
+
+    def list_chats(self, limit: Optional[int] = None, offset: int = 0,
+                   before: Optional[tuple] = None) -> List[Dict]:
+        """List archived chat metadata, newest first"""
+        with self._lock:
+            chats = [
+                {k: e.get(k) for k in ('id', 'title', 'timestamp', 'message_count')}
+                for e in self._load_index()['chats'].values()
+            ]
+        for chat in chats:
+            chat['archived'] = True
+        if before is not None:
+            chats = [c for c in chats if (c.get('timestamp') or '', c.get('id') or '') < tuple(before)]
+        chats.sort(key=lambda x: (x.get('timestamp') or '', x.get('id') or ''), reverse=True)
+        return chats[offset:] if limit is None else chats[offset:offset + limit]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            index = self._load_index()
+            entries = list(index['chats'].values())
+        compressed = sum(e['length'] for e in entries)
+        original = sum(e.get('size', 0) for e in entries)
+        segments = sorted(self.directory.glob("segment-*.gz"))
+        return {
+            'chats': len(entries),
+            'segments': len(segments),
+            'disk_bytes': sum(p.stat().st_size for p in segments),
+            'compressed_bytes': compressed,
+            'original_bytes': original,
+            'compression_ratio': round(original / compressed, 2) if compressed else None
+        }
+
+    def acquire_job_lock(self) -> bool:
+        """Let only one worker process run the archival job at a time"""
+        lock_path = self.directory / LOCK_NAME
+        try:
+            if lock_path.exists() and time.time() - lock_path.stat().st_mtime > STALE_LOCK_SECONDS:
+                lock_path.unlink()
+            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except (FileExistsError, FileNotFoundError):
+            return False
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        return True
+
+    def release_job_lock(self) -> None:
+        lock_path = self.directory / LOCK_NAME
+        if lock_path.exists():
+            lock_path.unlink()
+
+
+def archive_cold_chats(store, archive: ChatArchive, days: int, retention_days: int = 0) -> Dict:
+    """Move chats untouched for `days` days from the store into the archive
+
+    With retention_days > 0, archived chats older than that are purged.
+    """
+    result = {'archived': 0, 'purged': 0, 'skipped': 0}
+    if not archive.acquire_job_lock():
+        return result
+
+    try:
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        # Oldest chats sit at the end of the newest-first listing
+        cold = [c for c in store.list_chats() if (c.get('timestamp') or '') < cutoff]
+        for chat in cold:
+            chat_id = chat['id']
+            chat_data = store.load_chat(chat_id)
+            if chat_data is None:
+                continue
+            archive.add(chat_data)
+
+            # A turn that arrived while compressing keeps the chat hot
+            meta = store.chat_meta(chat_id)
+            if meta is None or meta.get('message_count') != chat_data.get('message_count') \
+                    or meta.get('timestamp') != chat_data.get('timestamp'):
+                archive.remove(chat_id)
+                result['skipped'] += 1
+                continue
+
+            # No tombstone: the chat is still listed (after the hot chats), so
+            # delta listings must not tell clients it was deleted
+            store.delete_chat(chat_id, tombstone=False)
+            result['archived'] += 1
+
+        if retention_days > 0:
+            purge_before = (datetime.now() - timedelta(days=retention_days)).isoformat()
+            for chat in archive.list_chats():
+                if (chat.get('timestamp') or '') < purge_before:
+                    archive.remove(chat['id'])
+                    result['purged'] += 1
+    finally:
+        archive.release_job_lock()
+
+    if result['archived'] or result['purged']:
+        print(f"🗄️ Archived {result['archived']} cold chats, purged {result['purged']}")
+    return result
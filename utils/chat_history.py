@@ -3,19 +3,73 @@ Chat history management
 Handles saving, loading, and managing chat conversations
 """
 
+import base64
 import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
 
+from utils.chat_search import InvertedIndex, add_snippets, parse_query
+from utils.chat_archive import ChatArchive, archive_cold_chats
+from utils.metrics import record_cache
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: served by a single process, so there is nothing to coordinate
+    fcntl = None
+
 CHAT_HISTORY_DIR = Path("chat_history")
 CHAT_HISTORY_DIR.mkdir(exist_ok=True)
 
 
-def save_chat_history(chat_id: str, messages: List[Dict], title: str):
-    """Save chat history to a JSON file"""
-    try:
-        chat_file = CHAT_HISTORY_DIR / f"{chat_id}.json"
+class JsonChatStore:
+    """Chat history as one pretty-printed JSON file per chat"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        # Serializes chat file writes (request threads and background memo updates)
+        self._write_lock = threading.Lock()
+        self._search_index = InvertedIndex()
+        # chat_id -> ((mtime_ns, size), metadata), so chat_meta doesn't parse unchanged files
+        self._meta: Dict[str, tuple] = {}
+
+    @staticmethod
+    def _stamp(chat_file: Path) -> Optional[tuple]:
+        try:
+            st = chat_file.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _meta_of(chat_data: Dict) -> Dict:
+        return {
+            'id': chat_data.get('id'),
+            'title': chat_data.get('title', 'Untitled Chat'),
+            'timestamp': chat_data.get('timestamp'),
+            'message_count': chat_data.get('message_count', 0)
+        }
+
+    def _write_chat(self, chat_id: str, chat_data: Dict) -> None:
+        """Write a chat file and refresh its cached metadata; must hold the write lock"""
+        chat_file = self.directory / f"{chat_id}.json"
+        with open(chat_file, 'w', encoding='utf-8') as f:
+            json.dump(chat_data, f, indent=2, ensure_ascii=False)
+        self._meta[chat_id] = (self._stamp(chat_file), self._meta_of(chat_data))
+
+    def save_chat(self, chat_id: str, messages: List[Dict], title: str, memo: Optional[Dict] = None) -> bool:
+        with self._write_lock:
+            self._save_chat(chat_id, messages, title, memo)
+        return True
+
+    def _save_chat(self, chat_id: str, messages: List[Dict], title: str, memo: Optional[Dict]) -> None:
         chat_data = {
             'id': chat_id,
             'title': title,
@@ -23,67 +77,445 @@ def save_chat_history(chat_id: str, messages: List[Dict], title: str):
             'timestamp': datetime.now().isoformat(),
             'message_count': len(messages)
         }
-        with open(chat_file, 'w', encoding='utf-8') as f:
-            json.dump(chat_data, f, indent=2, ensure_ascii=False)
-        
+        if memo:
+            chat_data['memo'] = memo
+        self._write_chat(chat_id, chat_data)
+
+    def append_messages(self, chat_id: str, new_messages: List[Dict], title: str) -> bool:
+        # Read and rewrite under the lock, so a memo saved in between isn't overwritten
+        with self._write_lock:
+            chat_data = self.load_chat(chat_id) or {}
+            self._save_chat(chat_id, chat_data.get('messages', []) + new_messages, title, chat_data.get('memo'))
+        return True
+
+    def save_memo(self, chat_id: str, memo: Dict) -> bool:
+        chat_file = self.directory / f"{chat_id}.json"
+        with self._write_lock:
+            if not chat_file.exists():
+                return False
+            with open(chat_file, 'r', encoding='utf-8') as f:
+                chat_data = json.load(f)
+            chat_data['memo'] = memo
+            self._write_chat(chat_id, chat_data)
         return True
+
+    def load_chat(self, chat_id: str, last_n: Optional[int] = None) -> Optional[Dict]:
+        chat_file = self.directory / f"{chat_id}.json"
+        if not chat_file.exists():
+            return None
+        with open(chat_file, 'r', encoding='utf-8') as f:
+            chat_data = json.load(f)
+        if last_n is not None:
+            chat_data['messages'] = chat_data.get('messages', [])[-last_n:] if last_n else []
+        return chat_data
+
+    def load_memo(self, chat_id: str) -> Optional[Dict]:
+        chat_data = self.load_chat(chat_id, last_n=0)
+        return chat_data.get('memo') if chat_data else None
+
+    def chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """Get a chat's metadata, parsing the file only when its mtime or size changed"""
+        chat_file = self.directory / f"{chat_id}.json"
+        stamp = self._stamp(chat_file)
+        if stamp is None:
+            self._meta.pop(chat_id, None)
+            return None
+        cached = self._meta.get(chat_id)
+        if cached is not None and cached[0] == stamp:
+            return dict(cached[1])
+
+        chat_data = self.load_chat(chat_id)
+        if chat_data is None:
+            return None
+        meta = self._meta_of(chat_data)
+        self._meta[chat_id] = (stamp, meta)
+        return dict(meta)
+
+    def list_chats(self, limit: Optional[int] = None, offset: int = 0,
+                   before: Optional[tuple] = None) -> List[Dict]:
+        """List chat metadata, newest first; only files changed since the last listing are parsed"""
+        chats = []
+        for chat_file in self.directory.glob("*.json"):
+            try:
+                meta = self.chat_meta(chat_file.stem)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable chat file {chat_file.name}: {str(e)}")
+                continue
+            if meta is not None:
+                chats.append(meta)
+
+        if before is not None:
+            chats = [c for c in chats if (c.get('timestamp') or '', c.get('id') or '') < tuple(before)]
+
+        # Sort by timestamp (newest first)
+        chats.sort(key=lambda x: (x.get('timestamp') or '', x.get('id') or ''), reverse=True)
+        return chats[offset:] if limit is None else chats[offset:offset + limit]
+
+    def list_version(self) -> Optional[int]:
+        # Per-file JSON has no shared counter, so listings can't be revalidated
+        return None
+
+    def search(self, terms: List[str], limit: int = 20) -> List[Dict]:
+        def message_at(chat_id: str, seq: int) -> Optional[Dict]:
+            messages = (self.load_chat(chat_id) or {}).get('messages', [])
+            return messages[seq] if seq < len(messages) else None
+
+        # Listing reads every file, so this store suits small histories only
+        self._search_index.sync(
+            self.list_chats(),
+            lambda chat_id, start, count: (self.load_chat(chat_id) or {}).get('messages', [])[start:count]
+        )
+        return add_snippets(self._search_index.search(terms, limit), terms, message_at)
+
+    def delete_chat(self, chat_id: str, tombstone: bool = True) -> bool:
+        # No delta listings, so there are no tombstones to keep
+        chat_file = self.directory / f"{chat_id}.json"
+        self._meta.pop(chat_id, None)
+        if chat_file.exists():
+            chat_file.unlink()
+            return True
+        return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chat_store():
+    """Get the configured chat store (CHAT_STORE=sqlite|jsonl|json, default sqlite)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv('CHAT_STORE', 'sqlite').lower()
+            if backend == 'json':
+                _store = JsonChatStore(CHAT_HISTORY_DIR)
+            elif backend == 'jsonl':
+                from utils.chat_store_jsonl import JsonlChatStore
+                _store = JsonlChatStore(CHAT_HISTORY_DIR)
+                _store.migrate_json_files(CHAT_HISTORY_DIR)
+            else:
+                from utils.chat_store_sqlite import SQLiteChatStore
+                _store = SQLiteChatStore(Path(os.getenv('CHAT_DB_PATH', str(CHAT_HISTORY_DIR / 'chats.db'))))
+                # Existing JSON chats are imported once on first start
+                _store.migrate_json_files(CHAT_HISTORY_DIR)
+        return _store
+
+
+_archive = None
+
+
+def get_chat_archive() -> ChatArchive:
+    """Get the archive of cold chats (CHAT_ARCHIVE_DIR, default chat_history/archive)"""
+    global _archive
+    with _store_lock:
+        if _archive is None:
+            _archive = ChatArchive(Path(os.getenv('CHAT_ARCHIVE_DIR', str(CHAT_HISTORY_DIR / 'archive'))))
+        return _archive
+
+
+def _restore_archived(chat_id: str) -> bool:
+    """Move an archived chat back into the store so it can be continued"""
+    archive = get_chat_archive()
+    chat_data = archive.load(chat_id)
+    if chat_data is None:
+        return False
+    get_chat_store().save_chat(chat_id, chat_data.get('messages', []), chat_data.get('title', 'New Chat'),
+                               chat_data.get('memo'))
+    archive.remove(chat_id)
+    print(f"🗄️ Restored archived chat {chat_id}")
+    return True
+
+
+class ConversationCache:
+    """Bounded LRU cache of recently used conversations
+
+    Entries are checked against the store's message count before use, so a
+    chat extended by another worker process is reloaded instead of served stale.
+    """
+
+    def __init__(self, max_chats: int = 128):
+        self.max_chats = max_chats
+        self._chats: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: str) -> Optional[Dict]:
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                self._chats.move_to_end(chat_id)
+            return chat
+
+    def put(self, chat_id: str, chat: Dict):
+        with self._lock:
+            self._chats[chat_id] = chat
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def extend(self, chat_id: str, new_messages: List[Dict], title: str):
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                chat['messages'] = chat['messages'] + new_messages
+                chat['message_count'] = len(chat['messages'])
+                chat['title'] = title
+
+    def drop(self, chat_id: str):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+
+_conversations = ConversationCache(int(os.getenv('CHAT_CACHE_SIZE', '128')))
+
+
+def get_conversation(chat_id: Optional[str]) -> Optional[Dict]:
+    """Get a chat's title and messages, from the hot cache when it is current"""
+    if not chat_id:
+        return None
+    try:
+        cached = _conversations.get(chat_id)
+        meta = get_chat_store().chat_meta(chat_id)
+        if meta is None and _restore_archived(chat_id):
+            meta = get_chat_store().chat_meta(chat_id)
+        if meta is None:
+            _conversations.drop(chat_id)
+            return None
+        if cached is not None and cached['message_count'] == meta['message_count']:
+            record_cache('conversation', True)
+            return cached
+
+        record_cache('conversation', False)
+        chat_data = get_chat_store().load_chat(chat_id)
+        if chat_data is None:
+            return None
+        chat = {
+            'id': chat_id,
+            'title': chat_data.get('title', 'New Chat'),
+            'messages': chat_data.get('messages', []),
+            'message_count': len(chat_data.get('messages', []))
+        }
+        _conversations.put(chat_id, chat)
+        return chat
+    except Exception as e:
+        print(f"Error loading chat: {str(e)}")
+        return None
+
+
+def save_chat_history(chat_id: str, messages: List[Dict], title: str, memo: Optional[Dict] = None):
+    """Save chat history (and its running memo, if any)"""
+    try:
+        _conversations.drop(chat_id)
+        return get_chat_store().save_chat(chat_id, messages, title, memo)
     except Exception as e:
         print(f"Error saving chat: {str(e)}")
         return False
 
 
-def load_chat_history(chat_id: str) -> Optional[Dict]:
-    """Load chat history from a JSON file"""
+def append_chat_messages(chat_id: str, new_messages: List[Dict], title: str):
+    """Append new messages to a chat without rewriting the earlier ones"""
     try:
-        chat_file = CHAT_HISTORY_DIR / f"{chat_id}.json"
-        if chat_file.exists():
-            with open(chat_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        saved = get_chat_store().append_messages(chat_id, new_messages, title)
+        _conversations.extend(chat_id, new_messages, title)
+        return saved
+    except Exception as e:
+        print(f"Error saving chat: {str(e)}")
+        return False
+
+
+def save_chat_memo(chat_id: str, memo: Dict):
+    """Store the running conversation memo with an existing chat"""
+    try:
+        return get_chat_store().save_memo(chat_id, memo)
+    except Exception as e:
+        print(f"Error saving chat memo: {str(e)}")
+        return False
+
+
+def load_chat_memo(chat_id: str) -> Optional[Dict]:
+    """Load a chat's running memo from the store (None if the chat has none)"""
+    try:
+        return get_chat_store().load_memo(chat_id)
+    except Exception as e:
+        print(f"Error loading chat memo: {str(e)}")
         return None
+
+
+def load_chat_history(chat_id: str, last_n: Optional[int] = None) -> Optional[Dict]:
+    """Load chat history (from the archive if it has gone cold), optionally only the last_n messages"""
+    try:
+        chat_data = get_chat_store().load_chat(chat_id, last_n)
+        if chat_data is None:
+            chat_data = get_chat_archive().load(chat_id)
+            if chat_data is not None:
+                chat_data['archived'] = True
+                if last_n is not None:
+                    chat_data['messages'] = chat_data.get('messages', [])[-last_n:] if last_n else []
+        return chat_data
     except Exception as e:
         print(f"Error loading chat: {str(e)}")
         return None
 
 
-def get_all_chats() -> List[Dict]:
-    """Get all saved chat histories"""
+def get_all_chats(limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """Get saved chat histories (newest first, archived ones last), optionally one page at a time"""
     try:
-        chats = []
-        for chat_file in CHAT_HISTORY_DIR.glob("*.json"):
-            try:
-                with open(chat_file, 'r', encoding='utf-8') as f:
-                    chat_data = json.load(f)
-                    chats.append({
-                        'id': chat_data.get('id'),
-                        'title': chat_data.get('title', 'Untitled Chat'),
-                        'timestamp': chat_data.get('timestamp'),
-                        'message_count': chat_data.get('message_count', 0)
-                    })
-            except:
-                continue
-        
-        # Sort by timestamp (newest first)
-        chats.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        return chats
+        chats = get_chat_store().list_chats() + get_chat_archive().list_chats()
+        return chats[offset:] if limit is None else chats[offset:offset + limit]
     except Exception as e:
         print(f"Error getting chats: {str(e)}")
         return []
 
 
+def encode_cursor(chat: Dict) -> str:
+    """Opaque pagination cursor pointing just after a listed chat"""
+    raw = json.dumps([chat.get('timestamp') or '', chat.get('id') or ''])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a pagination cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, chat_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return str(timestamp), str(chat_id)
+
+
+def get_chats_page(limit: int, cursor: Optional[str] = None) -> Dict:
+    """Get one page of chats (newest first) and the cursor of the next page"""
+    before = decode_cursor(cursor) if cursor else None
+    try:
+        chats = get_chat_store().list_chats(limit + 1, 0, before)
+        if len(chats) <= limit:
+            # Hot chats exhausted; archived chats are all older, so they follow
+            if chats:
+                before = (chats[-1].get('timestamp') or '', chats[-1].get('id') or '')
+            chats += get_chat_archive().list_chats(limit + 1 - len(chats), 0, before)
+    except Exception as e:
+        print(f"Error getting chats: {str(e)}")
+        chats = []
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+    return {
+        'chats': chats,
+        'next_cursor': encode_cursor(chats[-1]) if has_more else None
+    }
+
+
+def get_chat_list_version() -> Optional[int]:
+    """Current chat list version, or None if the store doesn't track one"""
+    try:
+        return get_chat_store().list_version()
+    except Exception as e:
+        print(f"Error getting chat list version: {str(e)}")
+        return None
+
+
+def get_chat_changes(since: int) -> Optional[Dict]:
+    """Chats changed and deleted since a list version, or None if the store can't tell"""
+    try:
+        store = get_chat_store()
+        if store.list_version() is None:
+            return None
+        return store.changes_since(since)
+    except Exception as e:
+        print(f"Error getting chat changes: {str(e)}")
+        return None
+
+
+def search_chats(query: str, limit: int = 20) -> List[Dict]:
+    """Full-text search over chat messages, best-matching chats first"""
+    terms = parse_query(query)
+    if not terms:
+        return []
+    try:
+        store = get_chat_store()
+        results = []
+        for result in store.search(terms, limit):
+            meta = store.chat_meta(result['id'])
+            if meta:
+                results.append({**meta, **result})
+        return results
+    except Exception as e:
+        print(f"Error searching chats: {str(e)}")
+        return []
+
+
 def delete_chat(chat_id: str):
-    """Delete a chat history file"""
+    """Delete a chat history"""
     try:
-        chat_file = CHAT_HISTORY_DIR / f"{chat_id}.json"
-        if chat_file.exists():
-            chat_file.unlink()
-            return True
-        return False
+        _conversations.drop(chat_id)
+        archived = get_chat_archive().remove(chat_id)
+        return get_chat_store().delete_chat(chat_id) or archived
     except Exception as e:
         print(f"Error deleting chat: {str(e)}")
         return False
 
 
+def run_archive_job() -> Dict:
+    """Archive chats untouched for CHAT_ARCHIVE_DAYS days (0 disables) and purge past CHAT_RETENTION_DAYS"""
+    days = int(os.getenv('CHAT_ARCHIVE_DAYS', '90'))
+    if days <= 0:
+        return {'archived': 0, 'purged': 0, 'skipped': 0}
+    try:
+        store = get_chat_store()
+        result = archive_cold_chats(store, get_chat_archive(), days, int(os.getenv('CHAT_RETENTION_DAYS', '0')))
+        if result['archived'] and hasattr(store, 'compact'):
+            store.compact()
+        return result
+    except Exception as e:
+        print(f"Error archiving chats: {str(e)}")
+        return {'archived': 0, 'purged': 0, 'skipped': 0}
+
+
+_archive_thread = None
+_archive_lock_file = None
+
+
+def _claim_archiver() -> bool:
+    """Take the host-wide archiver lock, held until this process exits
+
+    With several worker processes only the one holding it runs the job; the
+    others would only contend for the same chat files.
+    """
+    global _archive_lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(CHAT_HISTORY_DIR / '.archiver.lock', 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _archive_lock_file = lock_file
+    return True
+
+
+def start_archive_job():
+    """Run the archival job now and then every CHAT_ARCHIVE_INTERVAL_HOURS in the background"""
+    global _archive_thread
+    with _store_lock:
+        if _archive_thread is not None or int(os.getenv('CHAT_ARCHIVE_DAYS', '90')) <= 0:
+            return
+        if not _claim_archiver():
+            return
+        interval = float(os.getenv('CHAT_ARCHIVE_INTERVAL_HOURS', '24')) * 3600
+
+        def loop():
+            while True:
+                run_archive_job()
+                time.sleep(interval)
+
+        _archive_thread = threading.Thread(target=loop, name="chat-archiver", daemon=True)
+        _archive_thread.start()
+
+
+def new_chat_id() -> str:
+    """A chat ID that sorts by creation time and is unique across worker processes"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+
+
 def generate_chat_title(first_message: str) -> str:
     """Generate a chat title from the first user message"""
     title = first_message[:50]
@@ -0,0 +1,192 @@
+"""
+Chat history search
+Query parsing, snippet highlighting and an in-memory inverted index for the file-based stores
+"""
+
+import html
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Private-use characters mark matches inside raw text; they are swapped for
+# <mark> tags after the snippet has been HTML-escaped
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+ELLIPSIS = "…"
+SNIPPET_TOKENS = 12
+
+# BM25 parameters (same defaults as SQLite FTS5)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+def parse_query(query: str) -> List[str]:
+    """Get the search terms of a query (all must match; the last one as a prefix)"""
+    return tokenize(query)[:16]
+
+
+def fts_match_query(terms: List[str]) -> str:
+    """Build an FTS5 MATCH expression from search terms, quoting each one"""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def render_snippet(raw: str) -> str:
+    """HTML-escape a snippet and turn its match markers into <mark> tags"""
+    return html.escape(raw).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def make_snippet(text: str, terms: List[str], width: int = SNIPPET_TOKENS) -> str:
+    """Cut a window of about width tokens around the first match and highlight the matches"""
+    words = list(TOKEN_PATTERN.finditer(text or ''))
+    if not words:
+        return ''
+
+    def matches(word: str) -> bool:
+        word = word.lower()
+        return word in terms[:-1] or word.startswith(terms[-1])
+
+    first = next((i for i, m in enumerate(words) if matches(m.group())), 0)
+    start = max(0, min(first - width // 3, len(words) - width))
+    end = min(len(words), start + width)
+
+    parts = [ELLIPSIS] if start > 0 else []
+    position = words[start].start()
+    for m in words[start:end]:
+        parts.append(text[position:m.start()])
+        parts.append(f"{MATCH_START}{m.group()}{MATCH_END}" if matches(m.group()) else m.group())
+        position = m.end()
+    if end < len(words):
+        parts.append(ELLIPSIS)
+    else:
+        parts.append(text[position:])
+    return render_snippet(''.join(parts).strip())
+
+
+class InvertedIndex:
+    """Incrementally maintained inverted index over chat messages
+
+    Each message is a document. The index remembers how many messages of
+    each chat it has seen, so syncing against the store's chat list only
+    reads messages appended since the last search.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Tuple[str, int], int]] = defaultdict(dict)
+        self._lengths: Dict[Tuple[str, int], int] = {}
+        self._chats: Dict[str, List[Tuple[int, List[str]]]] = {}
+        self._indexed: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def _add_message(self, chat_id: str, seq: int, content: str):
+        tokens = tokenize(content)
+        counts: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for token, tf in counts.items():
+            self._postings[token][(chat_id, seq)] = tf
+        self._lengths[(chat_id, seq)] = len(tokens)
+        self._total_length += len(tokens)
+        self._chats.setdefault(chat_id, []).append((seq, list(counts)))
+
+    def _remove_chat(self, chat_id: str):
+        for seq, tokens in self._chats.pop(chat_id, []):
+            for token in tokens:
+                postings = self._postings.get(token)
+                if postings is not None:
+                    postings.pop((chat_id, seq), None)
+                    if not postings:
+                        del self._postings[token]
+            self._total_length -= self._lengths.pop((chat_id, seq), 0)
+        self._indexed.pop(chat_id, None)
+
+    def sync(self, chats: Iterable[Dict], read_messages: Callable[[str, int, int], Iterable[Dict]]):
+        """Bring the index up to date with the store's chat list
+
+        read_messages(chat_id, start, count) yields a chat's messages from
+        position start up to its message_count.
+        """
+        with self._lock:
+            seen = set()
+            for chat in chats:
+                chat_id, count = chat['id'], chat.get('message_count', 0)
+                seen.add(chat_id)
+                indexed = self._indexed.get(chat_id, 0)
+                if count == indexed:
+                    continue
+                if count < indexed:
+                    # History was rewritten; index the chat again
+                    self._remove_chat(chat_id)
+                    indexed = 0
+                for seq, message in enumerate(read_messages(chat_id, indexed, count), start=indexed):
+                    self._add_message(chat_id, seq, message.get('content', ''))
+                self._indexed[chat_id] = count
+
+            for chat_id in set(self._indexed) - seen:
+                self._remove_chat(chat_id)
+
+    def _matching_tokens(self, term: str, prefix: bool) -> List[str]:
+        if not prefix:
+            return [term] if term in self._postings else []
+        return [token for token in self._postings if token.startswith(term)]
+
+    def search(self, terms: List[str], limit: int = 20) -> List[Dict]:
+        """Rank chats by their best-matching message (BM25); every term must match"""
+        if not terms:
+            return []
+
+        with self._lock:
+            documents = len(self._lengths)
+            if not documents:
+                return []
+            average_length = self._total_length / documents
+
+            scores: Optional[Dict[Tuple[str, int], float]] = None
+            for i, term in enumerate(terms):
+                term_scores: Dict[Tuple[str, int], float] = defaultdict(float)
+                for token in self._matching_tokens(term, prefix=i == len(terms) - 1):
+                    postings = self._postings[token]
+                    idf = math.log((documents - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+                    for doc, tf in postings.items():
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc] / average_length)
+                        term_scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc: score + term_scores[doc] for doc, score in scores.items() if doc in term_scores}
+                if not scores:
+                    return []
+
+        best: Dict[str, Dict] = {}
+        for (chat_id, seq), score in scores.items():
+            entry = best.get(chat_id)
+            if entry is None:
+                best[chat_id] = {'id': chat_id, 'score': score, 'seq': seq, 'hits': 1}
+            else:
+                entry['hits'] += 1
+                if score > entry['score']:
+                    entry['score'], entry['seq'] = score, seq
+
+        ranked = sorted(best.values(), key=lambda r: r['score'], reverse=True)[:limit]
+        for result in ranked:
+            result['score'] = round(result['score'], 4)
+        return ranked
+
+
+def add_snippets(results: List[Dict], terms: List[str], message_at: Callable[[str, int], Optional[Dict]]) -> List[Dict]:
+    """Attach a highlighted snippet of each result's best-matching message"""
+    for result in results:
+        message = message_at(result['id'], result['seq']) or {}
+        result['snippet'] = make_snippet(message.get('content', ''), terms)
+    return results
@@ -0,0 +1,448 @@
+"""
+Append-only JSONL chat history store
+One message log per chat plus a metadata index (snapshot and change log), for file-based deployments
+"""
+
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from utils.chat_search import InvertedIndex, add_snippets
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: served by a single process, so the thread lock is enough
+    fcntl = None
+
+# Not *.json, so the legacy JSON store and its migration never mistake it for a chat
+INDEX_NAME = "_chat_index.idx"
+INDEX_LOG_NAME = "_chat_index.log"
+LOCK_NAME = ".chat_index.lock"
+# Index log records folded into the snapshot once this many have accumulated
+INDEX_COMPACT_RECORDS = 1000
+# Tombstones kept for delta listings; older list versions get the full list instead
+MAX_TOMBSTONES = 1000
+
+
+def _atomic_write_json(path: Path, data) -> None:
+    """Write JSON to a temp file and rename it over the target"""
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def _flocked(lock_path: Path):
+    """Hold an exclusive flock on a sidecar lock file, shared by all worker processes"""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _file_stamp(path: Path) -> Optional[tuple]:
+    """Identify a file's current version; every atomic replace gets a new inode"""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class JsonlChatStore:
+    """Chat history as <id>.jsonl message logs and one metadata index
+
+    Saving a turn appends the new messages to the chat's log and one record
+    with its new metadata to the index log, so the write cost is O(message)
+    rather than O(chat) or O(chats). The index log is folded into the index
+    snapshot every INDEX_COMPACT_RECORDS records. Listing chats reads only
+    the index. Writes hold an flock on a sidecar lock file, so several worker
+    processes can share the directory.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.index_path = self.directory / INDEX_NAME
+        self.index_log_path = self.directory / INDEX_LOG_NAME
+        self.lock_path = self.directory / LOCK_NAME
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Dict]] = None
+        self._index_stamp: Optional[tuple] = None
+        # Position in the index log up to which records have been applied
+        self._log_inode: Optional[int] = None
+        self._log_offset = 0
+        self._log_records = 0
+        # Chat list version counter and tombstones of deleted chats, for delta listings;
+        # tombstones at or below the floor have been pruned
+        self._version = 0
+        self._deleted: Dict[str, int] = {}
+        self._deleted_floor = 0
+        self._search_index = InvertedIndex()
+
+    def _log_path(self, chat_id: str) -> Path:
+        return self.directory / f"{chat_id}.jsonl"
+
+    def _memo_path(self, chat_id: str) -> Path:
+        return self.directory / f"{chat_id}.memo"
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the write lock: the thread lock, plus an flock shared by all worker processes"""
+        with self._lock, _flocked(self.lock_path):
+            yield
+
+    def _stamp(self) -> Optional[tuple]:
+        return _file_stamp(self.index_path)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        """Load (and cache) the index; must hold the lock
+
+        The cached copy is reloaded when another worker process has replaced
+        the snapshot since it was read, and brought up to date with any
+        records other processes have appended to the index log.
+        """
+        stamp = self._stamp()
+        if self._index is None or stamp != self._index_stamp:
+            data = {}
+            if stamp is not None:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            if isinstance(data.get('chats'), dict) and 'version' in data:
+                self._index, self._version, self._deleted = data['chats'], data['version'], data.get('deleted', {})
+                self._deleted_floor = data.get('deleted_floor', 0)
+            else:
+                # Index written before it carried a version
+                self._index, self._version, self._deleted, self._deleted_floor = data, 0, {}, 0
+            self._index_stamp = stamp
+            self._log_inode, self._log_offset, self._log_records = None, 0, 0
+        self._replay_index_log()
+        return self._index
+
+    def _replay_index_log(self) -> None:
+        """Apply index log records appended since the last read; must hold the lock"""
+        try:
+            f = open(self.index_log_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self._log_inode:
+                # Replaced by a compaction; replaying records already in the snapshot is harmless
+                self._log_inode, self._log_offset, self._log_records = inode, 0, 0
+            f.seek(self._log_offset)
+            data = f.read()
+        # A record still being written (or torn by a crash) is left for later
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply_index_record(json.loads(line))
+            except ValueError:
+                continue
+            self._log_records += 1
+        self._log_offset += end
+
+    def _apply_index_record(self, record: Dict) -> None:
+        if record.get('op') == 'put':
+            entry = record['chat']
+            self._index[entry['id']] = entry
+            self._deleted.pop(entry['id'], None)
+            self._version = max(self._version, entry.get('version', 0))
+        elif record.get('op') == 'delete':
+            self._index.pop(record['id'], None)
+            if record.get('tombstone') is not None:
+                self._deleted[record['id']] = record['tombstone']
+                self._version = max(self._version, record['tombstone'])
+
+    def _log_index_change(self, record: Dict) -> None:
+        """Apply a change and append it to the index log; must hold the write lock"""
+        self._apply_index_record(record)
+        with open(self.index_log_path, 'a+b') as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # Terminate a record torn by a crash so it can't swallow this one
+                    f.write(b'\n')
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_inode, self._log_offset = os.fstat(f.fileno()).st_ino, f.tell()
+        self._log_records += 1
+        if self._log_records >= INDEX_COMPACT_RECORDS:
+            self._write_index()
+
+    def _next_version(self) -> int:
+        self._version += 1
+        return self._version
+
+    def _write_index(self) -> None:
+        """Write the whole index as a new snapshot and start an empty log; must hold the write lock"""
+        if len(self._deleted) > MAX_TOMBSTONES:
+            # Clients holding a version older than the pruned tombstones get the full list
+            kept = sorted(self._deleted.items(), key=lambda item: item[1])
+            pruned, kept = kept[:-MAX_TOMBSTONES], kept[-MAX_TOMBSTONES:]
+            self._deleted_floor = max(self._deleted_floor, pruned[-1][1])
+            self._deleted = dict(kept)
+        _atomic_write_json(self.index_path, {'version': self._version, 'deleted': self._deleted,
+                                             'deleted_floor': self._deleted_floor, 'chats': self._index})
+        self._index_stamp = self._stamp()
+        # Emptied only after the snapshot holds its records, so a crash in between loses nothing
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.directory), prefix=f".{INDEX_LOG_NAME}.", suffix=".tmp")
+        os.close(fd)
+        os.replace(tmp_path, self.index_log_path)
+        self._log_inode, self._log_offset, self._log_records = self.index_log_path.stat().st_ino, 0, 0
+
+    @staticmethod
+    def _append_lines(path: Path, messages: List[Dict]) -> None:
+        if not messages:
+            return
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(m, ensure_ascii=False) + '\n' for m in messages))
+
+    def save_chat(self, chat_id: str, messages: List[Dict], title: str, memo: Optional[Dict] = None) -> bool:
+        """Save a chat, appending only the messages not logged yet"""
+        with self._exclusive():
+            index = self._load_index()
+            stored = index.get(chat_id, {}).get('message_count', 0)
+            log_path = self._log_path(chat_id)
+
+            if len(messages) < stored or (stored and not log_path.exists()):
+                # History was rewritten rather than extended
+                fd, tmp_path = tempfile.mkstemp(dir=str(self.directory), suffix=".tmp")
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(m, ensure_ascii=False) + '\n' for m in messages))
+                os.replace(tmp_path, log_path)
+            else:
+                self._append_lines(log_path, messages[stored:])
+
+            if memo:
+                _atomic_write_json(self._memo_path(chat_id), memo)
+
+            self._log_index_change({'op': 'put', 'chat': {
+                'id': chat_id,
+                'title': title,
+                'timestamp': datetime.now().isoformat(),
+                'message_count': len(messages),
+                'version': self._next_version()
+            }})
+        return True
+
+    def append_messages(self, chat_id: str, new_messages: List[Dict], title: str) -> bool:
+        """Append messages to a chat's log (creating it if needed)"""
+        with self._exclusive():
+            index = self._load_index()
+            stored = index.get(chat_id, {}).get('message_count', 0)
+            self._append_lines(self._log_path(chat_id), new_messages)
+            self._log_index_change({'op': 'put', 'chat': {
+                'id': chat_id,
+                'title': title,
+                'timestamp': datetime.now().isoformat(),
+                'message_count': stored + len(new_messages),
+                'version': self._next_version()
+            }})
+        return True
+
+    def save_memo(self, chat_id: str, memo: Dict) -> bool:
+        with self._exclusive():
+            if chat_id not in self._load_index():
+                return False
+            _atomic_write_json(self._memo_path(chat_id), memo)
+        return True
+
+    def iter_messages(self, chat_id: str) -> Iterator[Dict]:
+        """Stream a chat's messages from its log"""
+        log_path = self._log_path(chat_id)
+        if not log_path.exists():
+            return
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append
+                        continue
+
+    def _tail_messages(self, chat_id: str, last_n: int) -> List[Dict]:
+        """Read only the last last_n messages by scanning the log backwards"""
+        log_path = self._log_path(chat_id)
+        if last_n <= 0 or not log_path.exists():
+            return []
+
+        lines: deque = deque()
+        with open(log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b''
+            while position > 0 and len(lines) <= last_n:
+                step = min(64 * 1024, position)
+                position -= step
+                f.seek(position)
+                buffer = f.read(step) + buffer
+                parts = buffer.split(b'\n')
+                buffer = parts[0]
+                for part in reversed(parts[1:]):
+                    if part.strip():
+                        lines.appendleft(part)
+            if position == 0 and buffer.strip():
+                lines.appendleft(buffer)
+
+        messages = []
+        for line in list(lines)[-last_n:]:
+            try:
+                messages.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                continue
+        return messages
+
+    def load_chat(self, chat_id: str, last_n: Optional[int] = None) -> Optional[Dict]:
+        """Load a chat, optionally only its most recent last_n messages"""
+        with self._lock:
+            entry = self._load_index().get(chat_id)
+        if entry is None:
+            return None
+
+        if last_n is not None:
+            messages = self._tail_messages(chat_id, last_n)
+        else:
+            messages = list(self.iter_messages(chat_id))
+
+        chat_data = dict(entry)
+        chat_data['messages'] = messages
+        memo = self.load_memo(chat_id)
+        if memo is not None:
+            chat_data['memo'] = memo
+        return chat_data
+
+    def load_memo(self, chat_id: str) -> Optional[Dict]:
+        """Read a chat's memo file"""
+        try:
+            with open(self._memo_path(chat_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """Get a chat's metadata from the index"""
+        with self._lock:
+            entry = self._load_index().get(chat_id)
+        return dict(entry) if entry else None
+
+    def list_chats(self, limit: Optional[int] = None, offset: int = 0,
+                   before: Optional[tuple] = None) -> List[Dict]:
+        """List chat metadata from the index only, newest first
+
+        before is a (timestamp, id) cursor; only chats that sort after it are returned.
+        """
+        with self._lock:
+            chats = [dict(entry) for entry in self._load_index().values()]
+        if before is not None:
+            chats = [c for c in chats if (c.get('timestamp', ''), c.get('id', '')) < tuple(before)]
+        chats.sort(key=lambda x: (x.get('timestamp', ''), x.get('id', '')), reverse=True)
+        return chats[offset:] if limit is None else chats[offset:offset + limit]
+
+    def list_version(self) -> int:
+        """Version counter bumped by every change to the chat list"""
+        with self._lock:
+            self._load_index()
+            return self._version
+
+    def changes_since(self, version: int) -> Optional[Dict]:
+        """Chats added, updated or deleted after the given list version
+
+        None if tombstones newer than that version have been pruned; the
+        caller then sends the full list.
+        """
+        with self._lock:
+            index = self._load_index()
+            if version < self._deleted_floor:
+                return None
+            changed = [dict(e) for e in index.values() if e.get('version', 0) > version]
+            deleted = [chat_id for chat_id, v in self._deleted.items() if v > version]
+        changed.sort(key=lambda x: (x.get('timestamp', ''), x.get('id', '')), reverse=True)
+        return {'changed': changed, 'deleted': deleted}
+
+    def search(self, terms: List[str], limit: int = 20) -> List[Dict]:
+        """Rank chats by their best-matching message, indexing only newly appended lines"""
+        self._search_index.sync(
+            self.list_chats(),
+            lambda chat_id, start, count: self._tail_messages(chat_id, count - start)
+        )
+        return add_snippets(
+            self._search_index.search(terms, limit),
+            terms,
+            lambda chat_id, seq: next(islice(self.iter_messages(chat_id), seq, None), None)
+        )
+
+    def delete_chat(self, chat_id: str, tombstone: bool = True) -> bool:
+        """Delete a chat; without a tombstone it is not reported as deleted to delta listings"""
+        with self._exclusive():
+            index = self._load_index()
+            if chat_id not in index:
+                return False
+            self._log_index_change({'op': 'delete', 'id': chat_id,
+                                    'tombstone': self._next_version() if tombstone else None})
+            for path in (self._log_path(chat_id), self._memo_path(chat_id)):
+                if path.exists():
+                    path.unlink()
+        return True
+
+    def migrate_json_files(self, json_dir: Path) -> int:
+        """One-time conversion of the legacy per-chat JSON files into logs"""
+        imported = 0
+        with self._exclusive():
+            # Checked under the lock so only one worker process migrates
+            if self.index_path.exists() or self.index_log_path.exists():
+                return 0
+            index = self._load_index()
+            for chat_file in sorted(Path(json_dir).glob("*.json")):
+                try:
+                    with open(chat_file, 'r', encoding='utf-8') as f:
+                        chat_data = json.load(f)
+                except Exception as e:
+                    print(f"Skipping {chat_file.name} during migration: {str(e)}")
+                    continue
+
+                chat_id = chat_data.get('id') or chat_file.stem
+                messages = chat_data.get('messages', [])
+                log_path = self._log_path(chat_id)
+                if log_path.exists():
+                    log_path.unlink()
+                self._append_lines(log_path, messages)
+                if chat_data.get('memo'):
+                    _atomic_write_json(self._memo_path(chat_id), chat_data['memo'])
+                index[chat_id] = {
+                    'id': chat_id,
+                    'title': chat_data.get('title', 'Untitled Chat'),
+                    'timestamp': chat_data.get('timestamp') or datetime.now().isoformat(),
+                    'message_count': len(messages),
+                    'version': self._next_version()
+                }
+                imported += 1
+            self._write_index()
+
+        if imported:
+            print(f"Migrated {imported} chats in {json_dir} to JSONL logs")
+        return imported
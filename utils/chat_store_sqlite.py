@@ -0,0 +1,375 @@
+"""
+SQLite chat history store
+WAL-mode database with append-only message inserts and an indexed chat list
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from utils.chat_search import MATCH_START, MATCH_END, ELLIPSIS, SNIPPET_TOKENS, fts_match_query, render_snippet
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    memo TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chats_timestamp ON chats (timestamp DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS deleted_chats (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# Full-text index over message content. messages has no rowid, so a small map
+# ties each (chat_id, seq) to its FTS row and lets deletes find it by key.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content,
+    chat_id UNINDEXED,
+    seq UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TABLE IF NOT EXISTS messages_fts_map (
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    fts_rowid INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+"""
+
+SEARCH_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (content, chat_id, seq) VALUES (new.content, new.chat_id, new.seq);
+    INSERT INTO messages_fts_map (chat_id, seq, fts_rowid) VALUES (new.chat_id, new.seq, last_insert_rowid());
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    DELETE FROM messages_fts WHERE rowid =
+        (SELECT fts_rowid FROM messages_fts_map WHERE chat_id = old.chat_id AND seq = old.seq);
+    DELETE FROM messages_fts_map WHERE chat_id = old.chat_id AND seq = old.seq;
+END;
+"""
+
+
+class SQLiteChatStore:
+    """Chat history in a single SQLite database (WAL mode)"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # Databases created before the list version counter existed
+        if 'version' not in [row['name'] for row in conn.execute("PRAGMA table_info(chats)")]:
+            conn.execute("ALTER TABLE chats ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_version ON chats (version)")
+        conn.commit()
+        self._init_search(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            # REPLACE conflicts fire the delete trigger that keeps the FTS index in sync
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+        return conn
+
+    def _init_search(self, conn: sqlite3.Connection):
+        """Create the FTS5 index, backfilling it once for messages stored before it existed"""
+        with self._write_lock, conn:
+            conn.executescript(SEARCH_SCHEMA)
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'fts_built'").fetchone():
+                conn.execute("DELETE FROM messages_fts")
+                conn.execute("DELETE FROM messages_fts_map")
+                conn.execute(
+                    "INSERT INTO messages_fts_map (chat_id, seq, fts_rowid) "
+                    "SELECT chat_id, seq, row_number() OVER (ORDER BY chat_id, seq) FROM messages"
+                )
+                conn.execute(
+                    "INSERT INTO messages_fts (rowid, content, chat_id, seq) "
+                    "SELECT map.fts_rowid, m.content, m.chat_id, m.seq FROM messages_fts_map map "
+                    "JOIN messages m ON m.chat_id = map.chat_id AND m.seq = map.seq"
+                )
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fts_built', ?)",
+                             (datetime.now().isoformat(),))
+            conn.executescript(SEARCH_TRIGGERS)
+
+    @staticmethod
+    def _next_version(conn: sqlite3.Connection) -> int:
+        """Bump the chat list version; call inside a write transaction"""
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    @staticmethod
+    def _message_row(chat_id: str, seq: int, message: Dict) -> tuple:
+        extra = {k: v for k, v in message.items() if k not in ('role', 'content')}
+        return (chat_id, seq, message.get('role', 'user'), message.get('content', ''),
+                json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    @staticmethod
+    def _row_message(row: sqlite3.Row) -> Dict:
+        message = {'role': row['role'], 'content': row['content']}
+        if row['extra']:
+            message.update(json.loads(row['extra']))
+        return message
+
+    def save_chat(self, chat_id: str, messages: List[Dict], title: str, memo: Optional[Dict] = None) -> bool:
+        """Save a chat, inserting only the messages not stored yet"""
+        now = datetime.now().isoformat()
+        conn = self._conn()
+        with self._write_lock, conn:
+            row = conn.execute("SELECT message_count FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            stored = row['message_count'] if row else 0
+
+            if row is None:
+                conn.execute(
+                    "INSERT INTO chats (id, title, created_at, timestamp, message_count) VALUES (?, ?, ?, ?, 0)",
+                    (chat_id, title, now, now)
+                )
+            elif len(messages) < stored:
+                # History was rewritten rather than extended
+                conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                stored = 0
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (chat_id, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+                [self._message_row(chat_id, seq, m) for seq, m in enumerate(messages[stored:], start=stored)]
+            )
+            conn.execute(
+                "UPDATE chats SET title = ?, timestamp = ?, message_count = ?, memo = COALESCE(?, memo), "
+                "version = ? WHERE id = ?",
+                (title, now, len(messages), json.dumps(memo, ensure_ascii=False) if memo else None,
+                 self._next_version(conn), chat_id)
+            )
+            conn.execute("DELETE FROM deleted_chats WHERE id = ?", (chat_id,))
+        return True
+
+    def append_messages(self, chat_id: str, new_messages: List[Dict], title: str) -> bool:
+        """Append messages to a chat (creating it if needed)"""
+        now = datetime.now().isoformat()
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO chats (id, title, created_at, timestamp, message_count) VALUES (?, ?, ?, ?, 0)",
+                (chat_id, title, now, now)
+            )
+            stored = conn.execute("SELECT message_count FROM chats WHERE id = ?", (chat_id,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO messages (chat_id, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+                [self._message_row(chat_id, seq, m) for seq, m in enumerate(new_messages, start=stored)]
+            )
+            conn.execute(
+                "UPDATE chats SET title = ?, timestamp = ?, message_count = ?, version = ? WHERE id = ?",
+                (title, now, stored + len(new_messages), self._next_version(conn), chat_id)
+            )
+            conn.execute("DELETE FROM deleted_chats WHERE id = ?", (chat_id,))
+        return True
+
+    def save_memo(self, chat_id: str, memo: Dict) -> bool:
+        conn = self._conn()
+        with self._write_lock, conn:
+            cursor = conn.execute("UPDATE chats SET memo = ? WHERE id = ?",
+                                  (json.dumps(memo, ensure_ascii=False), chat_id))
+        return cursor.rowcount > 0
+
+    def load_chat(self, chat_id: str, last_n: Optional[int] = None) -> Optional[Dict]:
+        """Load a chat, optionally only its most recent last_n messages"""
+        conn = self._conn()
+        chat = conn.execute("SELECT * FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        if chat is None:
+            return None
+
+        if last_n is not None:
+            rows = conn.execute(
+                "SELECT * FROM messages WHERE chat_id = ? AND seq >= ? ORDER BY seq",
+                (chat_id, max(0, chat['message_count'] - last_n))
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)).fetchall()
+
+        chat_data = {
+            'id': chat['id'],
+            'title': chat['title'],
+            'messages': [self._row_message(r) for r in rows],
+            'timestamp': chat['timestamp'],
+            'message_count': chat['message_count']
+        }
+        if chat['memo']:
+            chat_data['memo'] = json.loads(chat['memo'])
+        return chat_data
+
+    def load_memo(self, chat_id: str) -> Optional[Dict]:
+        """Get a chat's running memo without its messages"""
+        row = self._conn().execute("SELECT memo FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return json.loads(row['memo']) if row and row['memo'] else None
+
+    def chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """Get a chat's metadata without its messages"""
+        row = self._conn().execute(
+            "SELECT id, title, timestamp, message_count, version FROM chats WHERE id = ?", (chat_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_chats(self, limit: Optional[int] = None, offset: int = 0,
+                   before: Optional[tuple] = None) -> List[Dict]:
+        """List chat metadata, newest first (served from the timestamp index)
+
+        before is a (timestamp, id) cursor; only chats that sort after it are returned.
+        """
+        where, params = '', []
+        if before is not None:
+            where, params = "WHERE (timestamp, id) < (?, ?)", list(before)
+        rows = self._conn().execute(
+            f"SELECT id, title, timestamp, message_count, version FROM chats {where} "
+            "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def list_version(self) -> int:
+        """Version counter bumped by every change to the chat list"""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def changes_since(self, version: int) -> Dict:
+        """Chats added, updated or deleted after the given list version"""
+        conn = self._conn()
+        changed = conn.execute(
+            "SELECT id, title, timestamp, message_count, version FROM chats WHERE version > ? "
+            "ORDER BY timestamp DESC, id DESC",
+            (version,)
+        ).fetchall()
+        deleted = conn.execute("SELECT id FROM deleted_chats WHERE version > ?", (version,)).fetchall()
+        return {'changed': [dict(r) for r in changed], 'deleted': [r['id'] for r in deleted]}
+
+    def search(self, terms: List[str], limit: int = 20) -> List[Dict]:
+        """Rank chats by their best-matching message (FTS5 bm25) with a highlighted snippet"""
+        if not terms:
+            return []
+        conn = self._conn()
+        query = fts_match_query(terms)
+
+        # Rank chats first; snippets are only built for the chats returned
+        ranked = conn.execute(
+            "SELECT chat_id, min(rank) AS rank, count(*) AS hits FROM "
+            "(SELECT chat_id, rank FROM messages_fts WHERE messages_fts MATCH ?) "
+            "GROUP BY chat_id ORDER BY rank LIMIT ?",
+            (query, limit)
+        ).fetchall()
+        if not ranked:
+            return []
+
+        chat_ids = [row['chat_id'] for row in ranked]
+        placeholders = ','.join('?' * len(chat_ids))
+        snippets = {}
+        for row in conn.execute(
+            f"SELECT chat_id, seq, snippet(messages_fts, 0, ?, ?, ?, ?) AS snippet FROM messages_fts "
+            f"WHERE messages_fts MATCH ? AND chat_id IN ({placeholders}) ORDER BY rank",
+            (MATCH_START, MATCH_END, ELLIPSIS, SNIPPET_TOKENS, query, *chat_ids)
+        ):
+            snippets.setdefault(row['chat_id'], (row['seq'], row['snippet']))
+
+        return [{
+            'id': row['chat_id'],
+            'score': round(-row['rank'], 4),
+            'hits': row['hits'],
+            'seq': snippets[row['chat_id']][0],
+            'snippet': render_snippet(snippets[row['chat_id']][1])
+        } for row in ranked]
+
+    def delete_chat(self, chat_id: str, tombstone: bool = True) -> bool:
+        """Delete a chat; without a tombstone it is not reported as deleted to delta listings"""
+        conn = self._conn()
+        with self._write_lock, conn:
+            cursor = conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+            if cursor.rowcount > 0 and tombstone:
+                conn.execute("INSERT OR REPLACE INTO deleted_chats (id, version) VALUES (?, ?)",
+                             (chat_id, self._next_version(conn)))
+        return cursor.rowcount > 0
+
+    def compact(self):
+        """Return the space of deleted chats to the filesystem"""
+        conn = self._conn()
+        with self._write_lock:
+            with conn:
+                # Merge the FTS segments so deleted messages are dropped from the index too
+                conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+            conn.execute("VACUUM")
+            # VACUUM goes through the WAL; checkpoint so the main file actually shrinks
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def migrate_json_files(self, json_dir: Path) -> int:
+        """One-time import of the legacy per-chat JSON files"""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+
+        imported = 0
+        for chat_file in sorted(Path(json_dir).glob("*.json")):
+            try:
+                with open(chat_file, 'r', encoding='utf-8') as f:
+                    chat_data = json.load(f)
+            except Exception as e:
+                print(f"Skipping {chat_file.name} during migration: {str(e)}")
+                continue
+
+            chat_id = chat_data.get('id') or chat_file.stem
+            timestamp = chat_data.get('timestamp') or datetime.now().isoformat()
+            messages = chat_data.get('messages', [])
+            memo = chat_data.get('memo')
+            with self._write_lock, conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO chats (id, title, created_at, timestamp, message_count, memo, version) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (chat_id, chat_data.get('title', 'Untitled Chat'), timestamp, timestamp, len(messages),
+                     json.dumps(memo, ensure_ascii=False) if memo else None, self._next_version(conn))
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO messages (chat_id, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+                    [self._message_row(chat_id, seq, m) for seq, m in enumerate(messages)]
+                )
+            imported += 1
+
+        with self._write_lock, conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (datetime.now().isoformat(),))
+        if imported:
+            print(f"Migrated {imported} chats from {json_dir} to {self.db_path}")
+        return imported
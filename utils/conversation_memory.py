@@ -0,0 +1,133 @@
+"""
+Rolling conversation memory
+Compacts older chat turns into a running memo in the background
+"""
+
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from utils.chat_history import load_chat_memo, save_chat_memo
+from utils.llm_scheduler import get_scheduler, PRIORITY_BACKGROUND
+from utils.ollama_client import get_client, get_keep_alive, record_timings
+from utils.prompt_builder import count_tokens, truncate_to_tokens
+
+# Messages always sent verbatim after the memo (2 exchanges)
+KEEP_RECENT_MESSAGES = 4
+
+# Per-message cap when feeding turns to the summarizer
+MAX_TURN_TOKENS = 300
+
+MEMO_OPTIONS = {
+    'num_predict': 384,
+    'temperature': 0.2,
+    'num_ctx': 2048,
+}
+
+_THINK_PATTERN = re.compile(r'<think>.*?</think>', re.DOTALL)
+
+_pending: set = set()
+_lock = threading.Lock()
+
+
+def _compact_threshold() -> int:
+    """Tokens of unsummarized history that trigger a compaction"""
+    return int(os.getenv('HISTORY_COMPACT_TOKENS', '600'))
+
+
+def get_memo(chat_id: Optional[str]) -> Optional[Dict]:
+    """Get the running memo for a chat ({'text', 'covers', 'updated'})
+
+    Read from the chat store every time, so a memo written by another worker
+    (or a chat deleted and recreated) is never served stale.
+    """
+    if not chat_id:
+        return None
+    return load_chat_memo(chat_id)
+
+
+def prepare_history(chat_id: Optional[str], messages: List[Dict]) -> Tuple[str, List[Dict]]:
+    """Split a conversation into (memo text, turns the memo does not cover yet)"""
+    memo = get_memo(chat_id)
+    if not memo:
+        return '', messages
+    return memo.get('text', ''), messages[memo.get('covers', 0):]
+
+
+def maybe_compact(chat_id: Optional[str], messages: List[Dict], model: str) -> bool:
+    """Start a background compaction if the unsummarized history is over budget"""
+    if not chat_id:
+        return False
+
+    memo = get_memo(chat_id) or {}
+    covers = memo.get('covers', 0)
+    cutoff = len(messages) - KEEP_RECENT_MESSAGES
+    if cutoff <= covers:
+        return False
+
+    pending_tokens = sum(count_tokens(m.get('content', '')) for m in messages[covers:])
+    if pending_tokens <= _compact_threshold():
+        return False
+
+    with _lock:
+        if chat_id in _pending:
+            return False
+        _pending.add(chat_id)
+
+    turns = [dict(m) for m in messages[covers:cutoff]]
+    threading.Thread(
+        target=_compact,
+        args=(chat_id, memo.get('text', ''), turns, cutoff, model),
+        daemon=True
+    ).start()
+    return True
+
+
+def _compact(chat_id: str, previous_memo: str, turns: List[Dict], covers: int, model: str):
+    """Fold older turns into the running memo and store it with the chat"""
+    try:
+        transcript = "\n".join(
+            f"{m['role'].title()}: {truncate_to_tokens(m.get('content', ''), MAX_TURN_TOKENS)}"
+            for m in turns
+        )
+        prompt = f"""You maintain a running summary of a study conversation between a student and NexNote.
+Update the summary with the new turns below. Keep facts, definitions, questions the student asked,
+and anything they may refer back to. Write at most 150 words as plain sentences.
+
+Current summary:
+{previous_memo or '(none yet)'}
+
+New turns:
+{transcript}
+
+Updated summary:"""
+
+        response = get_scheduler().run(
+            model, PRIORITY_BACKGROUND,
+            lambda: get_client().chat(
+                model=model,
+                messages=[{'role': 'user', 'content': prompt}],
+                options=MEMO_OPTIONS,
+                keep_alive=get_keep_alive()
+            )
+        )
+        record_timings(model, response)
+
+        text = _THINK_PATTERN.sub('', response['message']['content']).strip()
+        if not text:
+            return
+
+        # Another worker may have compacted the same chat meanwhile; keep the newer memo
+        stored = load_chat_memo(chat_id) or {}
+        if stored.get('covers', 0) >= covers:
+            return
+
+        memo = {'text': text, 'covers': covers, 'updated': datetime.now().isoformat()}
+        save_chat_memo(chat_id, memo)
+    except Exception as e:
+        print(f"Error compacting chat {chat_id}: {str(e)}")
+    finally:
+        with _lock:
+            _pending.discard(chat_id)
@@ -0,0 +1,166 @@
+"""
+Flashcard decks with SM-2 spaced repetition
+Cards persist per file and are scheduled through an indexed due date, so reviews need no LLM calls
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DAY_SECONDS = 86400
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    deck_id INTEGER NOT NULL REFERENCES decks (id) ON DELETE CASCADE,
+    front TEXT NOT NULL,
+    back TEXT NOT NULL,
+    ease REAL NOT NULL DEFAULT 2.5,
+    interval INTEGER NOT NULL DEFAULT 0,
+    repetitions INTEGER NOT NULL DEFAULT 0,
+    lapses INTEGER NOT NULL DEFAULT 0,
+    due INTEGER NOT NULL,
+    last_reviewed INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cards_front ON cards (deck_id, front);
+CREATE INDEX IF NOT EXISTS idx_cards_due ON cards (due);
+CREATE INDEX IF NOT EXISTS idx_cards_deck_due ON cards (deck_id, due);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY,
+    card_id INTEGER NOT NULL REFERENCES cards (id) ON DELETE CASCADE,
+    reviewed_at INTEGER NOT NULL,
+    quality INTEGER NOT NULL,
+    interval INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reviews_card ON reviews (card_id);
+"""
+
+
+def sm2(ease: float, interval: int, repetitions: int, quality: int) -> Tuple[float, int, int]:
+    """Apply one SM-2 review (quality 0-5) and return the new (ease, interval days, repetitions)"""
+    if quality < 3:
+        # Lapse: relearn from the start, ease is kept
+        return ease, 1, 0
+
+    if repetitions == 0:
+        interval = 1
+    elif repetitions == 1:
+        interval = 6
+    else:
+        interval = max(1, round(interval * ease))
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return ease, interval, repetitions + 1
+
+
+class FlashcardStore:
+    """Decks, cards and the review log in SQLite; "due now" is a range scan on the due index"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def add_cards(self, deck_name: str, cards: List[Dict]) -> Dict:
+        """Add cards to a deck (created if needed); cards with a front already in the deck are skipped"""
+        now = int(time.time())
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO decks (name, created_at) VALUES (?, ?)", (deck_name, now))
+            deck_id = conn.execute("SELECT id FROM decks WHERE name = ?", (deck_name,)).fetchone()[0]
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO cards (deck_id, front, back, due) VALUES (?, ?, ?, ?)",
+                [(deck_id, c['front'].strip(), c['back'].strip(), now) for c in cards]
+            )
+        return {'deck_id': deck_id, 'deck': deck_name, 'added': cursor.rowcount}
+
+    @staticmethod
+    def _card(row: sqlite3.Row) -> Dict:
+        return {
+            'id': row['id'],
+            'deck_id': row['deck_id'],
+            'front': row['front'],
+            'back': row['back'],
+            'ease': round(row['ease'], 2),
+            'interval': row['interval'],
+            'repetitions': row['repetitions'],
+            'lapses': row['lapses'],
+            'due': row['due'],
+            'last_reviewed': row['last_reviewed']
+        }
+
+    def due_cards(self, deck_name: Optional[str] = None, limit: int = 20, now: Optional[int] = None) -> List[Dict]:
+        """Cards due at `now`, most overdue first"""
+        now = int(time.time()) if now is None else now
+        if deck_name:
+            rows = self._conn().execute(
+                "SELECT cards.* FROM cards JOIN decks ON decks.id = cards.deck_id "
+                "WHERE decks.name = ? AND cards.due <= ? ORDER BY cards.due LIMIT ?",
+                (deck_name, now, limit)
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT * FROM cards WHERE due <= ? ORDER BY due LIMIT ?", (now, limit)
+            ).fetchall()
+        return [self._card(r) for r in rows]
+
+    def review(self, card_id: int, quality: int, now: Optional[int] = None) -> Optional[Dict]:
+        """Record a review and reschedule the card"""
+        now = int(time.time()) if now is None else now
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT * FROM cards WHERE id = ?", (card_id,)).fetchone()
+            if row is None:
+                return None
+            ease, interval, repetitions = sm2(row['ease'], row['interval'], row['repetitions'], quality)
+            conn.execute(
+                "UPDATE cards SET ease = ?, interval = ?, repetitions = ?, lapses = lapses + ?, "
+                "due = ?, last_reviewed = ? WHERE id = ?",
+                (ease, interval, repetitions, 1 if quality < 3 else 0, now + interval * DAY_SECONDS, now, card_id)
+            )
+            conn.execute("INSERT INTO reviews (card_id, reviewed_at, quality, interval) VALUES (?, ?, ?, ?)",
+                         (card_id, now, quality, interval))
+            row = conn.execute("SELECT * FROM cards WHERE id = ?", (card_id,)).fetchone()
+        return self._card(row)
+
+    def list_decks(self, now: Optional[int] = None) -> List[Dict]:
+        """Decks with their card and due counts"""
+        now = int(time.time()) if now is None else now
+        rows = self._conn().execute(
+            "SELECT decks.id, decks.name, count(cards.id) AS cards, "
+            "coalesce(sum(cards.due <= ?), 0) AS due, min(cards.due) AS next_due "
+            "FROM decks LEFT JOIN cards ON cards.deck_id = decks.id GROUP BY decks.id ORDER BY decks.name",
+            (now,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def delete_deck(self, deck_name: str) -> bool:
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute("DELETE FROM decks WHERE name = ?", (deck_name,))
+        return cursor.rowcount > 0
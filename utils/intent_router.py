@@ -0,0 +1,209 @@
+"""
+Intent router
+Classifies chat messages with one precompiled pattern and parses schedule requests deterministically
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+CHAT_INTENT = 'chat'
+
+# Whole-word keyword patterns per intent (lowercase, each starting with a letter),
+# tried as one alternation; the earliest match in the message wins
+INTENT_KEYWORDS = {
+    'schedule': [r'schedule[sd]?', r'add (?:an )?event', r'create (?:an )?event',
+                 r'add (?:it |this )?to (?:my )?calendar'],
+    'reminder': [r'remind (?:me|us)', r'set (?:a )?reminder', r'reminder (?:to|for)'],
+}
+
+# Intents handled by the calendar instead of the LLM
+SCHEDULING_INTENTS = frozenset(INTENT_KEYWORDS)
+
+# The lookahead on the keywords' first letters lets the scan skip most
+# word starts without trying the alternation
+INTENT_RE = re.compile(
+    r'\b(?=[' + ''.join(sorted({p[0] for patterns in INTENT_KEYWORDS.values() for p in patterns})) + r'])(?:'
+    + '|'.join(f"(?P<{intent}>{'|'.join(patterns)})" for intent, patterns in INTENT_KEYWORDS.items())
+    + r')\b'
+)
+
+_WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+           'september', 'october', 'november', 'december']
+_WEEKDAY_RE = '|'.join(f"{d[:3]}(?:{d[3:]})?" for d in _WEEKDAYS) + '|tues|thur|thurs'
+_MONTH_RE = '|'.join(f"{m[:3]}(?:{m[3:]})?" for m in _MONTHS) + '|sept'
+
+# Command words before the title; the title runs up to the date, time or duration
+COMMAND_RE = re.compile(
+    r'\b(?:schedule|add (?:an )?event|create (?:an )?event|add (?:it |this )?to (?:my )?calendar|add'
+    r'|remind me(?:\s+to)?|set (?:a )?reminder(?:\s+(?:to|for))?)\s+'
+)
+TITLE_TAIL_RE = re.compile(r'(?:\s+(?:on|at|for|by|from))+$')
+TITLE_HEAD_RE = re.compile(r'^(?:(?:a|an|the)\s+)+')
+
+DATE_RE = re.compile(
+    r'\b(?:'
+    r'(?P<iso>\d{4}-\d{1,2}-\d{1,2})'
+    r'|(?P<numeric>\d{1,2}/\d{1,2}(?:/(?:\d{4}|\d{2}))?)'
+    r'|(?P<relative>day after tomorrow|tomorrow|today|tonight)'
+    r'|in\s+(?P<in_count>\d+)\s+(?P<in_unit>minute|min|hour|hr|day|week)s?'
+    r'|(?:(?P<modifier>next|this)\s+)?(?P<weekday>' + _WEEKDAY_RE + r')'
+    r'|(?P<month>' + _MONTH_RE + r')\.?\s+(?P<month_day>\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(?P<year>\d{4}))?'
+    r'|(?P<day_month>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month_after>' + _MONTH_RE + r')(?:,?\s+(?P<year_after>\d{4}))?'
+    r')\b'
+)
+
+TIME_RE = re.compile(
+    r'\b(?:'
+    r'(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm|a\.m\.|p\.m\.)'
+    r'|at\s+(?P<at_hour>\d{1,2})(?::(?P<at_minute>\d{2}))?'
+    r'|(?P<hh>\d{1,2}):(?P<mm>\d{2})'
+    r'|(?P<named>noon|midnight)'
+    r')(?![\w:])'
+)
+
+# "in 2 hours" is a start time, not a duration
+DURATION_RE = re.compile(r'(?<!in )\b(\d+(?:\.\d+)?)\s*(?:hours?|hrs?|h)\b|\bfor\s+(\d+)\s*(?:minutes?|mins?)\b')
+REMINDER_RE = re.compile(r'remind\s+(?:me\s+)?(\d+)\s*(?:min|minute)')
+
+
+def classify_intent(message: str) -> str:
+    """Intent of a chat message in one regex pass ('chat' if nothing matches)"""
+    match = INTENT_RE.search(message.lower())
+    return match.lastgroup if match else CHAT_INTENT
+
+
+# Clock time for "tonight" without an explicit time
+TONIGHT = (20, 0)
+
+
+def _relative_time(match: re.Match, now: datetime) -> Optional[datetime]:
+    """Exact start for "in 30 minutes" / "in 2 hours" (None for other date forms)"""
+    unit = match.group('in_unit')
+    if unit in ('minute', 'min'):
+        return (now + timedelta(minutes=int(match.group('in_count')))).replace(second=0, microsecond=0)
+    if unit in ('hour', 'hr'):
+        return (now + timedelta(hours=int(match.group('in_count')))).replace(second=0, microsecond=0)
+    return None
+
+
+def _match_date(match: re.Match, today: datetime) -> Optional[datetime]:
+    groups = match.groupdict()
+    if groups['iso']:
+        return datetime.strptime(groups['iso'], '%Y-%m-%d')
+    if groups['numeric']:
+        # Month first, like the US-style dates Google Calendar shows by default
+        parts = [int(p) for p in groups['numeric'].split('/')]
+        if len(parts) == 3:
+            return datetime(parts[2] + 2000 if parts[2] < 100 else parts[2], parts[0], parts[1])
+        date = datetime(today.year, parts[0], parts[1])
+        return date if date >= today else date.replace(year=today.year + 1)
+    if groups['relative']:
+        offset = {'today': 0, 'tonight': 0, 'tomorrow': 1, 'day after tomorrow': 2}[groups['relative']]
+        return today + timedelta(days=offset)
+    if groups['in_count']:
+        days = int(groups['in_count']) * (7 if groups['in_unit'] == 'week' else 1)
+        return today + timedelta(days=days)
+    if groups['weekday']:
+        weekday = next(i for i, d in enumerate(_WEEKDAYS) if d.startswith(groups['weekday'][:3]))
+        days_ahead = (weekday - today.weekday()) % 7
+        if groups['modifier'] == 'next' and days_ahead == 0:
+            days_ahead = 7
+        return today + timedelta(days=days_ahead)
+
+    month_name = groups['month'] or groups['month_after']
+    day = int(groups['month_day'] or groups['day_month'])
+    year = groups['year'] or groups['year_after']
+    month = next(i for i, m in enumerate(_MONTHS, 1) if m.startswith(month_name[:3]))
+    date = datetime(int(year) if year else today.year, month, day)
+    # Without a year, a date already past this year means next year
+    if not year and date < today:
+        date = date.replace(year=today.year + 1)
+    return date
+
+
+def _match_time(match: re.Match) -> tuple:
+    groups = match.groupdict()
+    if groups['named']:
+        return (12, 0) if groups['named'] == 'noon' else (0, 0)
+    if groups['hour']:
+        hour, minute = int(groups['hour']), int(groups['minute'] or 0)
+        am_pm = groups['ampm'][0]
+        if am_pm == 'p' and hour < 12:
+            hour += 12
+        elif am_pm == 'a' and hour == 12:
+            hour = 0
+        return hour, minute
+    if groups['at_hour']:
+        return int(groups['at_hour']), int(groups['at_minute'] or 0)
+    return int(groups['hh']), int(groups['mm'])
+
+
+def parse_schedule(text: str, now: Optional[datetime] = None) -> Optional[Dict]:
+    """Parse a natural language schedule request
+
+    Dates and times are resolved against `now` (default: the current time),
+    so the same text and `now` always give the same result. Returns None
+    without a start time. Numeric dates are read month first.
+    """
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    text_lower = text.lower()
+
+    result = {
+        'title': '',
+        'datetime': None,
+        'duration': 60,
+        'reminder': 30
+    }
+
+    date_match = DATE_RE.search(text_lower)
+    time_match = TIME_RE.search(text_lower)
+    duration_match = DURATION_RE.search(text_lower)
+
+    # Extract title: the words between the command and the first date or time, minus the duration
+    command = COMMAND_RE.search(text_lower)
+    if command:
+        starts = [m.start() for m in (date_match, time_match) if m and m.start() >= command.end()]
+        end = min(starts) if starts else len(text_lower)
+        title = text_lower[command.end():end]
+        if duration_match and command.end() <= duration_match.start() < end:
+            title = (text_lower[command.end():duration_match.start()] + ' '
+                     + text_lower[duration_match.end():end])
+        title = TITLE_TAIL_RE.sub('', ' '.join(title.split()))
+        result['title'] = TITLE_HEAD_RE.sub('', title).strip().title()
+    if not result['title']:
+        result['title'] = text.split(' at ')[0].split(' on ')[0].strip().title()
+
+    # Parse date and time
+    try:
+        exact = _relative_time(date_match, now) if date_match else None
+        if exact is not None:
+            result['datetime'] = exact
+        else:
+            date = _match_date(date_match, today) if date_match else None
+            clock = _match_time(time_match) if time_match else None
+            if clock is None and date_match and date_match.group('relative') == 'tonight':
+                clock = TONIGHT
+            # A date alone ("my schedule for today") is not enough to create an event
+            if clock is not None:
+                result['datetime'] = (date or today).replace(hour=clock[0], minute=clock[1])
+    except ValueError:
+        # Out-of-range values like "Feb 30" or "25:00"
+        result['datetime'] = None
+
+    # Extract duration
+    if duration_match:
+        if duration_match.group(1):
+            result['duration'] = int(float(duration_match.group(1)) * 60)
+        else:
+            result['duration'] = int(duration_match.group(2))
+
+    # Extract reminder
+    reminder_match = REMINDER_RE.search(text_lower)
+    if reminder_match:
+        result['reminder'] = int(reminder_match.group(1))
+
+    return result if result['datetime'] else None
+
@@ -0,0 +1,234 @@
+"""
+LLM generation scheduler
+Priority queues, per-model concurrency limits and backpressure for Ollama calls
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from utils.metrics import LLM_QUEUE_WAIT_SECONDS, register_collector
+from utils.tracing import record_span
+
+# Priorities (lower value is served first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STUDY = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_STUDY: 'study',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request is rejected because the queue is full or the wait timed out"""
+
+
+def _parse_model_limits(value: str) -> Dict[str, int]:
+    """Parse 'model=n,model2=m' into a dict"""
+    limits = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        model, limit = item.rsplit('=', 1)
+        try:
+            limits[model.strip()] = max(1, int(limit))
+        except ValueError:
+            continue
+    return limits
+
+
+class _Ticket:
+    """A queued request waiting for a generation slot"""
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class _ModelQueue:
+    """Waiting tickets and running count for one model"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.running = 0
+        self.heap: List = []
+        self.depth = {p: 0 for p in PRIORITY_NAMES}
+
+
+class LLMScheduler:
+    """Grants generation slots per model, highest priority first"""
+
+    def __init__(self,
+                 default_concurrency: int = 1,
+                 model_concurrency: Optional[Dict[str, int]] = None,
+                 queue_limits: Optional[Dict[int, int]] = None,
+                 queue_timeout: float = 120.0):
+        self.default_concurrency = max(1, default_concurrency)
+        self.model_concurrency = model_concurrency or {}
+        self.queue_limits = queue_limits or {
+            PRIORITY_INTERACTIVE: 16,
+            PRIORITY_STUDY: 8,
+            PRIORITY_BACKGROUND: 32,
+        }
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._models: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._stats = {
+            p: {'granted': 0, 'rejected': 0, 'timed_out': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+            for p in PRIORITY_NAMES
+        }
+
+    def _queue_for(self, model: str) -> _ModelQueue:
+        queue = self._models.get(model)
+        if queue is None:
+            queue = _ModelQueue(self.model_concurrency.get(model, self.default_concurrency))
+            self._models[model] = queue
+        return queue
+
+    def _grant_waiting(self, queue: _ModelQueue):
+        """Hand free slots to the highest-priority waiters"""
+        while queue.heap and queue.running < queue.limit:
+            _, _, ticket = heapq.heappop(queue.heap)
+            queue.depth[ticket.priority] -= 1
+            queue.running += 1
+            ticket.granted = True
+
+    def acquire(self, model: str, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """Wait for a generation slot and return the time spent queued"""
+        if timeout is None:
+            timeout = self.queue_timeout
+
+        with self._cond:
+            queue = self._queue_for(model)
+            stats = self._stats[priority]
+
+            if queue.depth[priority] >= self.queue_limits.get(priority, 0):
+                stats['rejected'] += 1
+                raise SchedulerBusy(f"Too many {PRIORITY_NAMES[priority]} requests queued for '{model}'")
+
+            ticket = _Ticket(priority)
+            heapq.heappush(queue.heap, (priority, next(self._seq), ticket))
+            queue.depth[priority] += 1
+            self._grant_waiting(queue)
+            self._cond.notify_all()
+
+            deadline = ticket.enqueued_at + timeout
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.heap = [entry for entry in queue.heap if entry[2] is not ticket]
+                    heapq.heapify(queue.heap)
+                    queue.depth[priority] -= 1
+                    stats['timed_out'] += 1
+                    raise SchedulerBusy(f"Timed out waiting for a '{model}' slot")
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats['granted'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+        LLM_QUEUE_WAIT_SECONDS.labels(PRIORITY_NAMES[priority]).observe(waited)
+        record_span('llm.queue_wait', waited, **{'llm.model': model, 'llm.priority': PRIORITY_NAMES[priority]})
+        return waited
+
+    def release(self, model: str):
+        """Return a generation slot"""
+        with self._cond:
+            queue = self._queue_for(model)
+            queue.running = max(0, queue.running - 1)
+            self._grant_waiting(queue)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model: str, priority: int = PRIORITY_INTERACTIVE):
+        """Hold a generation slot for the duration of the block"""
+        self.acquire(model, priority)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def run(self, model: str, priority: int, fn: Callable[[], Any]) -> Any:
+        """Run a blocking call inside a generation slot"""
+        with self.slot(model, priority):
+            return fn()
+
+    def stream(self, model: str, priority: int, fn: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """Iterate a streaming call, holding the slot until the stream ends"""
+        with self.slot(model, priority):
+            yield from fn()
+
+    def get_stats(self) -> Dict:
+        """Get queue depths, running counts and queue wait time per priority"""
+        with self._cond:
+            return {
+                'models': {
+                    model: {
+                        'limit': queue.limit,
+                        'running': queue.running,
+                        'queued': {PRIORITY_NAMES[p]: n for p, n in queue.depth.items()},
+                    }
+                    for model, queue in self._models.items()
+                },
+                'queue_wait': {
+                    PRIORITY_NAMES[p]: {
+                        'granted': s['granted'],
+                        'rejected': s['rejected'],
+                        'timed_out': s['timed_out'],
+                        'avg_seconds': round(s['wait_total'] / s['granted'], 4) if s['granted'] else 0.0,
+                        'max_seconds': round(s['wait_max'], 4),
+                    }
+                    for p, s in self._stats.items()
+                },
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Get the process-wide scheduler, configured from the environment on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                default_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '1')),
+                model_concurrency=_parse_model_limits(os.getenv('LLM_MODEL_CONCURRENCY', '')),
+                queue_limits={
+                    PRIORITY_INTERACTIVE: int(os.getenv('LLM_QUEUE_LIMIT_INTERACTIVE', '16')),
+                    PRIORITY_STUDY: int(os.getenv('LLM_QUEUE_LIMIT_STUDY', '8')),
+                    PRIORITY_BACKGROUND: int(os.getenv('LLM_QUEUE_LIMIT_BACKGROUND', '32')),
+                },
+                queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '120')),
+            )
+        return _scheduler
+
+
+def _collect_scheduler():
+    if _scheduler is None:
+        return
+    stats = _scheduler.get_stats()
+    models = stats['models']
+    yield ('nexnote_llm_queue_depth', 'gauge', "Requests waiting for a generation slot",
+           [({'model': m, 'priority': p}, n) for m, q in models.items() for p, n in q['queued'].items()])
+    yield ('nexnote_llm_running', 'gauge', "Generations currently running",
+           [({'model': m}, q['running']) for m, q in models.items()])
+    yield ('nexnote_llm_concurrency_limit', 'gauge', "Concurrent generations allowed per model",
+           [({'model': m}, q['limit']) for m, q in models.items()])
+    for key, documentation in [('rejected', "Requests rejected because the queue was full"),
+                               ('timed_out', "Requests that gave up waiting for a slot")]:
+        yield (f'nexnote_llm_queue_{key}', 'counter', documentation,
+               [({'priority': p}, s[key]) for p, s in stats['queue_wait'].items()])
+
+
+register_collector(_collect_scheduler)
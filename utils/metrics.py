@@ -0,0 +1,280 @@
+"""
+Prometheus metrics
+Counters and histograms kept in-process and rendered in the Prometheus text format at /metrics
+
+Recording is one dict lookup, a lock and an add (plus a bisect for
+histograms), so stages on the hot path can be timed unconditionally.
+Stats modules already keep (queue depths, coalescing, calendar sync) are
+read by collectors only when /metrics is scraped. Stage timers also open a
+tracing span when the request is being traced.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.tracing import end_span, record_span, start_span
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320, 640)
+
+# A collector returns (name, type, help, [(labels, value), ...]) families
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self) -> 'Timer':
+        return Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Timer:
+    """Context manager observing the elapsed seconds of its block (as a span too, if named)"""
+
+    __slots__ = ('child', 'span_name', 'span', 'start')
+
+    def __init__(self, child: _HistogramChild, span_name: Optional[str] = None):
+        self.child = child
+        self.span_name = span_name
+
+    def __enter__(self) -> 'Timer':
+        self.span = start_span(self.span_name) if self.span_name else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self.start)
+        if self.span is not None:
+            end_span(self.span, exc)
+        return False
+
+
+class _Metric:
+    """A named metric family whose children are keyed by label values"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Get the child for these label values (in labelnames order)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self) -> List[Tuple[Dict[str, str], object]]:
+        with self._lock:
+            return [(dict(zip(self.labelnames, map(str, values))), child) for values, child in self._children.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}_total{_format_labels(labels)} {_format_value(child.value)}"
+                for labels, child in self._items()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(float(bound))))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """All metrics and collectors of this process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registering a name returns the existing metric, so module reloads are harmless
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Add a function that reports gauges/counters from existing stats at scrape time"""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            body = metric.render()
+            if body:
+                name = metric.name + ('_total' if metric.kind == 'counter' else '')
+                lines.append(f"# HELP {name} {metric.documentation}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                lines.extend(body)
+
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                name += '_total' if kind == 'counter' else ''
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'nexnote_http_requests', "HTTP requests by route, method and status", ('route', 'method', 'status'))
+HTTP_SECONDS = REGISTRY.histogram(
+    'nexnote_http_request_seconds', "HTTP request handling time (until the response starts)", ('route',))
+STAGE_SECONDS = REGISTRY.histogram(
+    'nexnote_stage_seconds', "Time spent in each stage of chat, ingestion, study tools and calendar calls",
+    ('component', 'stage'))
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    'nexnote_llm_time_to_first_token_seconds', "Model load plus prompt evaluation time reported by Ollama",
+    ('model',))
+LLM_STREAM_TTFT_SECONDS = REGISTRY.histogram(
+    'nexnote_llm_stream_first_token_seconds', "Wall time from a streaming request to its first content chunk",
+    ('model',))
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    'nexnote_llm_prompt_tokens', "Prompt tokens evaluated per request (Ollama prompt_eval_count)",
+    ('model',), TOKEN_BUCKETS)
+LLM_GENERATED_TOKENS = REGISTRY.histogram(
+    'nexnote_llm_generated_tokens', "Tokens generated per request (Ollama eval_count)", ('model',), TOKEN_BUCKETS)
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    'nexnote_llm_tokens_per_second', "Generation speed per request (eval_count / eval_duration)",
+    ('model',), RATE_BUCKETS)
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'nexnote_llm_queue_wait_seconds', "Time requests waited for a generation slot", ('priority',))
+CACHE_REQUESTS = REGISTRY.counter(
+    'nexnote_cache_requests', "Cache lookups by cache and result (hit/miss)", ('cache', 'result'))
+
+
+def stage_timer(component: str, stage: str) -> Timer:
+    """Time a block as one stage: `with stage_timer('chat', 'generate'): ...`"""
+    return Timer(STAGE_SECONDS.labels(component, stage), f"{component}.{stage}")
+
+
+def observe_stage(component: str, stage: str, seconds: float):
+    """Record a stage that just finished, having taken `seconds`"""
+    STAGE_SECONDS.labels(component, stage).observe(seconds)
+    record_span(f"{component}.{stage}", seconds)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def register_collector(collector: Callable[[], Iterable[Family]]):
+    REGISTRY.register_collector(collector)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
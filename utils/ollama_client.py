@@ -0,0 +1,249 @@
+"""
+Shared Ollama client
+Connection-pooled client, model warm-up, keep-alive policy and load/generation timing
+"""
+
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import ollama
+
+from utils.metrics import (
+    LLM_GENERATED_TOKENS, LLM_PROMPT_TOKENS, LLM_TOKENS_PER_SECOND, LLM_TTFT_SECONDS, register_collector
+)
+from utils.tracing import set_attributes
+
+_clients: Dict[str, ollama.Client] = {}
+_client_lock = threading.Lock()
+
+_timings: Dict[str, Dict] = {}
+_timings_lock = threading.Lock()
+
+# A load_duration above this means the model was not resident
+COLD_LOAD_THRESHOLD_SECONDS = 0.5
+
+
+def _hosts() -> List[str]:
+    """Ollama hosts from OLLAMA_HOSTS (comma-separated) or OLLAMA_HOST"""
+    hosts = [h.strip() for h in os.getenv('OLLAMA_HOSTS', '').split(',') if h.strip()]
+    return hosts or [os.getenv('OLLAMA_HOST', '')]
+
+
+def _client_for(host: str) -> ollama.Client:
+    with _client_lock:
+        client = _clients.get(host)
+        if client is None:
+            timeout = float(os.getenv('OLLAMA_TIMEOUT', '300'))
+            client = ollama.Client(host=host or None, timeout=timeout)
+            _clients[host] = client
+        return client
+
+
+def get_client(affinity: Optional[str] = None) -> ollama.Client:
+    """Get a shared Ollama client (reuses pooled HTTP connections)
+
+    With several OLLAMA_HOSTS, requests carrying the same affinity key (a chat
+    ID) always go to the same host, so that server can reuse the KV cache of
+    the chat's previous turn. Within one Ollama server, parallel slots
+    (OLLAMA_NUM_PARALLEL) are already matched to the longest cached prefix.
+    """
+    hosts = _hosts()
+    if affinity is None or len(hosts) == 1:
+        return _client_for(hosts[0])
+    return _client_for(hosts[zlib.crc32(affinity.encode('utf-8')) % len(hosts)])
+
+
+def get_all_clients() -> List[ollama.Client]:
+    """Get a client for every configured Ollama host"""
+    return [_client_for(host) for host in _hosts()]
+
+
+def _working_hours() -> Optional[Tuple[int, int]]:
+    """Parse OLLAMA_WORKING_HOURS ('8-22') into (start, end) hours"""
+    value = os.getenv('OLLAMA_WORKING_HOURS', '').strip()
+    if not value or '-' not in value:
+        return None
+    try:
+        start, end = (int(part) for part in value.split('-', 1))
+    except ValueError:
+        return None
+    if not (0 <= start <= 23 and 1 <= end <= 24 and start < end):
+        return None
+    return start, end
+
+
+def in_working_hours(now: Optional[datetime] = None) -> bool:
+    """Check whether models should currently be kept resident"""
+    hours = _working_hours()
+    if hours is None:
+        return False
+    now = now or datetime.now()
+    return hours[0] <= now.hour < hours[1]
+
+
+def get_keep_alive(now: Optional[datetime] = None) -> str:
+    """Get the keep_alive value to send with each request
+
+    During working hours models stay loaded until the end of the working day;
+    outside them the configured OLLAMA_KEEP_ALIVE (Ollama's own default is 5m)
+    applies so the GPU memory is released when nobody is studying.
+    """
+    now = now or datetime.now()
+    hours = _working_hours()
+    if hours is not None and in_working_hours(now):
+        end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=hours[1] - now.hour)
+        return f"{max(60, int((end - now).total_seconds()))}s"
+    return os.getenv('OLLAMA_KEEP_ALIVE', '5m')
+
+
+def record_timings(model: str, response) -> None:
+    """Record load vs. generation time from an Ollama response (durations are in ns)"""
+    if not response:
+        return
+    load = (response.get('load_duration') or 0) / 1e9
+    prompt_eval = (response.get('prompt_eval_duration') or 0) / 1e9
+    generation = (response.get('eval_duration') or 0) / 1e9
+
+    with _timings_lock:
+        stats = _timings.setdefault(model, {
+            'requests': 0, 'cold_loads': 0, 'load_seconds': 0.0, 'max_load_seconds': 0.0,
+            'prompt_eval_seconds': 0.0, 'generation_seconds': 0.0,
+            'prompt_tokens': 0, 'generated_tokens': 0,
+        })
+        stats['requests'] += 1
+        stats['load_seconds'] += load
+        stats['max_load_seconds'] = max(stats['max_load_seconds'], load)
+        if load > COLD_LOAD_THRESHOLD_SECONDS:
+            stats['cold_loads'] += 1
+        stats['prompt_eval_seconds'] += prompt_eval
+        stats['generation_seconds'] += generation
+        stats['prompt_tokens'] += response.get('prompt_eval_count') or 0
+        stats['generated_tokens'] += response.get('eval_count') or 0
+
+    # Warm-up loads evaluate no prompt and generate nothing; only real requests go in the histograms
+    prompt_tokens = response.get('prompt_eval_count')
+    generated_tokens = response.get('eval_count')
+    if prompt_tokens:
+        LLM_TTFT_SECONDS.labels(model).observe(load + prompt_eval)
+        LLM_PROMPT_TOKENS.labels(model).observe(prompt_tokens)
+    if generated_tokens:
+        LLM_GENERATED_TOKENS.labels(model).observe(generated_tokens)
+        if generation > 0:
+            LLM_TOKENS_PER_SECOND.labels(model).observe(generated_tokens / generation)
+    set_attributes(**{'llm.model': model, 'llm.prompt_tokens': prompt_tokens or 0,
+                      'llm.generated_tokens': generated_tokens or 0, 'llm.load_ms': round(load * 1000, 1)})
+
+
+def track_stream(model: str, stream: Iterable) -> Iterator:
+    """Pass a streaming response through, recording timings from the final chunk"""
+    for chunk in stream:
+        if chunk.get('done'):
+            record_timings(model, chunk)
+        yield chunk
+
+
+def get_timing_stats() -> Dict[str, Dict]:
+    """Get per-model load and generation timing totals"""
+    with _timings_lock:
+        result = {}
+        for model, stats in _timings.items():
+            entry = {k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()}
+            if stats['generation_seconds'] > 0:
+                entry['tokens_per_second'] = round(stats['generated_tokens'] / stats['generation_seconds'], 2)
+            result[model] = entry
+        return result
+
+
+def _collect_timings():
+    with _timings_lock:
+        models = {model: dict(stats) for model, stats in _timings.items()}
+    yield ('nexnote_llm_cold_loads', 'counter', "Requests where Ollama had to load the model first",
+           [({'model': m}, s['cold_loads']) for m, s in models.items()])
+    yield ('nexnote_llm_load_seconds', 'counter', "Model load time reported by Ollama",
+           [({'model': m}, round(s['load_seconds'], 6)) for m, s in models.items()])
+
+
+register_collector(_collect_timings)
+
+
+def warm_up_models(chat_models: List[str], embedding_models: List[str]) -> Dict[str, float]:
+    """Load models into memory on every host ahead of the first real request"""
+    keep_alive = get_keep_alive()
+    loaded = {}
+
+    for client in get_all_clients():
+        for model in chat_models:
+            try:
+                start = time.perf_counter()
+                # An empty prompt loads the model without generating anything
+                response = client.generate(model=model, prompt='', keep_alive=keep_alive)
+                record_timings(model, response)
+                loaded[model] = max(loaded.get(model, 0.0), time.perf_counter() - start)
+            except Exception as e:
+                print(f"Warm-up failed for {model}: {str(e)}")
+
+        for model in embedding_models:
+            try:
+                start = time.perf_counter()
+                client.embeddings(model=model, prompt='warm-up', keep_alive=keep_alive)
+                loaded[model] = max(loaded.get(model, 0.0), time.perf_counter() - start)
+            except Exception as e:
+                print(f"Warm-up failed for {model}: {str(e)}")
+
+    return loaded
+
+
+class KeepAliveManager:
+    """Background thread that keeps models resident during working hours"""
+
+    def __init__(self, chat_models: List[str], embedding_models: List[str], interval: float = 300.0):
+        self.chat_models = chat_models
+        self.embedding_models = embedding_models
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Warm up immediately, then refresh residency periodically"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        loaded = warm_up_models(self.chat_models, self.embedding_models)
+        if loaded:
+            print("🔥 Models warmed up: " + ", ".join(f"{m} ({s:.1f}s)" for m, s in loaded.items()))
+
+        while not self._stop.wait(self.interval):
+            # Re-pinging is cheap when the model is resident and reloads it
+            # after an Ollama restart or when working hours begin
+            if in_working_hours():
+                warm_up_models(self.chat_models, self.embedding_models)
+
+
+_keep_alive_manager: Optional[KeepAliveManager] = None
+_manager_lock = threading.Lock()
+
+
+def start_warm_up(chat_models: List[str], embedding_models: List[str]) -> Optional[KeepAliveManager]:
+    """Start the warm-up / keep-alive thread once per process (OLLAMA_WARMUP=false disables it)"""
+    global _keep_alive_manager
+    if os.getenv('OLLAMA_WARMUP', 'true').lower() != 'true':
+        return None
+    with _manager_lock:
+        if _keep_alive_manager is None:
+            _keep_alive_manager = KeepAliveManager(
+                chat_models,
+                embedding_models,
+                interval=float(os.getenv('OLLAMA_KEEPALIVE_INTERVAL', '300'))
+            )
+            _keep_alive_manager.start()
+    return _keep_alive_manager
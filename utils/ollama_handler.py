@@ -3,23 +3,20 @@ Ollama LLM handler
 Manages interactions with local Ollama models
 """
 
-import ollama
-from typing import List, Dict, Generator
+import time
+from typing import List, Dict, Generator, Optional, Tuple
 
+from utils.request_coalescer import coalescer, make_key
+from utils.ollama_client import get_client, get_keep_alive, record_timings, track_stream
+from utils.llm_scheduler import get_scheduler, SchedulerBusy, PRIORITY_INTERACTIVE
+from utils.prompt_builder import build_messages, record_prefill
+from utils.metrics import LLM_STREAM_TTFT_SECONDS, observe_stage, stage_timer
+from utils.shared_cache import get_answer_cache
 
-def get_nexnote_response(user_message: str, context: List[Dict], model: str, conversation_history: List[Dict] = None) -> str:
-    """Get response from Ollama model with context and conversation history"""
-    if conversation_history is None:
-        conversation_history = []
-    
-    # Build context from retrieved documents - use top 3 for better context
-    context_text = "\n\n".join([
-        f"📄 From {match.get('metadata', {}).get('filename', 'Unknown')}:\n{match.get('metadata', {}).get('text', '')[:800]}"
-        for match in context[:3] if match.get('metadata', {}).get('text')
-    ])
-    
-    # Enhanced system prompt for better responses
-    system_prompt = """You are NexNote, an intelligent AI study assistant. You help students learn by providing clear, concise, and conversational responses.
+BUSY_MESSAGE = "⏳ NexNote is handling a lot of requests right now. Please try again in a moment."
+
+# Enhanced system prompt for better responses
+SYSTEM_PROMPT = """You are NexNote, an intelligent AI study assistant. You help students learn by providing clear, concise, and conversational responses.
 
 Guidelines:
 - Answer naturally and conversationally
@@ -29,125 +26,170 @@ Guidelines:
 - When using the knowledge base, integrate the information smoothly into your answer
 - Remember the conversation context and refer back to previous messages when relevant"""
 
+NUM_CTX = 2048              # Reduced context for faster processing (was 4096)
+NUM_PREDICT = 1024          # Reduced for faster responses (was 2048)
+
+# Tokens of num_ctx kept free for the answer; the rest is the prompt budget
+RESPONSE_RESERVE_TOKENS = 512
+PROMPT_TOKEN_BUDGET = NUM_CTX - RESPONSE_RESERVE_TOKENS
+
+# History window start moves in steps of this many messages, so the prompt
+# prefix stays byte-identical across turns and Ollama can reuse its KV cache
+HISTORY_WINDOW_STEP = 4
+
+# GPU-optimized generation options
+CHAT_OPTIONS = {
+    'num_predict': NUM_PREDICT,
+    'temperature': 0.7,      # Slightly lower for faster generation
+    'top_k': 40,            # Reduced for speed
+    'top_p': 0.9,           # Reduced for speed
+    'num_ctx': NUM_CTX,
+    'repeat_penalty': 1.1,  # Reduce repetition
+    'num_gpu': -1,          # Use all available GPUs (-1 = auto, 0 = CPU only)
+    'num_thread': 8,        # CPU threads for parallel processing
+    'use_mmap': True,       # Memory mapping for faster loading
+    'use_mlock': False,     # Don't lock memory (allows swapping if needed)
+}
+
+
+def _render_prompt(context_text: str, user_message: str) -> str:
+    """Render the final user message from retrieved context and the question"""
     if context_text:
-        prompt = f"""Based on the following information from the knowledge base:
+        return f"""Based on the following information from the knowledge base:
 
 {context_text}
 
 Question: {user_message}
 
 Provide a clear and natural answer. Use simple formatting only when necessary for clarity (like separating topics or highlighting key points)."""
-    else:
-        prompt = f"""Question: {user_message}
+
+    return f"""Question: {user_message}
 
 Provide a clear and natural answer. Keep it conversational and easy to understand."""
-    
-    try:
-        # Build messages array with conversation history
-        messages = [{'role': 'system', 'content': system_prompt}]
-        
-        # Add conversation history (limit to last 10 messages to avoid context overflow)
-        if conversation_history:
-            # Only include the last 10 messages (5 exchanges)
-            recent_history = conversation_history[-10:]
-            messages.extend(recent_history)
-        
-        # Add current user message
-        messages.append({'role': 'user', 'content': prompt})
-        
-        # Get response from Ollama with GPU-optimized options
-        response = ollama.chat(
-            model=model,
-            messages=messages,
-            options={
-                'num_predict': 1024,     # Reduced for faster responses (was 2048)
-                'temperature': 0.7,      # Slightly lower for faster generation
-                'top_k': 40,            # Reduced for speed
-                'top_p': 0.9,           # Reduced for speed
-                'num_ctx': 2048,        # Reduced context for faster processing (was 4096)
-                'repeat_penalty': 1.1,  # Reduce repetition
-                'num_gpu': -1,          # Use all available GPUs (-1 = auto, 0 = CPU only)
-                'num_thread': 8,        # CPU threads for parallel processing
-                'use_mmap': True,       # Memory mapping for faster loading
-                'use_mlock': False,     # Don't lock memory (allows swapping if needed)
-            }
+
+
+def _build_chat_messages(user_message: str, context: List[Dict], conversation_history: List[Dict],
+                         memo: str = '') -> Tuple[List[Dict], Dict]:
+    """Build the message list within the prompt token budget and log its size
+
+    Stable content (system prompt, memo, history) comes first and volatile
+    content (retrieved context and the question) last.
+    """
+    with stage_timer('chat', 'prompt_build'):
+        messages, stats = build_messages(
+            SYSTEM_PROMPT,
+            user_message,
+            context,
+            conversation_history,
+            _render_prompt,
+            budget=PROMPT_TOKEN_BUDGET,
+            memo=memo,
+            history_step=HISTORY_WINDOW_STEP
         )
-        
+    print(f"📏 Prompt: {stats['total_tokens']}/{stats['budget']} tokens "
+          f"(context {stats['context_tokens']} in {stats['context_chunks']} chunks, memo {stats['memo_tokens']}, "
+          f"history {stats['history_tokens']} in {stats['history_messages']} messages)")
+    return messages, stats
+
+
+def _log_prefill(stats: Dict, response) -> None:
+    """Log how much of the prompt Ollama had to prefill (the rest came from its KV cache)"""
+    evaluated = response.get('prompt_eval_count')
+    record_prefill(stats['total_tokens'], evaluated)
+    if evaluated is not None:
+        print(f"⚡ Prefill: {evaluated} tokens evaluated of ~{stats['total_tokens']} in prompt")
+
+
+def get_nexnote_response(user_message: str, context: List[Dict], model: str, conversation_history: List[Dict] = None,
+                         priority: int = PRIORITY_INTERACTIVE, memo: str = '',
+                         chat_id: Optional[str] = None) -> str:
+    """Get response from Ollama model with context and conversation history"""
+    if conversation_history is None:
+        conversation_history = []
+
+    try:
+        # System prompt, question, best context, memo and recent history, by priority
+        messages, stats = _build_chat_messages(user_message, context, conversation_history, memo)
+
+        # The same prompt (question, context and history) answered by any worker recently
+        key = make_key('chat', model, messages, CHAT_OPTIONS)
+        cache = get_answer_cache()
+        if cache is not None:
+            cached = cache.get_text(key)
+            if cached is not None:
+                return cached
+
+        # Identical in-flight requests share a single Ollama call
+        with stage_timer('chat', 'generate'):
+            response = coalescer.do(
+                key,
+                lambda: get_scheduler().run(
+                    model, priority,
+                    # Pin the chat to one host so its cached prefix is reused
+                    lambda: get_client(chat_id).chat(model=model, messages=messages, options=CHAT_OPTIONS,
+                                                     keep_alive=get_keep_alive())
+                )
+            )
+            record_timings(model, response)
+        _log_prefill(stats, response)
+
+        if cache is not None and response['message']['content']:
+            cache.put_text(key, response['message']['content'])
         return response['message']['content']
+    except SchedulerBusy:
+        return BUSY_MESSAGE
     except Exception as e:
         return f"❌ **Error**: {str(e)}\n\n**Troubleshooting:**\n- Make sure Ollama is running: `ollama serve`\n- Check if model '{model}' is available: `ollama list`\n- Try pulling the model: `ollama pull {model}`\n- Check GPU usage: Task Manager > Performance > GPU"
 
 
-def get_nexnote_response_stream(user_message: str, context: List[Dict], model: str, conversation_history: List[Dict] = None) -> Generator[str, None, None]:
+def get_nexnote_response_stream(user_message: str, context: List[Dict], model: str, conversation_history: List[Dict] = None,
+                                priority: int = PRIORITY_INTERACTIVE, memo: str = '',
+                                chat_id: Optional[str] = None) -> Generator[str, None, None]:
     """Get streaming response from Ollama model with context and conversation history"""
     if conversation_history is None:
         conversation_history = []
-    
-    # Build context from retrieved documents - use top 3 for better context
-    context_text = "\n\n".join([
-        f"📄 From {match.get('metadata', {}).get('filename', 'Unknown')}:\n{match.get('metadata', {}).get('text', '')[:800]}"
-        for match in context[:3] if match.get('metadata', {}).get('text')
-    ])
-    
-    # Enhanced system prompt for better responses
-    system_prompt = """You are NexNote, an intelligent AI study assistant. You help students learn by providing clear, concise, and conversational responses.
-
-Guidelines:
-- Answer naturally and conversationally
-- Use simple formatting sparingly (only when it truly helps clarity)
-- Focus on the actual content, not excessive structure
-- Be helpful and friendly without being overly formal
-- When using the knowledge base, integrate the information smoothly into your answer
-- Remember the conversation context and refer back to previous messages when relevant"""
-
-    if context_text:
-        prompt = f"""Based on the following information from the knowledge base:
 
-{context_text}
-
-Question: {user_message}
-
-Provide a clear and natural answer. Use simple formatting only when necessary for clarity (like separating topics or highlighting key points)."""
-    else:
-        prompt = f"""Question: {user_message}
-
-Provide a clear and natural answer. Keep it conversational and easy to understand."""
-    
     try:
-        # Build messages array with conversation history
-        messages = [{'role': 'system', 'content': system_prompt}]
-        
-        # Add conversation history (limit to last 10 messages to avoid context overflow)
-        if conversation_history:
-            # Only include the last 10 messages (5 exchanges)
-            recent_history = conversation_history[-10:]
-            messages.extend(recent_history)
-        
-        # Add current user message
-        messages.append({'role': 'user', 'content': prompt})
-        
-        # Stream response from Ollama with GPU optimization
-        stream = ollama.chat(
-            model=model,
-            messages=messages,
-            stream=True,
-            options={
-                'num_predict': 1024,
-                'temperature': 0.7,
-                'top_k': 40,
-                'top_p': 0.9,
-                'num_ctx': 2048,
-                'repeat_penalty': 1.1,
-                'num_gpu': -1,          # Use all available GPUs
-                'num_thread': 8,        # CPU threads
-                'use_mmap': True,
-                'use_mlock': False,
-            }
+        # System prompt, question, best context, memo and recent history, by priority
+        messages, stats = _build_chat_messages(user_message, context, conversation_history, memo)
+
+        # Answers are cached under the non-streaming key, so either route can reuse them
+        key = make_key('chat', model, messages, CHAT_OPTIONS)
+        cache = get_answer_cache()
+        if cache is not None:
+            cached = cache.get_text(key)
+            if cached is not None:
+                yield cached
+                return
+
+        # Concurrent identical requests are fanned out from one Ollama stream
+        stream = coalescer.stream(
+            make_key('chat_stream', model, messages, CHAT_OPTIONS),
+            lambda: get_scheduler().stream(
+                model, priority,
+                # Pin the chat to one host so its cached prefix is reused
+                lambda: track_stream(model, get_client(chat_id).chat(model=model, messages=messages, stream=True,
+                                                                     options=CHAT_OPTIONS, keep_alive=get_keep_alive()))
+            )
         )
-        
+
+        started = time.perf_counter()
+        first_token = True
+        parts = []
         for chunk in stream:
+            if chunk.get('done'):
+                _log_prefill(stats, chunk)
             if chunk.get('message', {}).get('content'):
+                if first_token:
+                    LLM_STREAM_TTFT_SECONDS.labels(model).observe(time.perf_counter() - started)
+                    first_token = False
+                parts.append(chunk['message']['content'])
                 yield chunk['message']['content']
-                
+        observe_stage('chat', 'generate_stream', time.perf_counter() - started)
+        if cache is not None and parts:
+            cache.put_text(key, ''.join(parts))
+
+    except SchedulerBusy:
+        yield BUSY_MESSAGE
     except Exception as e:
         yield f"❌ **Error**: {str(e)}\n\n**Troubleshooting:**\n- Make sure Ollama is running\n- Check if model is available\n- Try: `ollama pull {model}`"
@@ -3,13 +3,18 @@ Pinecone vector database handler
 Handles file processing, embedding generation, and knowledge base operations
 """
 
-import ollama
 from pinecone import Pinecone, ServerlessSpec
 import PyPDF2
 import docx
 from typing import List, Dict
 import hashlib
 
+from utils.request_coalescer import coalescer, make_key
+from utils.ollama_client import get_client, get_keep_alive
+from utils.metrics import stage_timer
+from utils.tracing import set_attributes
+from utils.shared_cache import get_embedding_cache
+
 
 def initialize_pinecone(api_key: str, index_name: str):
     """Initialize Pinecone vector database"""
@@ -102,10 +107,21 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]
 def get_embedding(text: str, model: str = "nomic-embed-text") -> List[float]:
     """Generate embeddings using Ollama"""
     try:
-        response = ollama.embeddings(
-            model=model,
-            prompt=text
+        key = make_key('embeddings', model, text)
+        # Texts any worker embedded before (re-uploads, repeated questions) skip Ollama
+        cache = get_embedding_cache()
+        if cache is not None:
+            cached = cache.get_vector(key)
+            if cached is not None:
+                return cached
+
+        # Identical texts embedded concurrently share one Ollama call
+        response = coalescer.do(
+            key,
+            lambda: get_client().embeddings(model=model, prompt=text, keep_alive=get_keep_alive())
         )
+        if cache is not None and response.get('embedding'):
+            cache.put_vector(key, response['embedding'])
         return response['embedding']
     except Exception as e:
         print(f"Error generating embedding: {str(e)}")
@@ -123,37 +139,41 @@ def process_uploaded_files(files, api_key: str, index_name: str):
         file_hash = hashlib.md5(file.filename.encode()).hexdigest()
         
         # Extract text
-        text = extract_text_from_file(file)
+        with stage_timer('ingestion', 'extract'):
+            text = extract_text_from_file(file)
         
         if not text:
             continue
         
         # Chunk text
-        chunks = chunk_text(text)
+        with stage_timer('ingestion', 'chunk'):
+            chunks = chunk_text(text)
         
         # Generate embeddings and store in Pinecone
         vectors = []
-        for chunk_idx, chunk in enumerate(chunks):
-            embedding = get_embedding(chunk)
-            
-            if embedding:
-                vector_id = f"{file_hash}_{chunk_idx}"
-                vectors.append({
-                    'id': vector_id,
-                    'values': embedding,
-                    'metadata': {
-                        'filename': file.filename,
-                        'chunk_index': chunk_idx,
-                        'text': chunk
-                    }
-                })
+        with stage_timer('ingestion', 'embed'):
+            for chunk_idx, chunk in enumerate(chunks):
+                embedding = get_embedding(chunk)
+                
+                if embedding:
+                    vector_id = f"{file_hash}_{chunk_idx}"
+                    vectors.append({
+                        'id': vector_id,
+                        'values': embedding,
+                        'metadata': {
+                            'filename': file.filename,
+                            'chunk_index': chunk_idx,
+                            'text': chunk
+                        }
+                    })
         
         # Upsert to Pinecone in batches
         if vectors:
             batch_size = 100
-            for i in range(0, len(vectors), batch_size):
-                batch = vectors[i:i + batch_size]
-                index.upsert(vectors=batch)
+            with stage_timer('ingestion', 'upsert'):
+                for i in range(0, len(vectors), batch_size):
+                    batch = vectors[i:i + batch_size]
+                    index.upsert(vectors=batch)
     
     return True
 
@@ -165,17 +185,20 @@ def search_knowledge_base(query: str, api_key: str, index_name: str, top_k: int
         index = pc.Index(index_name)
         
         # Generate query embedding
-        query_embedding = get_embedding(query)
+        with stage_timer('retrieval', 'embed_query'):
+            query_embedding = get_embedding(query)
         
         if not query_embedding:
             return []
         
         # Search Pinecone
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
+        with stage_timer('retrieval', 'vector_search'):
+            results = index.query(
+                vector=query_embedding,
+                top_k=top_k,
+                include_metadata=True
+            )
+            set_attributes(**{'retrieval.top_k': top_k, 'retrieval.matches': len(results['matches'])})
         
         return results['matches']
     except Exception as e:
@@ -0,0 +1,187 @@
+"""
+On-demand profiling
+Captures cProfile statistics or a tracemalloc allocation diff over the next N requests
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+MAX_PROFILED_REQUESTS = 1000
+TRACEMALLOC_FRAMES = 10
+
+
+class RequestProfiler:
+    """Profiles the next N requests once armed; while idle each request costs one attribute check
+
+    cProfile captures one request at a time (concurrent requests are skipped
+    rather than queued), and the statistics of all N are merged. tracemalloc
+    compares a snapshot taken when armed with one taken after the Nth request,
+    so it shows what those requests allocated and kept.
+    """
+
+    def __init__(self, output_dir: Path, keep: int = 10):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._cprofile_busy = threading.Lock()
+        self._mode: Optional[str] = None
+        self._results: deque = deque(maxlen=keep)
+        self._reset()
+
+    def _reset(self):
+        self._mode = None
+        self._requested = 0
+        self._claimed = 0
+        self._completed = 0
+        self._top = 40
+        self._request_ids: List[str] = []
+        self._stats: Optional[pstats.Stats] = None
+        self._baseline = None
+        self._started_tracemalloc = False
+
+    def arm(self, mode: str, requests: int, top: int = 40) -> Dict:
+        """Start a capture of the next `requests` requests"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+        if not 1 <= requests <= MAX_PROFILED_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_PROFILED_REQUESTS}")
+        with self._lock:
+            if self._mode is not None:
+                raise ValueError(f"A {self._mode} capture is already running")
+            self._reset()
+            self._requested = requests
+            self._top = max(5, min(top, 200))
+            if mode == 'tracemalloc':
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    self._started_tracemalloc = True
+                self._baseline = tracemalloc.take_snapshot()
+            self._mode = mode
+        return self.get_status()
+
+    def cancel(self) -> Dict:
+        """Stop the running capture without producing a result"""
+        with self._lock:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self._reset()
+        return self.get_status()
+
+    def start_request(self, request_id: str) -> Optional[object]:
+        """Begin profiling this request if a capture wants it; returns a handle for finish_request"""
+        if self._mode is None:
+            return None
+        with self._lock:
+            if self._mode is None or self._claimed >= self._requested:
+                return None
+            if self._mode == 'cprofile':
+                if not self._cprofile_busy.acquire(blocking=False):
+                    return None
+                profile = cProfile.Profile()
+            else:
+                profile = None
+            self._claimed += 1
+            self._request_ids.append(request_id)
+            handle = (self._mode, profile)
+        if profile is not None:
+            profile.enable()
+        return handle
+
+    def finish_request(self, handle: Optional[object]):
+        if handle is None:
+            return
+        mode, profile = handle
+        if profile is not None:
+            profile.disable()
+            self._cprofile_busy.release()
+        with self._lock:
+            if self._mode != mode:
+                # Cancelled while this request was running
+                return
+            if profile is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+            self._completed += 1
+            if self._completed >= self._requested:
+                self._finish_capture()
+
+    def _finish_capture(self):
+        """Write the capture to disk and keep its report (called with the lock held)"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        result = {
+            'mode': self._mode,
+            'requests': self._completed,
+            'request_ids': list(self._request_ids),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        try:
+            if self._mode == 'cprofile':
+                path = self.output_dir / f"cprofile_{stamp}.prof"
+                self._stats.dump_stats(str(path))
+                stream = io.StringIO()
+                self._stats.stream = stream
+                self._stats.sort_stats('cumulative').print_stats(self._top)
+                result['report'] = stream.getvalue()
+            else:
+                snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                ))
+                path = self.output_dir / f"tracemalloc_{stamp}.snapshot"
+                snapshot.dump(str(path))
+                current, peak = tracemalloc.get_traced_memory()
+                differences = snapshot.compare_to(self._baseline, 'lineno')[:self._top]
+                result['traced_current_mb'] = round(current / 1e6, 3)
+                result['traced_peak_mb'] = round(peak / 1e6, 3)
+                result['report'] = '\n'.join(str(stat) for stat in differences)
+            result['id'] = path.name
+            result['file'] = str(path)
+            self._results.append(result)
+            print(f"🔬 {self._mode} capture of {self._completed} requests written to {path}")
+        except Exception as e:
+            print(f"Error writing {self._mode} capture: {str(e)}")
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self._reset()
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {
+                'armed': self._mode is not None,
+                'mode': self._mode,
+                'requested': self._requested,
+                'completed': self._completed,
+                'results': [{k: v for k, v in r.items() if k != 'report'} for r in self._results],
+            }
+
+    def get_result(self, result_id: str) -> Optional[Dict]:
+        with self._lock:
+            for result in self._results:
+                if result['id'] == result_id:
+                    return dict(result)
+        return None
+
+
+_profiler: Optional[RequestProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> RequestProfiler:
+    """Get the process-wide request profiler"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = RequestProfiler(Path(os.getenv('PROFILE_DIR', 'profiles')))
+        return _profiler
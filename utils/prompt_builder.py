@@ -0,0 +1,230 @@
+"""
+Token-budgeted prompt assembly
+Fits system prompt, question, retrieved context and history into the model's context window
+"""
+
+import math
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import register_collector
+
+# Roughly the chat-template overhead Ollama adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+_totals = {'requests': 0, 'prompt_tokens': 0, 'max_prompt_tokens': 0,
+           'context_truncated': 0, 'history_dropped': 0,
+           'prefill_requests': 0, 'prefill_tokens': 0, 'prefill_prompt_tokens': 0}
+_totals_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the token count of text
+
+    Ollama does not expose the model tokenizer, so this takes the larger of
+    two fast estimates (~4 characters per token, and one token per word or
+    punctuation mark). It errs on the high side, which is what keeps a
+    budgeted prompt from overflowing num_ctx.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(_TOKEN_PATTERN.findall(text)))
+
+
+def count_message_tokens(message: Dict) -> int:
+    """Estimate the tokens a chat message occupies in the prompt"""
+    return count_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at a word boundary so it fits in max_tokens"""
+    if max_tokens <= 0:
+        return ''
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    words = text[:max_tokens * 4].split(' ')
+    while words and count_tokens(' '.join(words)) > max_tokens:
+        words.pop()
+    return ' '.join(words)
+
+
+def format_context_block(match: Dict, text: str) -> str:
+    """Format one retrieved chunk for the prompt"""
+    filename = match.get('metadata', {}).get('filename', 'Unknown')
+    return f"📄 From {filename}:\n{text}"
+
+
+def build_messages(system_prompt: str,
+                   user_message: str,
+                   context: List[Dict],
+                   history: List[Dict],
+                   render_prompt: Callable[[str, str], str],
+                   budget: int,
+                   max_chunks: int = 3,
+                   max_chunk_tokens: int = 250,
+                   max_history_messages: int = 10,
+                   memo: str = '',
+                   history_step: int = 1) -> Tuple[List[Dict], Dict]:
+    """Assemble chat messages within a token budget
+
+    Space is filled by priority: system prompt, question, best context
+    (highest-scoring chunks first), the running conversation memo, then the
+    most recent history. Returns the messages and per-request prompt-size stats.
+
+    The layout keeps the stable part first (system prompt, memo, history) and
+    the volatile part last (context and question in the final user message).
+    With history_step > 1 the first kept history message only moves in steps
+    of that many messages, so consecutive turns share a byte-identical prefix
+    that Ollama can serve from its KV cache instead of prefilling it again.
+    """
+    system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    # The question always goes in, truncated only if it alone would overflow
+    question = user_message
+    question_tokens = count_tokens(render_prompt('', question)) + MESSAGE_OVERHEAD_TOKENS
+    if system_tokens + question_tokens > budget:
+        overflow = system_tokens + question_tokens - budget
+        question = truncate_to_tokens(question, count_tokens(question) - overflow)
+        question_tokens = count_tokens(render_prompt('', question)) + MESSAGE_OVERHEAD_TOKENS
+
+    remaining = budget - system_tokens - question_tokens
+
+    # Best context next: whole chunks while they fit, then one truncated chunk
+    blocks: List[str] = []
+    context_truncated = 0
+    prompt = render_prompt('', question)
+    prompt_tokens = question_tokens
+    for match in context[:max_chunks]:
+        text = match.get('metadata', {}).get('text')
+        if not text:
+            continue
+
+        chunk = truncate_to_tokens(text, max_chunk_tokens)
+        candidate = render_prompt("\n\n".join(blocks + [format_context_block(match, chunk)]), question)
+        candidate_tokens = count_tokens(candidate) + MESSAGE_OVERHEAD_TOKENS
+
+        if candidate_tokens - question_tokens > remaining:
+            # Fill what's left of the budget from this chunk, then stop
+            used = prompt_tokens - question_tokens
+            block_overhead = candidate_tokens - prompt_tokens - count_tokens(chunk)
+            room = remaining - used - block_overhead
+            if room < 32:
+                break
+            chunk = truncate_to_tokens(chunk, room)
+            candidate = render_prompt("\n\n".join(blocks + [format_context_block(match, chunk)]), question)
+            candidate_tokens = count_tokens(candidate) + MESSAGE_OVERHEAD_TOKENS
+            if candidate_tokens - question_tokens > remaining:
+                break
+
+        if chunk != text:
+            context_truncated += 1
+        blocks.append(format_context_block(match, chunk))
+        prompt, prompt_tokens = candidate, candidate_tokens
+
+    context_tokens = prompt_tokens - question_tokens
+    remaining -= context_tokens
+
+    # Running memo of older turns, sent as a second system message
+    memo_message = None
+    memo_tokens = 0
+    if memo:
+        memo_message = {'role': 'system', 'content': f"Summary of the earlier conversation:\n{memo}"}
+        memo_tokens = count_message_tokens(memo_message)
+        if memo_tokens > remaining:
+            memo_message['content'] = truncate_to_tokens(memo_message['content'], remaining - MESSAGE_OVERHEAD_TOKENS)
+            memo_tokens = count_message_tokens(memo_message) if memo_message['content'] else 0
+        if not memo_tokens:
+            memo_message = None
+        remaining -= memo_tokens
+
+    # Most recent history, keeping the kept turns contiguous
+    start = max(0, len(history) - max_history_messages) if max_history_messages else len(history)
+    history_tokens = 0
+    first = len(history)
+    while first > start:
+        tokens = count_message_tokens(history[first - 1])
+        if history_tokens + tokens > remaining:
+            break
+        history_tokens += tokens
+        first -= 1
+
+    # Anchor the window start to a multiple of history_step (prefix stability)
+    if first > 0 and history_step > 1:
+        first = min(len(history), -(-first // history_step) * history_step)
+    kept = history[first:]
+    history_tokens = sum(count_message_tokens(m) for m in kept)
+
+    messages = [{'role': 'system', 'content': system_prompt}]
+    if memo_message:
+        messages.append(memo_message)
+    messages.extend(kept)
+    messages.append({'role': 'user', 'content': prompt})
+
+    stats = {
+        'budget': budget,
+        'total_tokens': system_tokens + prompt_tokens + memo_tokens + history_tokens,
+        'system_tokens': system_tokens,
+        'question_tokens': question_tokens,
+        'context_tokens': context_tokens,
+        'context_chunks': len(blocks),
+        'context_truncated': context_truncated,
+        'memo_tokens': memo_tokens,
+        'history_tokens': history_tokens,
+        'history_messages': len(kept),
+        'history_dropped': len(history) - len(kept),
+    }
+    _record(stats)
+    return messages, stats
+
+
+def _record(stats: Dict):
+    with _totals_lock:
+        _totals['requests'] += 1
+        _totals['prompt_tokens'] += stats['total_tokens']
+        _totals['max_prompt_tokens'] = max(_totals['max_prompt_tokens'], stats['total_tokens'])
+        _totals['context_truncated'] += stats['context_truncated']
+        _totals['history_dropped'] += stats['history_dropped']
+
+
+def record_prefill(prompt_tokens: int, evaluated_tokens: Optional[int]) -> None:
+    """Record how many prompt tokens Ollama actually evaluated (prompt_eval_count)
+
+    Tokens served from the KV cache are not counted by Ollama, so the gap
+    between the estimated prompt size and the evaluated count is prefix reuse.
+    """
+    if evaluated_tokens is None:
+        return
+    with _totals_lock:
+        _totals['prefill_requests'] += 1
+        _totals['prefill_tokens'] += evaluated_tokens
+        _totals['prefill_prompt_tokens'] += prompt_tokens
+
+
+def get_prompt_stats() -> Dict:
+    """Get aggregate prompt-size and prefill stats since startup"""
+    with _totals_lock:
+        stats = dict(_totals)
+    stats['avg_prompt_tokens'] = round(stats['prompt_tokens'] / stats['requests'], 1) if stats['requests'] else 0.0
+    if stats['prefill_requests']:
+        stats['avg_prefill_tokens'] = round(stats['prefill_tokens'] / stats['prefill_requests'], 1)
+        stats['prefix_reuse_ratio'] = round(
+            max(0.0, 1 - stats['prefill_tokens'] / max(1, stats['prefill_prompt_tokens'])), 3
+        )
+    return stats
+
+
+def _collect_prompts():
+    stats = get_prompt_stats()
+    yield ('nexnote_prompt_items_trimmed', 'counter',
+           "Context chunks truncated and history messages dropped to fit the token budget",
+           [({'part': 'context'}, stats['context_truncated']), ({'part': 'history'}, stats['history_dropped'])])
+    yield ('nexnote_llm_prefix_reuse_ratio', 'gauge',
+           "Share of estimated prompt tokens Ollama served from its KV cache instead of evaluating",
+           [({}, stats.get('prefix_reuse_ratio', 0.0))])
+
+
+register_collector(_collect_prompts)
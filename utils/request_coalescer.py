@@ -0,0 +1,175 @@
+"""
+Request coalescing (single-flight)
+Shares one underlying Ollama call between concurrent identical requests
+"""
+
+import contextvars
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from utils.metrics import register_collector
+
+
+def _normalize(value: Any) -> Any:
+    """Collapse whitespace in every string, including those nested in message lists and dicts"""
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(operation: str, model: str, *inputs: Any) -> str:
+    """Build a coalescing key from (operation, model, normalized input)"""
+    # Whitespace differences should not defeat coalescing
+    normalized = [_normalize(value) for value in inputs]
+
+    digest = hashlib.sha256(
+        json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    ).hexdigest()
+    return f"{operation}:{model}:{digest}"
+
+
+class _Call:
+    """A single in-flight call that several callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _Stream:
+    """A single in-flight stream fanned out to several subscribers"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+
+
+class RequestCoalescer:
+    """Collapses concurrent identical requests into one underlying call"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self._stats = {'calls': 0, 'coalesced': 0, 'streams': 0, 'stream_subscribers': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['calls'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Remove before waking followers so later requests start a fresh call
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result
+
+    def stream(self, key: str, fn: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """Fan out one underlying stream to every concurrent caller with the same key
+
+        The source stream is drained by a background thread so a slow or
+        disconnected subscriber never stalls the others. Subscribers that join
+        late replay the chunks produced so far, then follow the live stream.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = _Stream()
+                self._streams[key] = shared
+                self._stats['streams'] += 1
+                # Run the pump in the leader's context so spans it records join the request trace
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._pump, key, shared, fn), daemon=True).start()
+            else:
+                self._stats['stream_subscribers'] += 1
+
+        return self._subscribe(shared)
+
+    def _pump(self, key: str, shared: _Stream, fn: Callable[[], Iterable[Any]]):
+        """Drain the source stream into the shared buffer"""
+        try:
+            for chunk in fn():
+                with shared.cond:
+                    shared.chunks.append(chunk)
+                    shared.cond.notify_all()
+        except BaseException as e:
+            shared.error = e
+        finally:
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+            with shared.cond:
+                shared.finished = True
+                shared.cond.notify_all()
+
+    @staticmethod
+    def _subscribe(shared: _Stream) -> Iterator[Any]:
+        """Yield chunks from a shared stream as they arrive"""
+        position = 0
+        while True:
+            with shared.cond:
+                while position >= len(shared.chunks) and not shared.finished:
+                    shared.cond.wait()
+                pending = shared.chunks[position:]
+                finished = shared.finished
+
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+
+            if finished and position >= len(shared.chunks):
+                if shared.error is not None:
+                    raise shared.error
+                return
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get coalescing counters and the number of calls currently in flight"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls) + len(self._streams)
+        return stats
+
+
+# Process-wide coalescer shared by the Ollama handlers
+coalescer = RequestCoalescer()
+
+
+def _collect_coalescing():
+    stats = coalescer.get_stats()
+    yield ('nexnote_coalescer_calls', 'counter', "Calls that went to Ollama, one per group of identical requests",
+           [({'kind': 'call'}, stats['calls']), ({'kind': 'stream'}, stats['streams'])])
+    yield ('nexnote_coalescer_joined', 'counter', "Requests served by joining an identical in-flight call",
+           [({'kind': 'call'}, stats['coalesced']), ({'kind': 'stream'}, stats['stream_subscribers'])])
+    yield ('nexnote_coalescer_in_flight', 'gauge', "Shared calls currently in flight", [({}, stats['in_flight'])])
+
+
+register_collector(_collect_coalescing)
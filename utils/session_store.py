@@ -0,0 +1,166 @@
+"""
+Server-side session backends
+Pluggable Flask session interfaces (SQLite shared across workers, or in-process)
+"""
+
+import json
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict whose contents live on the server, keyed by a random ID cookie"""
+
+    def __init__(self, initial: Optional[Dict] = None, sid: Optional[str] = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class _ServerSideSessionInterface(SessionInterface):
+    """Cookie handling shared by the server-side backends"""
+
+    def _load(self, sid: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def _store(self, sid: str, data: Dict, expires_at: float):
+        raise NotImplementedError
+
+    def _delete(self, sid: str):
+        raise NotImplementedError
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self._load(sid)
+            if data is not None:
+                return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if session.modified or session.new:
+            self._store(session.sid, dict(session), time.time() + lifetime)
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+
+class SQLiteSessionInterface(_ServerSideSessionInterface):
+    """Sessions in a SQLite table, shared by every worker process on the host"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, sid: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, sid: str, data: Dict, expires_at: float):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (sid, json.dumps(data), expires_at)
+            )
+            # Occasionally sweep expired sessions
+            if random.random() < 0.01:
+                conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+    def _delete(self, sid: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+
+class MemorySessionInterface(_ServerSideSessionInterface):
+    """Sessions in this process's memory (single worker only)"""
+
+    def __init__(self):
+        self._sessions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(sid)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return dict(entry[0])
+
+    def _store(self, sid: str, data: Dict, expires_at: float):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+
+    def _delete(self, sid: str):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+def init_session(app) -> str:
+    """Install the session backend chosen by SESSION_BACKEND (sqlite|memory|filesystem)"""
+    backend = os.getenv('SESSION_BACKEND', 'sqlite').lower()
+
+    if backend == 'memory':
+        app.session_interface = MemorySessionInterface()
+    elif backend == 'filesystem':
+        from flask_session import Session
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config.setdefault('SESSION_FILE_DIR', './.flask_session/')
+        Path(app.config['SESSION_FILE_DIR']).mkdir(exist_ok=True)
+        Session(app)
+    else:
+        backend = 'sqlite'
+        app.session_interface = SQLiteSessionInterface(
+            Path(os.getenv('SESSION_DB_PATH', './.flask_session/sessions.db'))
+        )
+
+    return backend
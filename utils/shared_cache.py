@@ -0,0 +1,184 @@
+"""
+Shared result cache
+Embeddings (and, if enabled, chat answers) in a SQLite database shared by every worker process on the host
+"""
+
+import array
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.metrics import record_cache, register_collector
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_expiry ON cache (namespace, expires_at);
+"""
+
+# Reads are served from the memory-mapped database file, so every worker
+# shares one copy in the page cache instead of holding its own
+MMAP_BYTES = 256 * 1024 * 1024
+# Fraction of writes that also evict expired and surplus entries
+SWEEP_PROBABILITY = 0.01
+
+
+class SharedCache:
+    """One namespace of the shared cache (WAL mode, one connection per thread)
+
+    Entries expire after `ttl` seconds and the namespace is trimmed to about
+    `max_entries`, oldest expiry first. Errors are logged and treated as
+    misses, so a locked or broken cache file never fails a request.
+    """
+
+    def __init__(self, db_path: Path, namespace: str, max_entries: int, ttl: float):
+        self.db_path = Path(db_path)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (self.namespace, key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.stats['errors'] += 1
+            print(f"Error reading {self.namespace} cache: {str(e)}")
+            return None
+        self.stats['hits' if row else 'misses'] += 1
+        record_cache(self.namespace, row is not None)
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes):
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, sqlite3.Binary(value), time.time() + self.ttl)
+                )
+                if random.random() < SWEEP_PROBABILITY:
+                    self._sweep(conn)
+            self.stats['writes'] += 1
+        except sqlite3.Error as e:
+            self.stats['errors'] += 1
+            print(f"Error writing {self.namespace} cache: {str(e)}")
+
+    def _sweep(self, conn: sqlite3.Connection):
+        """Drop expired entries, then the soonest-expiring ones beyond max_entries"""
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time()))
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def get_vector(self, key: str) -> Optional[List[float]]:
+        """Get an embedding stored with put_vector"""
+        value = self.get(key)
+        return array.array('f', value).tolist() if value is not None else None
+
+    def put_vector(self, key: str, vector: List[float]):
+        """Store an embedding as packed float32 (a quarter of its JSON size)"""
+        self.put(key, array.array('f', vector).tobytes())
+
+    def get_text(self, key: str) -> Optional[str]:
+        value = self.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def put_text(self, key: str, text: str):
+        self.put(key, text.encode('utf-8'))
+
+    def entries(self) -> int:
+        try:
+            return self._conn().execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ? AND expires_at > ?", (self.namespace, time.time())
+            ).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+
+_caches: Dict[str, Optional[SharedCache]] = {}
+_caches_lock = threading.Lock()
+
+# namespace: (max entries env, default, ttl seconds env, default)
+# Answers are opt-in: a cached answer would make "ask again" return the same text
+CACHE_SETTINGS = {
+    'embedding': ('EMBEDDING_CACHE_ENTRIES', '200000', 'EMBEDDING_CACHE_TTL', str(30 * 86400)),
+    'answer': ('ANSWER_CACHE_ENTRIES', '0', 'ANSWER_CACHE_TTL', '3600'),
+}
+
+
+def _get_cache(namespace: str) -> Optional[SharedCache]:
+    """Get a namespace of the shared cache, or None if SHARED_CACHE=false or its size is 0"""
+    with _caches_lock:
+        if namespace not in _caches:
+            entries_env, entries_default, ttl_env, ttl_default = CACHE_SETTINGS[namespace]
+            max_entries = int(os.getenv(entries_env, entries_default))
+            cache = None
+            if os.getenv('SHARED_CACHE', 'true').lower() == 'true' and max_entries > 0:
+                try:
+                    cache = SharedCache(Path(os.getenv('SHARED_CACHE_PATH', 'cache/shared_cache.db')),
+                                        namespace, max_entries, float(os.getenv(ttl_env, ttl_default)))
+                except sqlite3.Error as e:
+                    print(f"Shared {namespace} cache disabled: {str(e)}")
+            _caches[namespace] = cache
+        return _caches[namespace]
+
+
+def get_embedding_cache() -> Optional[SharedCache]:
+    """Embeddings by (model, text), shared across workers"""
+    return _get_cache('embedding')
+
+
+def get_answer_cache() -> Optional[SharedCache]:
+    """Chat answers by (model, full prompt), shared across workers; None unless ANSWER_CACHE_ENTRIES is set"""
+    return _get_cache('answer')
+
+
+def _collect_shared_cache():
+    with _caches_lock:
+        caches = [cache for cache in _caches.values() if cache is not None]
+    if not caches:
+        return
+    yield ('nexnote_shared_cache_entries', 'gauge', "Live entries in the shared cache (all workers)",
+           [({'cache': cache.namespace}, cache.entries()) for cache in caches])
+    yield ('nexnote_shared_cache_errors', 'counter', "Shared cache reads and writes that failed in this worker",
+           [({'cache': cache.namespace}, cache.stats['errors']) for cache in caches])
+
+
+register_collector(_collect_shared_cache)
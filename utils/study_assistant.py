@@ -3,17 +3,44 @@ Study Assistant Module
 Advanced features for studying with uploaded notes
 """
 
-import ollama
 from typing import List, Dict, Optional
 import json
-from datetime import datetime
+import threading
 from pathlib import Path
 
+from utils.request_coalescer import coalescer, make_key
+from utils.llm_scheduler import get_scheduler, PRIORITY_STUDY
+from utils.ollama_client import get_client, get_keep_alive, record_timings
+from utils.metrics import stage_timer
+from utils.study_progress import StudyProgressStore
+from utils.flashcards import FlashcardStore
+
 # Study progress tracking directory
 STUDY_PROGRESS_DIR = Path("study_progress")
 STUDY_PROGRESS_DIR.mkdir(exist_ok=True)
 
 
+def _coalesced_chat(operation: str, prompt: str, model: str, priority: int = PRIORITY_STUDY) -> Dict:
+    """Run a single-prompt chat through the scheduler, sharing the call with identical concurrent requests
+
+    Results are not cached: asking again for a quiz or flashcards should give new ones.
+    """
+    with stage_timer('study', operation):
+        response = coalescer.do(
+            make_key(operation, model, prompt),
+            lambda: get_scheduler().run(
+                model, priority,
+                lambda: get_client().chat(
+                    model=model,
+                    messages=[{'role': 'user', 'content': prompt}],
+                    keep_alive=get_keep_alive()
+                )
+            )
+        )
+        record_timings(model, response)
+    return response
+
+
 def generate_summary(text: str, model: str = "deepseek-r1:1.5b") -> str:
     """Generate a concise summary of the given text"""
     try:
@@ -26,10 +53,7 @@ Notes:
 
 Summary:"""
         
-        response = ollama.chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}]
-        )
+        response = _coalesced_chat('summary', prompt, model)
         
         return response['message']['content']
     except Exception as e:
@@ -55,10 +79,7 @@ Notes:
 
 Quiz:"""
         
-        response = ollama.chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}]
-        )
+        response = _coalesced_chat('quiz', prompt, model)
         
         # Try to parse JSON response
         content = response['message']['content']
@@ -108,10 +129,7 @@ Notes:
 
 Analysis:"""
         
-        response = ollama.chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}]
-        )
+        response = _coalesced_chat('concepts', prompt, model)
         
         content = response['message']['content']
         
@@ -154,10 +172,7 @@ Notes:
 
 Flashcards:"""
         
-        response = ollama.chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}]
-        )
+        response = _coalesced_chat('flashcards', prompt, model)
         
         content = response['message']['content']
         
@@ -181,49 +196,97 @@ Flashcards:"""
         }]
 
 
+_progress_store = None
+_progress_lock = threading.Lock()
+
+
+def get_progress_store() -> StudyProgressStore:
+    """Get the study progress store, importing the legacy study_log.json once"""
+    global _progress_store
+    with _progress_lock:
+        if _progress_store is None:
+            _progress_store = StudyProgressStore(STUDY_PROGRESS_DIR / "progress.db")
+            _progress_store.migrate_json_log(STUDY_PROGRESS_DIR / "study_log.json")
+        return _progress_store
+
+
 def mark_notes_studied(filename: str, score: Optional[int] = None):
     """Mark notes as studied and save progress"""
     try:
-        progress_file = STUDY_PROGRESS_DIR / "study_log.json"
-        
-        # Load existing progress
-        if progress_file.exists():
-            with open(progress_file, 'r') as f:
-                progress = json.load(f)
-        else:
-            progress = {}
-        
-        # Update progress
-        if filename not in progress:
-            progress[filename] = {
-                "first_studied": datetime.now().isoformat(),
-                "sessions": []
-            }
-        
-        progress[filename]["sessions"].append({
-            "date": datetime.now().isoformat(),
-            "score": score
-        })
-        progress[filename]["last_studied"] = datetime.now().isoformat()
-        
-        # Save progress
-        with open(progress_file, 'w') as f:
-            json.dump(progress, f, indent=2)
-        
-        return True
+        return get_progress_store().record_session(filename, score)
     except Exception as e:
         print(f"Error saving study progress: {str(e)}")
         return False
 
 
 def get_study_progress() -> Dict:
-    """Get study progress for all notes"""
+    """Get study progress summaries for all notes"""
     try:
-        progress_file = STUDY_PROGRESS_DIR / "study_log.json"
-        
-        if progress_file.exists():
-            with open(progress_file, 'r') as f:
-                return json.load(f)
-        return {}
+        return get_progress_store().get_summaries()
     except Exception as e:
+        print(f"Error loading study progress: {str(e)}")
         return {}
+
+
+def get_study_sessions(filename: str, limit: int = 50) -> List[Dict]:
+    """Get the most recent study sessions of one file"""
+    try:
+        return get_progress_store().get_sessions(filename, limit)
+    except Exception as e:
+        print(f"Error loading study sessions: {str(e)}")
+        return []
+
+
+_flashcard_store = None
+
+
+def get_flashcard_store() -> FlashcardStore:
+    """Get the flashcard deck store"""
+    global _flashcard_store
+    with _progress_lock:
+        if _flashcard_store is None:
+            _flashcard_store = FlashcardStore(STUDY_PROGRESS_DIR / "flashcards.db")
+        return _flashcard_store
+
+
+def save_flashcards(deck_name: str, flashcards: List[Dict]) -> Optional[Dict]:
+    """Keep generated flashcards in the file's deck so they can be reviewed later"""
+    cards = [
+        c for c in flashcards
+        if isinstance(c, dict) and str(c.get('front', '')).strip() and str(c.get('back', '')).strip()
+        and not str(c.get('front', '')).startswith('Error')
+    ]
+    if not cards:
+        return None
+    try:
+        return get_flashcard_store().add_cards(deck_name, [{'front': str(c['front']), 'back': str(c['back'])} for c in cards])
+    except Exception as e:
+        print(f"Error saving flashcards: {str(e)}")
+        return None
+
+
+def get_due_flashcards(deck_name: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """Get flashcards due for review, most overdue first"""
+    try:
+        return get_flashcard_store().due_cards(deck_name, limit)
+    except Exception as e:
+        print(f"Error loading due flashcards: {str(e)}")
+        return []
+
+
+def review_flashcard(card_id: int, quality: int) -> Optional[Dict]:
+    """Record a flashcard review (quality 0-5) and reschedule the card"""
+    try:
+        return get_flashcard_store().review(card_id, quality)
+    except Exception as e:
+        print(f"Error recording flashcard review: {str(e)}")
+        return None
+
+
+def get_flashcard_decks() -> List[Dict]:
+    """Get flashcard decks with their card and due counts"""
+    try:
+        return get_flashcard_store().list_decks()
+    except Exception as e:
+        print(f"Error loading flashcard decks: {str(e)}")
+        return []
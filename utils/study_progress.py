@@ -0,0 +1,158 @@
+"""
+Study progress store
+Append-only log of study sessions with per-file aggregates kept up to date in the same transaction
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Weight of the newest score in the rolling (exponentially weighted) average
+ROLLING_ALPHA = 0.3
+RECENT_SCORES = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS study_sessions (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    studied_at TEXT NOT NULL,
+    score INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_file ON study_sessions (filename, id);
+
+CREATE TABLE IF NOT EXISTS study_stats (
+    filename TEXT PRIMARY KEY,
+    first_studied TEXT NOT NULL,
+    last_studied TEXT NOT NULL,
+    session_count INTEGER NOT NULL DEFAULT 0,
+    scored_sessions INTEGER NOT NULL DEFAULT 0,
+    score_total INTEGER NOT NULL DEFAULT 0,
+    rolling_average REAL,
+    recent_scores TEXT NOT NULL DEFAULT '[]'
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class StudyProgressStore:
+    """Study sessions in SQLite; each insert updates its file's summary atomically"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode so writes can open BEGIN IMMEDIATE themselves
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, filename: str, studied_at: str, score: Optional[int]):
+        """Append one session and fold it into the file's aggregates; call inside a transaction"""
+        conn.execute("INSERT INTO study_sessions (filename, studied_at, score) VALUES (?, ?, ?)",
+                      (filename, studied_at, score))
+
+        row = conn.execute("SELECT rolling_average, recent_scores FROM study_stats WHERE filename = ?",
+                           (filename,)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO study_stats (filename, first_studied, last_studied) VALUES (?, ?, ?)",
+                         (filename, studied_at, studied_at))
+            rolling, recent = None, []
+        else:
+            rolling, recent = row['rolling_average'], json.loads(row['recent_scores'])
+
+        if score is not None:
+            rolling = score if rolling is None else rolling + ROLLING_ALPHA * (score - rolling)
+            recent = (recent + [score])[-RECENT_SCORES:]
+
+        conn.execute(
+            "UPDATE study_stats SET last_studied = max(last_studied, ?), session_count = session_count + 1, "
+            "scored_sessions = scored_sessions + ?, score_total = score_total + ?, "
+            "rolling_average = ?, recent_scores = ? WHERE filename = ?",
+            (studied_at, 0 if score is None else 1, score or 0, rolling, json.dumps(recent), filename)
+        )
+
+    def record_session(self, filename: str, score: Optional[int] = None) -> bool:
+        """Record a study session; safe across threads and worker processes"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._apply(conn, filename, datetime.now().isoformat(), score)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def get_summaries(self) -> Dict[str, Dict]:
+        """Per-file summaries, read straight from the aggregates"""
+        summaries = {}
+        for row in self._conn().execute("SELECT * FROM study_stats ORDER BY last_studied DESC"):
+            summaries[row['filename']] = {
+                'first_studied': row['first_studied'],
+                'last_studied': row['last_studied'],
+                'session_count': row['session_count'],
+                'scored_sessions': row['scored_sessions'],
+                'average_score': round(row['score_total'] / row['scored_sessions'], 1) if row['scored_sessions'] else None,
+                'rolling_average': round(row['rolling_average'], 1) if row['rolling_average'] is not None else None,
+                'recent_scores': json.loads(row['recent_scores'])
+            }
+        return summaries
+
+    def get_sessions(self, filename: str, limit: int = 50) -> List[Dict]:
+        """Most recent sessions of one file, newest first"""
+        rows = self._conn().execute(
+            "SELECT studied_at, score FROM study_sessions WHERE filename = ? ORDER BY id DESC LIMIT ?",
+            (filename, limit)
+        ).fetchall()
+        return [{'date': r['studied_at'], 'score': r['score']} for r in rows]
+
+    def migrate_json_log(self, log_path: Path) -> int:
+        """One-time import of the legacy study_log.json"""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+
+        imported = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have imported it while this one waited for the lock
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            if Path(log_path).exists():
+                with open(log_path, 'r') as f:
+                    progress = json.load(f)
+                for filename, data in progress.items():
+                    for session in sorted(data.get('sessions', []), key=lambda s: s.get('date', '')):
+                        self._apply(conn, filename, session.get('date') or datetime.now().isoformat(),
+                                    session.get('score'))
+                        imported += 1
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if imported:
+            print(f"Migrated {imported} study sessions from {log_path} to {self.db_path}")
+        return imported
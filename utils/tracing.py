@@ -0,0 +1,279 @@
+"""
+Request tracing
+Per-request span trees with request IDs, kept in memory and exported as OTLP/JSON lines
+
+Each HTTP request opens a root span; every stage timed with metrics.stage_timer
+(retrieval, LLM calls, storage writes, ...) becomes a child span of it, so a
+slow turn can be broken down without extra instrumentation. Spans follow the
+request through a context variable and are finished by the thread that opened them.
+"""
+
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SERVICE_NAME = 'nexnote'
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ('name', 'trace', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error', '_token')
+
+    def __init__(self, name: str, trace: 'Trace', parent_id: Optional[str], attributes: Dict):
+        self.name = name
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start_ns / 1e9,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class Trace:
+    """All spans of one request"""
+
+    __slots__ = ('trace_id', 'request_id', 'spans', 'root')
+
+    def __init__(self, request_id: str):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.request_id = request_id
+        self.spans: List[Span] = []
+        self.root: Optional[Span] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'request_id': self.request_id,
+            'trace_id': self.trace_id,
+            'name': self.root.name if self.root else None,
+            'duration_ms': round(self.root.duration_ms, 3) if self.root else None,
+            'spans': [span.to_dict() for span in sorted(self.spans, key=lambda s: s.start_ns)],
+        }
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('nexnote_span', default=None)
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(traces: List[Trace]) -> Dict:
+    """Traces as an OTLP/JSON ExportTraceServiceRequest"""
+    spans = []
+    for trace in traces:
+        for span in trace.spans:
+            attributes = dict(span.attributes, **{'nexnote.request_id': trace.request_id})
+            spans.append({
+                'traceId': trace.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': 2 if span is trace.root else 1,  # SERVER for the request, INTERNAL below it
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns or span.start_ns),
+                'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in attributes.items()],
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 0},
+            })
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': 'nexnote.tracing'}, 'spans': spans}],
+    }]}
+
+
+class TraceExporter:
+    """Appends finished traces to a file as OTLP/JSON lines from a background thread"""
+
+    def __init__(self, path: Path, max_bytes: int = 50 * 1024 * 1024, batch_size: int = 64):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def submit(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            # Never let a slow disk back up into request handling
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._rotate_if_needed()
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(to_otlp(batch), separators=(',', ':')) + '\n')
+            except Exception as e:
+                print(f"Error exporting traces: {str(e)}")
+
+    def _rotate_if_needed(self):
+        if self.path.exists() and self.path.stat().st_size > self.max_bytes:
+            os.replace(self.path, self.path.with_name(self.path.name + '.1'))
+
+
+class Tracer:
+    """Opens and finishes request traces and keeps the most recent ones"""
+
+    def __init__(self, enabled: bool = True, exporter: Optional[TraceExporter] = None,
+                 min_export_ms: float = 0.0, keep: int = 200):
+        self.enabled = enabled
+        self.exporter = exporter
+        self.min_export_ms = min_export_ms
+        self._recent: deque = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def start_trace(self, name: str, request_id: Optional[str] = None, **attributes) -> Optional[Span]:
+        """Open the root span of a request and make it current"""
+        if not self.enabled:
+            return None
+        trace = Trace(request_id or new_request_id())
+        root = Span(name, trace, None, attributes)
+        trace.root = root
+        root._token = _current.set(root)
+        return root
+
+    def finish_trace(self, root: Optional[Span], error: Optional[BaseException] = None):
+        if root is None:
+            return
+        end_span(root, error)
+        trace = root.trace
+        with self._lock:
+            self._recent.append(trace)
+        if self.exporter is not None and root.duration_ms >= self.min_export_ms:
+            self.exporter.submit(trace)
+
+    def recent(self, min_ms: float = 0.0, limit: int = 20) -> List[Dict]:
+        """Most recent finished traces, slowest first"""
+        with self._lock:
+            traces = [t for t in self._recent if t.root and t.root.duration_ms >= min_ms]
+        traces.sort(key=lambda t: t.root.duration_ms, reverse=True)
+        return [t.to_dict() for t in traces[:limit]]
+
+    def find(self, request_id: str) -> Optional[Dict]:
+        with self._lock:
+            for trace in reversed(self._recent):
+                if trace.request_id == request_id:
+                    return trace.to_dict()
+        return None
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Open a child of the current span (a no-op outside a traced request)"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    span = Span(name, parent.trace, parent.span_id, attributes)
+    span._token = _current.set(span)
+    return span
+
+
+def end_span(span: Optional[Span], error: Optional[BaseException] = None):
+    if span is None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    span.trace.spans.append(span)
+    if span._token is not None:
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            # Ended in a different context (e.g. a generator closed elsewhere)
+            pass
+        span._token = None
+
+
+def record_span(name: str, seconds: float, **attributes):
+    """Add an already-finished child span that took `seconds` up to now"""
+    parent = _current.get()
+    if parent is None:
+        return
+    span = Span(name, parent.trace, parent.span_id, attributes)
+    span.end_ns = time.time_ns()
+    span.start_ns = span.end_ns - int(seconds * 1e9)
+    parent.trace.spans.append(span)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def clean_request_id(value: Optional[str]) -> Optional[str]:
+    """Accept a caller's X-Request-ID only if it is short and plain"""
+    if value and REQUEST_ID_PATTERN.match(value):
+        return value
+    return None
+
+
+def current_request_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace.request_id if span is not None else None
+
+
+def set_attributes(**attributes):
+    """Attach attributes to the current span, if any"""
+    span = _current.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Get the process-wide tracer, configured from the environment on first use"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            trace_file = os.getenv('TRACE_FILE', '').strip()
+            exporter = TraceExporter(Path(trace_file)) if trace_file else None
+            _tracer = Tracer(
+                enabled=os.getenv('TRACING_ENABLED', 'true').lower() == 'true',
+                exporter=exporter,
+                min_export_ms=float(os.getenv('TRACE_MIN_MS', '0')),
+                keep=int(os.getenv('TRACE_KEEP', '200')),
+            )
+        return _tracer